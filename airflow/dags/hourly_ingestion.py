@@ -1,8 +1,11 @@
 from airflow import DAG
 from airflow.providers.docker.operators.docker import DockerOperator
 from datetime import datetime, timedelta
+from docker.types import Mount
 import os
 
+INGESTION_SHARDS = int(os.getenv("INGESTION_SHARDS", "4"))
+
 default_args = {
         "retries": 1,
         "retry_delay": timedelta(minutes=5)
@@ -19,5 +22,17 @@ env_vars = {
         "API_KEY": os.environ["API_KEY"]
         }
 
+# Shards write their run summaries under DATA_DIR, so every container shares one volume there.
+data_mounts = [Mount(source="airq_data", target=os.environ["DATA_DIR"], type="volume")]
+
+# The run id stays the same across retries, so a retried shard only redoes the locations it did not finish.
+run_id = "{{ ts_nodash }}"
+
 with DAG(dag_id="hourly_ingestion", start_date=datetime(2023, 1, 1), schedule_interval="@hourly", catchup=False, default_args=default_args) as dag:
-    task = DockerOperator(task_id="run_hourly_ingestion", image="hourly_ingestion", command="python run.py", environment=env_vars, network_mode="bridge", auto_remove="never")
+    shards = DockerOperator.partial(task_id="run_hourly_ingestion", image="hourly_ingestion", environment=env_vars, mounts=data_mounts, network_mode="bridge", auto_remove="never").expand(
+            command=[f"airq ingest --mode stream --archive-raw --shard {index}/{INGESTION_SHARDS} --run-id {run_id}" for index in range(INGESTION_SHARDS)]
+            )
+
+    aggregate = DockerOperator(task_id="aggregate_shards", image="hourly_ingestion", command=f"airq ingest --aggregate-shards {INGESTION_SHARDS} --run-id {run_id}", environment=env_vars, mounts=data_mounts, network_mode="bridge", auto_remove="never", trigger_rule="all_done")
+
+    shards >> aggregate
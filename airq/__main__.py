@@ -0,0 +1,3 @@
+from airq.cli import main
+
+main()
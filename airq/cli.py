@@ -0,0 +1,84 @@
+import argparse
+import importlib
+import sys
+
+# Command, and target for grouped commands, to the module whose main() runs it with the remaining arguments.
+# Modules are only imported once their command runs, so listing commands never loads pandas, pyarrow or SQLAlchemy.
+COMMANDS = {
+        "fetch": {
+            "country": ("etl.ingestion.fetch_country", "Fetch a country from the OpenAQ API."),
+            "country-locations": ("etl.ingestion.fetch_country_locations", "List the locations of a country."),
+            "location": ("etl.ingestion.fetch_location", "Fetch a location."),
+            "location-latest": ("etl.ingestion.fetch_location_latest", "Fetch the latest measurements of a location."),
+            "location-sensors": ("etl.ingestion.fetch_location_sensors", "Fetch the sensors of a location."),
+            "parameters": ("etl.ingestion.fetch_parameters", "Fetch every parameter."),
+            "sensor-measurements": ("etl.ingestion.fetch_sensor_measurements", "Fetch historical measurements of a sensor."),
+            },
+        "transform": {
+            "country": ("etl.transform.transform_country", "Transform a raw country file to parquet."),
+            "location": ("etl.transform.transform_location", "Transform a raw location file to parquet."),
+            "location-latest": ("etl.transform.transform_location_latest", "Transform a raw latest measurements file to parquet."),
+            "location-sensors": ("etl.transform.transform_location_sensors", "Transform a raw sensors file to parquet."),
+            "parameters": ("etl.transform.transform_parameters", "Transform a raw parameters file to parquet."),
+            },
+        "load": {
+            "country": ("etl.load.load_country", "Load a clean country file into Postgres."),
+            "location": ("etl.load.load_location", "Load a clean location file into Postgres."),
+            "location-latest": ("etl.load.load_location_latest", "Load clean measurements, a measurements dataset or queued orphans into Postgres."),
+            "location-sensors": ("etl.load.load_location_sensors", "Load a clean sensors file into Postgres."),
+            "parameters": ("etl.load.load_parameters", "Load a clean parameters file into Postgres."),
+            },
+        "ingest": ("pipelines.run_hourly_ingestion.run", "Ingest the latest measurements of every location."),
+        "onboard": ("pipelines.onboard_country.run", "Add a country with all of its locations and sensors."),
+        "add-country": ("pipelines.add_new_country.run", "Add a country."),
+        "add-location": ("pipelines.add_new_location.run", "Add a location and its sensors."),
+        "add-location-sensors": ("pipelines.add_location_sensors.run", "Add the sensors of a location."),
+        "backfill": ("pipelines.backfill.run", "Backfill historical measurements over a date range."),
+        "export": ("pipelines.export_lakehouse.run", "Export measurements to the parquet lakehouse dataset."),
+        "db": {
+            "partitions": ("db.partitions", "Create upcoming and retire old measurements partitions."),
+            "rollups": ("db.rollups", "Rebuild the hourly and daily rollups."),
+            "spatial": ("db.spatial", "Query the spatial index of locations."),
+            },
+        }
+
+def _add_command(subparsers, name: str, module: str, help: str):
+    # The module parses its own arguments, including --help, so the command's parser only records what to run.
+    command = subparsers.add_parser(name, help=help, add_help=False)
+    command.set_defaults(module=module)
+
+def build_parser() -> argparse.ArgumentParser:
+    """
+    Builds the airq parser from COMMANDS, without importing any of the modules behind them.
+    """
+
+    parser = argparse.ArgumentParser(prog="airq", description="Air quality ingestion from the OpenAQ API. Run 'airq COMMAND --help' for a command's options.")
+    commands = parser.add_subparsers(dest="command", metavar="COMMAND", required=True)
+
+    for name, spec in COMMANDS.items():
+        if isinstance(spec, tuple):
+            _add_command(commands, name, *spec)
+            continue
+        group = commands.add_parser(name, help=f"{name.capitalize()} commands: {', '.join(spec)}.")
+        targets = group.add_subparsers(dest="target", metavar="TARGET", required=True)
+        for target, (module, help) in spec.items():
+            _add_command(targets, target, module, help)
+
+    return parser
+
+def main(argv: list[str] | None = None):
+    """
+    Entry point of the airq command. Imports the module of the chosen command and runs its main() with the remaining arguments.
+    """
+
+    argv = sys.argv[1:] if argv is None else argv
+    args, rest = build_parser().parse_known_args(argv)
+
+    prog = " ".join(["airq", args.command, *([args.target] if getattr(args, "target", None) else [])])
+    module = importlib.import_module(args.module)
+
+    sys.argv = [prog, *rest]
+    module.main()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+import argparse
+import json
+import os
+from pathlib import Path
+import re
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+# Cold starts to time, each in a fresh interpreter as the DockerOperator runs them.
+VARIANTS = {
+        "python": ["-c", "pass"],
+        "airq_help": ["-m", "airq", "--help"],
+        "airq_fetch_help": ["-m", "airq", "fetch", "--help"],
+        "airq_ingest_help": ["-m", "airq", "ingest", "--help"],
+        "legacy_ingest_help": ["-m", "pipelines.run_hourly_ingestion.run", "--help"],
+        }
+
+def time_command(args: list[str], repeat: int, env: dict) -> list[float]:
+    durations = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, *args], env=env, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        durations.append(time.perf_counter() - start)
+    return durations
+
+def slowest_imports(args: list[str], env: dict, top: int) -> list[dict]:
+    """
+    Runs a command once with -X importtime and returns its top-level imports with the largest cumulative time.
+    """
+
+    result = subprocess.run([sys.executable, "-X", "importtime", *args], env=env, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+
+    imports = []
+    for line in result.stderr.splitlines():
+        match = re.match(r"import time:\s+(\d+) \|\s+(\d+) \| (\s*)(\S+)", line)
+        # Only direct imports of the command, not the modules they pull in.
+        if match and not match.group(3):
+            imports.append({"module": match.group(4), "cumulative_ms": round(int(match.group(2)) / 1000, 1)})
+
+    return sorted(imports, key=lambda item: item["cumulative_ms"], reverse=True)[:top]
+
+def run_benchmark(repeat: int, top: int) -> dict:
+    """
+    Times the cold start of the airq command line against the legacy per-pipeline entry point.
+
+    Args:
+        repeat (int): Timed runs per variant. The median is reported.
+        top (int): Slowest imports to list per variant.
+
+    Returns:
+        results (dict): Median milliseconds and slowest imports for each variant.
+    """
+
+    env = dict(os.environ, PYTHONPATH=str(Path(__file__).resolve().parent.parent))
+    # etl modules read DATA_DIR at import time.
+    env.setdefault("DATA_DIR", tempfile.mkdtemp(prefix="airq-bench-"))
+
+    results = {"repeat": repeat, "variants": {}}
+    for name, args in VARIANTS.items():
+        time_command(args, 1, env)
+        median = statistics.median(time_command(args, repeat, env))
+        results["variants"][name] = {"median_ms": round(median * 1000, 1), "slowest_imports": slowest_imports(args, env, top)}
+
+    # Same command through both entry points, so the ratio only measures what the airq dispatcher adds or saves.
+    legacy = results["variants"]["legacy_ingest_help"]["median_ms"]
+    results["speedup_ingest_help"] = round(legacy / results["variants"]["airq_ingest_help"]["median_ms"], 2)
+
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the cold start of the airq command line.")
+    parser.add_argument("--repeat", type=int, default=10, help="Timed runs per variant.")
+    parser.add_argument("--top", type=int, default=5, help="Slowest imports to list per variant.")
+    parser.add_argument("--output", help="Write the results as json to this file.")
+    args = parser.parse_args()
+
+    results = run_benchmark(args.repeat, args.top)
+
+    print(json.dumps(results, indent=2))
+    if args.output:
+        Path(args.output).write_text(json.dumps(results, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+import argparse
+import json
+import logging
+import os
+from pathlib import Path
+import statistics
+import tempfile
+import time
+from benchmarks.synthetic import SyntheticNetwork
+
+def legacy_transform_location_latest_records(data: bytes):
+    """
+    The list-of-dicts to pandas transform that transform_location_latest_records replaced, kept as the baseline.
+    """
+
+    import pandas as pd
+
+    records = [
+            {
+                "datetime":r["datetime"]["utc"],
+                "sensor_id":r["sensorsId"],
+                "value":r["value"]
+            } for r in json.loads(data)["results"]]
+
+    return pd.DataFrame(records)
+
+def time_calls(func, repeat: int) -> list[float]:
+    durations = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        durations.append(time.perf_counter() - start)
+    return durations
+
+def run_benchmark(rows: int, repeat: int) -> dict:
+    """
+    Times the legacy and Arrow transforms of a locations/location_id/latest payload, in memory and through to parquet.
+
+    Args:
+        rows (int): Records in the synthetic payload.
+        repeat (int): Timed runs per variant. The median is reported.
+
+    Returns:
+        results (dict): Median milliseconds and rows per second for each variant.
+    """
+
+    import pyarrow.parquet as pq
+    from etl.transform.transform_location_latest import transform_location_latest_records
+
+    data = json.dumps(SyntheticNetwork(1, rows).location_latest(1)).encode("utf-8")
+    out_dir = Path(tempfile.mkdtemp(prefix="airq-bench-transform-"))
+
+    variants = {
+            "legacy_records": lambda: legacy_transform_location_latest_records(data),
+            "arrow_records": lambda: transform_location_latest_records(data),
+            "legacy_to_parquet": lambda: legacy_transform_location_latest_records(data).to_parquet(out_dir / "legacy.parquet", engine="pyarrow", index=False),
+            "arrow_to_parquet": lambda: pq.write_table(transform_location_latest_records(data), out_dir / "arrow.parquet"),
+            }
+
+    results = {"rows": rows, "payload_bytes": len(data), "variants": {}}
+    for name, func in variants.items():
+        func()
+        median = statistics.median(time_calls(func, repeat))
+        results["variants"][name] = {"median_ms": round(median * 1000, 2), "rows_per_s": round(rows / median)}
+
+    for stage in ("records", "to_parquet"):
+        legacy = results["variants"][f"legacy_{stage}"]["median_ms"]
+        arrow = results["variants"][f"arrow_{stage}"]["median_ms"]
+        results[f"speedup_{stage}"] = round(legacy / arrow, 2)
+
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the location_latest transform against the legacy pandas transform.")
+    parser.add_argument("--rows", type=int, default=100_000, help="Records in the synthetic payload.")
+    parser.add_argument("--repeat", type=int, default=5, help="Timed runs per variant.")
+    parser.add_argument("--output", help="Write the results as json to this file.")
+    args = parser.parse_args()
+
+    # etl modules read DATA_DIR at import time.
+    os.environ.setdefault("DATA_DIR", tempfile.mkdtemp(prefix="airq-bench-"))
+    logging.disable(logging.INFO)
+
+    results = run_benchmark(args.rows, args.repeat)
+
+    print(json.dumps(results, indent=2))
+    if args.output:
+        Path(args.output).write_text(json.dumps(results, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,166 @@
+import argparse
+import asyncio
+import json
+import logging
+import os
+from pathlib import Path
+import statistics
+import tempfile
+import time
+from benchmarks.stub_server import StubConfig, start_stub_server
+from benchmarks.synthetic import SyntheticNetwork, PARAMETERS
+
+def percentile(values: list[float], q: float) -> float:
+    if not values:
+        return float("nan")
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(q / 100 * (len(values) - 1))))]
+
+def seed_database(network: SyntheticNetwork):
+    """
+    Upserts the synthetic country, parameters, locations and sensors so measurements can be loaded against them.
+    """
+
+    import pandas as pd
+    from db.db import get_engine
+    from etl.load.upsert import upsert_dataframe
+
+    locations = pd.DataFrame([
+        {"id": location_id, "name": f"Location {location_id}", **network.coordinates(location_id), "country_id": network.country_id}
+        for location_id in network.location_ids
+        ])
+    sensors = pd.DataFrame([
+        {"id": sensor_id, "location_id": location_id, "parameter_id": network.parameter_for(sensor_id)[0]}
+        for location_id in network.location_ids for sensor_id in network.sensor_ids(location_id)
+        ])
+
+    with get_engine().begin() as conn:
+        upsert_dataframe(conn, pd.DataFrame([{"id": network.country_id, "name": f"Country {network.country_id}"}]), "countries")
+        upsert_dataframe(conn, pd.DataFrame([{"id": p[0], "units": p[2], "name": p[3], "description": p[3]} for p in PARAMETERS]), "parameters")
+        upsert_dataframe(conn, locations, "locations")
+        upsert_dataframe(conn, sensors, "sensors")
+
+def run_benchmark(network: SyntheticNetwork, concurrency: int, mode: str, load: bool, batch_size: int) -> dict:
+    """
+    Times the fetch, transform and load stages of hourly ingestion separately against the stub server.
+
+    Args:
+        network (SyntheticNetwork): Locations to ingest.
+        concurrency (int): Maximum number of requests in flight.
+        mode (str): 'stream' for the in-memory path, 'files' for the raw json and parquet file path.
+        load (bool): Also time loading into the configured database.
+        batch_size (int): Locations per load in 'stream' mode.
+
+    Returns:
+        results (dict): Stage durations, locations per second and per-location fetch latency percentiles.
+    """
+
+    import pyarrow as pa
+    from etl.ingestion.fetch_many import fetch_concurrently
+    from etl.ingestion.fetch_location_latest import fetch_location_latest, fetch_location_latest_data
+    from etl.transform.transform_location_latest import transform_location_latest, transform_location_latest_records
+
+    fetch = fetch_location_latest_data if mode == "stream" else fetch_location_latest
+    latencies = []
+
+    def timed_fetch(location_id):
+        start = time.perf_counter()
+        try:
+            return fetch(location_id)
+        finally:
+            latencies.append(time.perf_counter() - start)
+
+    async def fetch_all():
+        return {key: result async for key, result in fetch_concurrently(timed_fetch, network.location_ids, concurrency)}
+
+    stages = {}
+
+    start = time.perf_counter()
+    fetched = asyncio.run(fetch_all())
+    stages["fetch"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    if mode == "stream":
+        transformed = {location_id: transform_location_latest_records(data) for location_id, data in fetched.items()}
+    else:
+        transformed = {location_id: transform_location_latest(filepath) for location_id, filepath in fetched.items()}
+    stages["transform"] = time.perf_counter() - start
+
+    rows = sum(len(df) for df in transformed.values()) if mode == "stream" else None
+
+    if load:
+        from db.db import get_db
+        from etl.load.load_location_latest import load_location_latest, load_measurements
+
+        db = next(get_db())
+        try:
+            start = time.perf_counter()
+            if mode == "stream":
+                frames = list(transformed.values())
+                for i in range(0, len(frames), batch_size):
+                    load_measurements(pa.concat_tables(frames[i:i + batch_size]), db)
+            else:
+                for clean_filepath in transformed.values():
+                    load_location_latest(clean_filepath, db)
+            stages["load"] = time.perf_counter() - start
+        finally:
+            db.close()
+
+    total = sum(stages.values())
+
+    return {
+            "mode": mode,
+            "locations": network.n_locations,
+            "sensors_per_location": network.sensors_per_location,
+            "concurrency": concurrency,
+            "fetched_locations": len(fetched),
+            "rows": rows,
+            "stages_s": {stage: round(duration, 4) for stage, duration in stages.items()},
+            "total_s": round(total, 4),
+            "locations_per_s": round(len(fetched) / total, 2) if total else None,
+            "fetch_latency_ms": {
+                "p50": round(percentile(latencies, 50) * 1000, 2),
+                "p99": round(percentile(latencies, 99) * 1000, 2),
+                "mean": round(statistics.fmean(latencies) * 1000, 2) if latencies else None,
+                },
+            }
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark hourly ingestion against a local OpenAQ stub server.")
+    parser.add_argument("--locations", type=int, default=1000, help="Number of synthetic locations.")
+    parser.add_argument("--sensors", type=int, default=4, help="Sensors per location.")
+    parser.add_argument("--concurrency", type=int, default=16, help="Maximum number of requests in flight.")
+    parser.add_argument("--mode", choices=["stream", "files"], default="stream")
+    parser.add_argument("--batch-size", type=int, default=200, help="Locations per load in stream mode.")
+    parser.add_argument("--latency-ms", type=float, default=50, help="Mean stub response latency.")
+    parser.add_argument("--jitter-ms", type=float, default=20, help="Standard deviation of stub response latency.")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of stub responses that are 503.")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="Fraction of stub responses that are 429.")
+    parser.add_argument("--load", action="store_true", help="Seed and load into the database configured by DB_* env vars.")
+    parser.add_argument("--output", help="Write the results as json to this file.")
+    args = parser.parse_args()
+
+    network = SyntheticNetwork(args.locations, args.sensors)
+    config = StubConfig(args.latency_ms, args.jitter_ms, args.error_rate, args.throttle_rate)
+    server = start_stub_server(network, config)
+
+    # etl modules read their configuration at import time, so point them at the stub before importing them.
+    os.environ["OPENAQ_API_BASE"] = f"http://127.0.0.1:{server.server_port}"
+    os.environ.setdefault("API_KEY", "benchmark")
+    os.environ.setdefault("DATA_DIR", tempfile.mkdtemp(prefix="airq-bench-"))
+    os.environ["OPENAQ_RATE_LIMIT_PER_MINUTE"] = "1000000"
+    os.environ["OPENAQ_POOL_SIZE"] = str(args.concurrency)
+    logging.disable(logging.INFO)
+
+    if args.load:
+        seed_database(network)
+
+    results = run_benchmark(network, args.concurrency, args.mode, args.load, args.batch_size)
+    server.shutdown()
+
+    print(json.dumps(results, indent=2))
+    if args.output:
+        Path(args.output).write_text(json.dumps(results, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+import argparse
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import random
+import re
+import threading
+import time
+from urllib.parse import parse_qs
+from benchmarks.synthetic import SyntheticNetwork
+
+ROUTES = [
+        (re.compile(r"^/countries/(\d+)$"), "country"),
+        (re.compile(r"^/locations$"), "locations"),
+        (re.compile(r"^/locations/(\d+)$"), "location"),
+        (re.compile(r"^/locations/(\d+)/sensors$"), "location_sensors"),
+        (re.compile(r"^/locations/(\d+)/latest$"), "location_latest"),
+        (re.compile(r"^/parameters$"), "parameters"),
+        (re.compile(r"^/sensors/(\d+)/measurements$"), "sensor_measurements"),
+        ]
+
+class StubConfig:
+    """
+    Behaviour of the stub OpenAQ server. Rates are probabilities per request.
+    """
+
+    def __init__(self, latency_ms: float = 50, jitter_ms: float = 20, error_rate: float = 0.0, throttle_rate: float = 0.0, rate_limit: int = 1_000_000):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.rate_limit = rate_limit
+
+def make_handler(network: SyntheticNetwork, config: StubConfig):
+
+    class StubHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def _send(self, status: int, body: dict, headers: dict | None = None):
+            payload = json.dumps(body).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.send_header("x-ratelimit-limit", str(config.rate_limit))
+            self.send_header("x-ratelimit-remaining", str(config.rate_limit))
+            self.send_header("x-ratelimit-reset", "60")
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def do_GET(self):
+            time.sleep(max(0, random.gauss(config.latency_ms, config.jitter_ms)) / 1000)
+
+            if random.random() < config.throttle_rate:
+                return self._send(429, {"detail": "Too many requests"}, {"Retry-After": "1"})
+            if random.random() < config.error_rate:
+                return self._send(503, {"detail": "Service unavailable"})
+
+            path, _, query = self.path.partition("?")
+            for pattern, route in ROUTES:
+                match = pattern.match(path)
+                if match:
+                    args = [int(group) for group in match.groups()]
+                    if route == "locations":
+                        params = {name: int(values[0]) for name, values in parse_qs(query).items() if name in ("countries_id", "page", "limit")}
+                        return self._send(200, network.locations(**params))
+                    if route == "sensor_measurements":
+                        query_params = {name: values[0] for name, values in parse_qs(query).items()}
+                        return self._send(200, network.sensor_measurements(
+                            *args,
+                            datetime_from=datetime.fromisoformat(query_params["datetime_from"]),
+                            datetime_to=datetime.fromisoformat(query_params["datetime_to"]),
+                            page=int(query_params.get("page", 1)),
+                            limit=int(query_params.get("limit", 100)),
+                            ))
+                    return self._send(200, getattr(network, route)(*args))
+
+            self._send(404, {"detail": "Not found"})
+
+        def log_message(self, format, *args):
+            pass
+
+    return StubHandler
+
+def start_stub_server(network: SyntheticNetwork, config: StubConfig, host: str = "127.0.0.1", port: int = 0) -> ThreadingHTTPServer:
+    """
+    Starts the stub OpenAQ server on a daemon thread.
+
+    Args:
+        network (SyntheticNetwork): Source of the payloads served.
+        config (StubConfig): Latency, error and throttling behaviour.
+        host (str): Interface to bind.
+        port (int): Port to bind. 0 picks a free port.
+
+    Returns:
+        server (ThreadingHTTPServer): Running server. Its base url is http://{host}:{server.server_port}.
+    """
+
+    server = ThreadingHTTPServer((host, port), make_handler(network, config))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    return server
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve synthetic OpenAQ responses for benchmarks.")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--locations", type=int, default=1000, help="Number of synthetic locations.")
+    parser.add_argument("--sensors", type=int, default=4, help="Sensors per location.")
+    parser.add_argument("--latency-ms", type=float, default=50, help="Mean response latency.")
+    parser.add_argument("--jitter-ms", type=float, default=20, help="Standard deviation of response latency.")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests answered with 503.")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="Fraction of requests answered with 429.")
+    args = parser.parse_args()
+
+    network = SyntheticNetwork(args.locations, args.sensors)
+    config = StubConfig(args.latency_ms, args.jitter_ms, args.error_rate, args.throttle_rate)
+    server = ThreadingHTTPServer(("127.0.0.1", args.port), make_handler(network, config))
+    print(f"Serving {args.locations} synthetic locations on http://127.0.0.1:{args.port}")
+    server.serve_forever()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+from datetime import datetime, timedelta, timezone
+import random
+
+PARAMETERS = [
+        (1, "pm10", "µg/m³", "PM10"),
+        (2, "pm25", "µg/m³", "PM2.5"),
+        (3, "o3", "ppm", "O₃"),
+        (4, "co", "ppm", "CO"),
+        (5, "no2", "ppm", "NO₂"),
+        (6, "so2", "ppm", "SO₂"),
+        ]
+
+class SyntheticNetwork:
+    """
+    Deterministic fake OpenAQ network of N locations with M sensors each, for benchmarks.
+
+    Location ids run from 1 to n_locations, and sensor ids are location_id * 1000 + sensor index. Payloads
+    mirror the shape of the OpenAQ v3 responses our fetchers and transforms consume.
+    """
+
+    def __init__(self, n_locations: int = 1000, sensors_per_location: int = 4, country_id: int = 1, seed: int = 0):
+        self.n_locations = n_locations
+        self.sensors_per_location = sensors_per_location
+        self.country_id = country_id
+        self.seed = seed
+
+    @property
+    def location_ids(self) -> list[int]:
+        return list(range(1, self.n_locations + 1))
+
+    def sensor_ids(self, location_id: int) -> list[int]:
+        return [location_id * 1000 + i for i in range(self.sensors_per_location)]
+
+    def parameter_for(self, sensor_id: int) -> tuple:
+        return PARAMETERS[(sensor_id % 1000) % len(PARAMETERS)]
+
+    def coordinates(self, location_id: int) -> dict:
+        rng = random.Random(self.seed * 1_000_003 + location_id)
+        return {"latitude": rng.uniform(-60, 70), "longitude": rng.uniform(-180, 180)}
+
+    def country(self, country_id: int) -> dict:
+        return {"results": [{"id": country_id, "code": f"C{country_id}", "name": f"Country {country_id}"}]}
+
+    def location(self, location_id: int) -> dict:
+        return {"results": [{
+            "id": location_id,
+            "name": f"Location {location_id}",
+            "coordinates": self.coordinates(location_id),
+            "country": {"id": self.country_id, "code": f"C{self.country_id}", "name": f"Country {self.country_id}"},
+            }]}
+
+    def locations(self, countries_id: int, page: int = 1, limit: int = 100) -> dict:
+        location_ids = self.location_ids if countries_id == self.country_id else []
+        page_ids = location_ids[(page - 1) * limit:page * limit]
+        return {
+                "meta": {"name": "openaq-api", "page": page, "limit": limit, "found": len(location_ids)},
+                "results": [self.location(location_id)["results"][0] for location_id in page_ids],
+                }
+
+    def location_sensors(self, location_id: int) -> dict:
+        results = []
+        for sensor_id in self.sensor_ids(location_id):
+            parameter_id, name, units, display_name = self.parameter_for(sensor_id)
+            results.append({
+                "id": sensor_id,
+                "name": f"{name} {units}",
+                "parameter": {"id": parameter_id, "name": name, "units": units, "displayName": display_name},
+                })
+        return {"results": results}
+
+    def location_latest(self, location_id: int, now: datetime | None = None) -> dict:
+        now = (now or datetime.now(timezone.utc)).replace(minute=0, second=0, microsecond=0)
+        rng = random.Random(self.seed * 1_000_003 + location_id + int(now.timestamp()))
+        results = []
+        for sensor_id in self.sensor_ids(location_id):
+            results.append({
+                "datetime": {"utc": now.strftime("%Y-%m-%dT%H:%M:%SZ"), "local": now.isoformat()},
+                "value": round(rng.uniform(0, 150), 2),
+                "coordinates": self.coordinates(location_id),
+                "sensorsId": sensor_id,
+                "locationsId": location_id,
+                })
+        return {"results": results}
+
+    def sensor_measurements(self, sensor_id: int, datetime_from: datetime, datetime_to: datetime, page: int = 1, limit: int = 100) -> dict:
+        start = datetime_from.replace(minute=0, second=0, microsecond=0)
+        if start < datetime_from:
+            start += timedelta(hours=1)
+        hours = max(0, int((datetime_to - start).total_seconds() // 3600))
+        page_hours = range((page - 1) * limit, min(page * limit, hours))
+        results = []
+        for hour in page_hours:
+            period_from = start + timedelta(hours=hour)
+            period_to = period_from + timedelta(hours=1)
+            rng = random.Random(self.seed * 1_000_003 + sensor_id + int(period_from.timestamp()))
+            results.append({
+                "value": round(rng.uniform(0, 150), 2),
+                "period": {
+                    "label": "1hour",
+                    "interval": "01:00:00",
+                    "datetimeFrom": {"utc": period_from.strftime("%Y-%m-%dT%H:%M:%SZ"), "local": period_from.isoformat()},
+                    "datetimeTo": {"utc": period_to.strftime("%Y-%m-%dT%H:%M:%SZ"), "local": period_to.isoformat()},
+                    },
+                })
+        return {"meta": {"name": "openaq-api", "page": page, "limit": limit, "found": hours}, "results": results}
+
+    def parameters(self) -> dict:
+        return {"results": [
+            {"id": parameter_id, "name": name, "units": units, "displayName": display_name, "description": f"{display_name} mass concentration"}
+            for parameter_id, name, units, display_name in PARAMETERS
+            ]}
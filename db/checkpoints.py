@@ -0,0 +1,312 @@
+from __future__ import annotations
+from datetime import datetime, timedelta
+import logging
+from typing import TYPE_CHECKING, Iterable
+
+if TYPE_CHECKING:
+    from sqlalchemy import Connection
+
+PENDING = "pending"
+DONE = "done"
+FAILED = "failed"
+# The location returned no measurements, e.g. an offline station.
+EMPTY = "empty"
+# The location was given up on for the run, e.g. a retired station answering 404, or one out of attempts.
+SKIPPED = "skipped"
+# Statuses that count as finished, so retries leave the location alone and the run can succeed.
+FINISHED = (DONE, EMPTY, SKIPPED)
+
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+INCOMPLETE = "incomplete"
+
+def _in_shard(location_id, shard: str):
+    shard_index, shard_count = (int(part) for part in shard.split("/"))
+    return location_id % shard_count == shard_index
+
+def run_exists(conn: Connection, run_id: str, shard: str) -> bool:
+    """
+    Checks whether a run, or a shard of it, has a checkpoint.
+
+    Args:
+        conn (Connection): SQLAlchemy connection to the airq database.
+        run_id (str): Identifier of the run.
+        shard (str): Shard spec of the run, e.g. '0/4'. Unsharded runs are shard '0/1'.
+    """
+
+    from sqlalchemy import select
+    from db import models
+
+    table = models.IngestionRun
+    return conn.scalar(select(table.run_id).where(table.run_id == run_id, table.shard == shard)) is not None
+
+def start_run(conn: Connection, run_id: str, shard: str, mode: str, location_ids: Iterable[int]) -> list[int]:
+    """
+    Records the start of a run, or of another attempt of it, and returns the locations it still has to ingest.
+
+    Locations are registered as pending the first time they are seen for the run. On a retry, locations that are
+    already finished are left out, while failed, pending and newly added locations are returned. Every location
+    returned has its attempts counted, see finish_run.
+
+    Args:
+        conn (Connection): SQLAlchemy connection to the airq database.
+        run_id (str): Identifier of the run.
+        shard (str): Shard spec of the run, e.g. '0/4'. Unsharded runs are shard '0/1'.
+        mode (str): Ingestion mode of the run.
+        location_ids (Iterable[int]): Locations the run is responsible for.
+
+    Returns:
+        location_ids (list[int]): Locations that are not finished yet, in ascending order.
+    """
+
+    from sqlalchemy import select, update
+    from sqlalchemy.dialects.postgresql import insert
+    from db import models
+
+    now = datetime.utcnow()
+
+    runs = models.IngestionRun.__table__
+    stmt = insert(runs).values(run_id=run_id, shard=shard, mode=mode, status=RUNNING, attempts=1, started_at=now)
+    stmt = stmt.on_conflict_do_update(
+            index_elements=[runs.c.run_id, runs.c.shard],
+            set_={"status": RUNNING, "mode": stmt.excluded.mode, "attempts": runs.c.attempts + 1, "finished_at": None}
+            )
+    conn.execute(stmt)
+
+    location_ids = sorted({int(location_id) for location_id in location_ids})
+    locations = models.IngestionRunLocation.__table__
+    if location_ids:
+        stmt = insert(locations).values([
+            {"run_id": run_id, "location_id": location_id, "status": PENDING, "updated_at": now} for location_id in location_ids
+            ])
+        conn.execute(stmt.on_conflict_do_nothing(index_elements=[locations.c.run_id, locations.c.location_id]))
+
+    finished = set(conn.scalars(
+            select(locations.c.location_id).where(locations.c.run_id == run_id, locations.c.status.in_(FINISHED), locations.c.location_id.in_(location_ids))
+            )) if location_ids else set()
+    remaining_ids = [location_id for location_id in location_ids if location_id not in finished]
+
+    if remaining_ids:
+        conn.execute(
+                update(locations)
+                .where(locations.c.run_id == run_id, locations.c.location_id.in_(remaining_ids))
+                .values(attempts=locations.c.attempts + 1)
+                )
+
+    return remaining_ids
+
+def pending_locations(conn: Connection, run_id: str, shard: str) -> list[int]:
+    """
+    Returns the locations of a run, or of a shard of it, that are not finished yet.
+
+    Args:
+        conn (Connection): SQLAlchemy connection to the airq database.
+        run_id (str): Identifier of the run.
+        shard (str): Shard spec of the run, e.g. '0/4'. Unsharded runs are shard '0/1'.
+
+    Returns:
+        location_ids (list[int]): Pending and failed locations of the run, in ascending order.
+    """
+
+    from sqlalchemy import select
+    from db import models
+
+    table = models.IngestionRunLocation
+    return list(conn.scalars(
+            select(table.location_id)
+            .where(table.run_id == run_id, table.status.not_in(FINISHED), _in_shard(table.location_id, shard))
+            .order_by(table.location_id)
+            ))
+
+def mark_locations(conn: Connection, run_id: str, location_ids: Iterable[int], status: str):
+    """
+    Sets the status of locations of a run, e.g. to 'done' once their measurements are loaded.
+
+    Args:
+        conn (Connection): SQLAlchemy connection to the airq database.
+        run_id (str): Identifier of the run.
+        location_ids (Iterable[int]): Locations to update.
+        status (str): One of PENDING, DONE, FAILED, EMPTY or SKIPPED.
+    """
+
+    from sqlalchemy import update
+    from db import models
+
+    location_ids = [int(location_id) for location_id in location_ids]
+    if not location_ids:
+        return
+
+    table = models.IngestionRunLocation
+    conn.execute(
+            update(table)
+            .where(table.run_id == run_id, table.location_id.in_(location_ids))
+            .values(status=status, updated_at=datetime.utcnow())
+            )
+
+def finish_run(conn: Connection, run_id: str, shard: str, max_attempts: int | None = None) -> str:
+    """
+    Records the end of an attempt of a run. The run succeeded if every one of its locations is finished.
+
+    Args:
+        conn (Connection): SQLAlchemy connection to the airq database.
+        run_id (str): Identifier of the run.
+        shard (str): Shard spec of the run, e.g. '0/4'.
+        max_attempts (int | None): Mark locations still unfinished after this many attempts as skipped, so one
+            location that keeps failing cannot keep the run incomplete. None retries them for as long as the run is.
+
+    Returns:
+        status (str): SUCCEEDED, or INCOMPLETE if locations are left for a retry.
+    """
+
+    from sqlalchemy import func, select, update
+    from db import models
+
+    locations = models.IngestionRunLocation
+    unfinished = (locations.run_id == run_id, locations.status.not_in(FINISHED), _in_shard(locations.location_id, shard))
+
+    if max_attempts is not None:
+        skipped = conn.execute(
+                update(locations)
+                .where(*unfinished, locations.attempts >= max_attempts)
+                .values(status=SKIPPED, updated_at=datetime.utcnow())
+                ).rowcount
+        if skipped:
+            logging.warning(f"Skipped {skipped} locations of run {run_id} that are unfinished after {max_attempts} attempts.")
+
+    remaining = conn.scalar(select(func.count()).where(*unfinished))
+    status = SUCCEEDED if remaining == 0 else INCOMPLETE
+
+    runs = models.IngestionRun
+    conn.execute(
+            update(runs)
+            .where(runs.run_id == run_id, runs.shard == shard)
+            .values(status=status, finished_at=datetime.utcnow())
+            )
+
+    return status
+
+def prune_runs(conn: Connection, retention_days: float) -> int:
+    """
+    Deletes the checkpoints of runs that succeeded, in every shard, and started more than retention_days ago.
+
+    Hourly runs add a row per location to ingestion_run_locations, so without pruning the table grows by the
+    number of locations every hour. Incomplete runs are kept, so they can still be inspected or resumed.
+
+    Args:
+        conn (Connection): SQLAlchemy connection to the airq database.
+        retention_days (float): Age in days after which the checkpoints of succeeded runs are deleted.
+
+    Returns:
+        pruned (int): Number of runs deleted.
+    """
+
+    from sqlalchemy import delete, func, select
+    from db import models
+
+    runs = models.IngestionRun
+    old_runs = (
+            select(runs.run_id)
+            .group_by(runs.run_id)
+            .having(func.bool_and(runs.status == SUCCEEDED), func.max(runs.started_at) < datetime.utcnow() - timedelta(days=retention_days))
+            )
+    run_ids = list(conn.scalars(old_runs))
+    if not run_ids:
+        return 0
+
+    locations = models.IngestionRunLocation
+    conn.execute(delete(locations).where(locations.run_id.in_(run_ids)))
+    conn.execute(delete(runs).where(runs.run_id.in_(run_ids)))
+
+    return len(run_ids)
+
+def register_chunks(conn: Connection, backfill_id: str, chunks: Iterable[tuple[int, datetime, datetime]], batch_size: int = 10_000):
+    """
+    Records the chunks of a backfill as pending. Chunks already recorded keep their status.
+
+    Args:
+        conn (Connection): SQLAlchemy connection to the airq database.
+        backfill_id (str): Identifier of the backfill.
+        chunks (Iterable[tuple[int, datetime, datetime]]): (sensor_id, datetime_from, datetime_to) of every chunk.
+        batch_size (int): Chunks per insert statement.
+    """
+
+    from sqlalchemy.dialects.postgresql import insert
+    from db import models
+
+    now = datetime.utcnow()
+    table = models.BackfillChunk.__table__
+    rows = [
+            {"backfill_id": backfill_id, "sensor_id": int(sensor_id), "datetime_from": datetime_from, "datetime_to": datetime_to, "status": PENDING, "updated_at": now}
+            for sensor_id, datetime_from, datetime_to in chunks
+            ]
+
+    for start in range(0, len(rows), batch_size):
+        stmt = insert(table).values(rows[start:start + batch_size])
+        conn.execute(stmt.on_conflict_do_nothing(index_elements=[table.c.backfill_id, table.c.sensor_id, table.c.datetime_from]))
+
+def pending_chunks(conn: Connection, backfill_id: str) -> list[tuple[int, datetime, datetime]]:
+    """
+    Returns the chunks of a backfill that are not done yet.
+
+    Args:
+        conn (Connection): SQLAlchemy connection to the airq database.
+        backfill_id (str): Identifier of the backfill.
+
+    Returns:
+        chunks (list[tuple[int, datetime, datetime]]): (sensor_id, datetime_from, datetime_to) of pending and failed chunks, oldest first.
+    """
+
+    from sqlalchemy import select
+    from db import models
+
+    table = models.BackfillChunk
+    rows = conn.execute(
+            select(table.sensor_id, table.datetime_from, table.datetime_to)
+            .where(table.backfill_id == backfill_id, table.status != DONE)
+            .order_by(table.datetime_from, table.sensor_id)
+            )
+
+    return [tuple(row) for row in rows]
+
+def mark_chunk(conn: Connection, backfill_id: str, sensor_id: int, datetime_from: datetime, status: str, rows_loaded: int | None = None):
+    """
+    Sets the status of one chunk of a backfill, e.g. to 'done' once its measurements are loaded.
+
+    Args:
+        conn (Connection): SQLAlchemy connection to the airq database.
+        backfill_id (str): Identifier of the backfill.
+        sensor_id (int): Sensor of the chunk.
+        datetime_from (datetime): Start of the chunk.
+        status (str): One of PENDING, DONE or FAILED.
+        rows_loaded (int | None): New measurements written for the chunk.
+    """
+
+    from sqlalchemy import update
+    from db import models
+
+    table = models.BackfillChunk
+    conn.execute(
+            update(table)
+            .where(table.backfill_id == backfill_id, table.sensor_id == int(sensor_id), table.datetime_from == datetime_from)
+            .values(status=status, rows_loaded=rows_loaded, updated_at=datetime.utcnow())
+            )
+
+def chunk_counts(conn: Connection, backfill_id: str) -> dict[str, int]:
+    """
+    Counts the chunks of a backfill by status.
+
+    Args:
+        conn (Connection): SQLAlchemy connection to the airq database.
+        backfill_id (str): Identifier of the backfill.
+
+    Returns:
+        counts (dict[str, int]): Mapping of status to number of chunks.
+    """
+
+    from sqlalchemy import func, select
+    from db import models
+
+    table = models.BackfillChunk
+    rows = conn.execute(select(table.status, func.count()).where(table.backfill_id == backfill_id).group_by(table.status))
+
+    return {status: count for status, count in rows}
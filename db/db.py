@@ -1,20 +1,47 @@
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
+from __future__ import annotations
 import os
-from dotenv import load_dotenv
+import threading
+from typing import TYPE_CHECKING
+from etl.config import load_env
 
-load_dotenv()
+if TYPE_CHECKING:
+    from sqlalchemy import Engine
+
+load_env()
 
 DB_USER = os.getenv("DB_USER")
 DB_NAME = os.getenv("DB_NAME")
 DB_PORT = os.getenv("DB_PORT")
 DB_HOST = os.getenv("DB_HOST")
 DB_PASSWORD = os.getenv("DB_PASSWORD")
+# Connections kept open by the pool, and extra ones opened under load. Concurrent loaders and shards each hold one.
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
 
 DB_URL = f"postgresql+psycopg2://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
 
-engine = create_engine(DB_URL)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+_engine = None
+_engine_lock = threading.Lock()
+
+def get_engine() -> Engine:
+    """
+    Returns the process-wide SQLAlchemy engine, creating it on first use.
+
+    The engine is not built at import, so commands that never reach the database, e.g. `airq ingest --help`,
+    need no DB_* settings and never load SQLAlchemy.
+
+    Returns:
+        engine (Engine): Pooled engine connected to the airq database.
+    """
+
+    from sqlalchemy import create_engine
+
+    global _engine
+
+    with _engine_lock:
+        if _engine is None:
+            _engine = create_engine(DB_URL, pool_size=DB_POOL_SIZE, max_overflow=DB_MAX_OVERFLOW)
+        return _engine
 
 def get_db():
     """
@@ -24,7 +51,9 @@ def get_db():
         Session: SQL Alchemy session connected to airq database.
     """
 
-    db = SessionLocal()
+    from sqlalchemy.orm import Session
+
+    db = Session(bind=get_engine(), autoflush=False)
     try:
         yield db
     finally:
@@ -0,0 +1,158 @@
+from __future__ import annotations
+import logging
+import os
+import threading
+import time
+from typing import TYPE_CHECKING
+from etl.config import load_env
+
+if TYPE_CHECKING:
+    import pyarrow as pa
+    from sqlalchemy import Engine
+
+load_env()
+
+DIMENSION_CACHE_TTL = float(os.getenv("DIMENSION_CACHE_TTL", "900"))
+# Seconds a sensor id still unknown after an on-demand refresh is trusted to be missing, so it does not trigger another.
+DIMENSION_MISS_TTL = float(os.getenv("DIMENSION_MISS_TTL", "300"))
+
+class DimensionCache:
+    """
+    In-process cache of the id projections of the locations, sensors and parameters tables.
+
+    Only ids are loaded, one query per table, instead of full ORM objects. The cache reloads itself on
+    first use after `ttl` seconds, and can be refreshed on demand, e.g. when a batch references a sensor
+    it does not know yet. Sensors still unknown after an on-demand refresh, e.g. readings of sensors onboarding
+    skipped, are remembered as missing for `miss_ttl` seconds so they do not refresh the cache on every batch.
+    """
+
+    def __init__(self, engine: Engine, ttl: float = DIMENSION_CACHE_TTL, miss_ttl: float = DIMENSION_MISS_TTL):
+        import pyarrow as pa
+
+        self.engine = engine
+        self.ttl = ttl
+        self.miss_ttl = miss_ttl
+        self.lock = threading.Lock()
+        self.loaded_at = None
+        self._location_ids = []
+        self._location_sensors = {}
+        self._sensor_parameters = {}
+        self._sensor_ids = pa.array([], pa.int64())
+        self._missing_sensors = {}
+
+    def refresh(self):
+        """
+        Reloads every projection from the database.
+        """
+
+        import pyarrow as pa
+        from sqlalchemy import select
+        from db import models
+
+        start = time.perf_counter()
+
+        with self.engine.connect() as conn:
+            location_ids = sorted(conn.scalars(select(models.Location.id)))
+            sensors = conn.execute(select(models.Sensor.id, models.Sensor.location_id, models.Sensor.parameter_id)).all()
+
+        location_sensors = {}
+        sensor_parameters = {}
+        for sensor_id, location_id, parameter_id in sensors:
+            location_sensors.setdefault(location_id, set()).add(sensor_id)
+            sensor_parameters[sensor_id] = parameter_id
+
+        with self.lock:
+            self._location_ids = location_ids
+            self._location_sensors = {location_id: frozenset(sensor_ids) for location_id, sensor_ids in location_sensors.items()}
+            self._sensor_parameters = sensor_parameters
+            self._sensor_ids = pa.array(sorted(sensor_parameters), pa.int64())
+            self.loaded_at = time.monotonic()
+
+        logging.info(f"Loaded {len(location_ids)} locations and {len(sensor_parameters)} sensors into the dimension cache in {time.perf_counter() - start:.2f}s.")
+
+    def invalidate(self):
+        """
+        Marks the cache stale so the next lookup reloads it.
+        """
+
+        with self.lock:
+            self.loaded_at = None
+
+    def _ensure_fresh(self):
+        if self.loaded_at is None or time.monotonic() - self.loaded_at > self.ttl:
+            self.refresh()
+
+    @property
+    def location_ids(self) -> list[int]:
+        self._ensure_fresh()
+        return list(self._location_ids)
+
+    def sensors_for(self, location_id: int) -> frozenset[int]:
+        self._ensure_fresh()
+        return self._location_sensors.get(int(location_id), frozenset())
+
+    def parameter_for(self, sensor_id: int) -> int | None:
+        self._ensure_fresh()
+        return self._sensor_parameters.get(int(sensor_id))
+
+    def known_sensors(self, sensor_ids: pa.Array | pa.ChunkedArray) -> pa.ChunkedArray:
+        """
+        Returns a boolean mask of which sensor ids are present in the sensors table.
+
+        Unknown ids trigger one on-demand refresh before the mask is computed, so sensors onboarded since
+        the last load are not mistaken for orphans. Ids still unknown after it are not refreshed for again until
+        miss_ttl has passed.
+
+        Args:
+            sensor_ids (pa.Array | pa.ChunkedArray): Sensor ids, e.g. the sensor_id column of a measurements table.
+
+        Returns:
+            mask (pa.ChunkedArray): True where the sensor is known.
+        """
+
+        import pyarrow as pa
+        import pyarrow.compute as pc
+
+        self._ensure_fresh()
+        sensor_ids = sensor_ids.cast(pa.int64())
+        mask = pc.is_in(sensor_ids, value_set=self._sensor_ids)
+        if pc.all(mask).as_py():
+            return mask
+
+        unknown = pc.unique(sensor_ids.filter(pc.invert(mask))).to_pylist()
+        now = time.monotonic()
+        with self.lock:
+            # Forget expired misses so sensors onboarded meanwhile get their refresh.
+            self._missing_sensors = {sensor_id: missed_at for sensor_id, missed_at in self._missing_sensors.items() if now - missed_at < self.miss_ttl}
+            unexpected = [sensor_id for sensor_id in unknown if sensor_id not in self._missing_sensors]
+        if not unexpected:
+            return mask
+
+        self.refresh()
+        mask = pc.is_in(sensor_ids, value_set=self._sensor_ids)
+        missing = pc.unique(sensor_ids.filter(pc.invert(mask))).to_pylist()
+        with self.lock:
+            self._missing_sensors.update((sensor_id, now) for sensor_id in missing)
+
+        return mask
+
+_dimensions = None
+_dimensions_lock = threading.Lock()
+
+def get_dimensions(engine: Engine) -> DimensionCache:
+    """
+    Returns the process-wide DimensionCache, creating it on first use.
+
+    Args:
+        engine (Engine): SQLAlchemy engine connected to the airq database, e.g. db.get_bind().
+
+    Returns:
+        dimensions (DimensionCache): Shared cache used by ingestion and the load stage.
+    """
+
+    global _dimensions
+
+    with _dimensions_lock:
+        if _dimensions is None:
+            _dimensions = DimensionCache(engine)
+        return _dimensions
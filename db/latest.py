@@ -0,0 +1,76 @@
+from __future__ import annotations
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from sqlalchemy import Connection
+
+def merge_latest_sql(source: str) -> str:
+    """
+    Returns a data-modifying CTE that upserts the newest row per sensor of `source` into latest_measurements.
+
+    Like db.rollups.merge_rollups_sql, it is meant to follow the `WITH source AS (INSERT INTO measurements ...
+    RETURNING sensor_id, datetime, value)` clause of the loader, so latest_measurements is updated in the same
+    transaction as measurements. A sensor's row only moves forward in time, so backfilled or late rows never
+    replace a newer reading.
+
+    Args:
+        source (str): Name of a CTE or table with sensor_id, datetime and value columns.
+
+    Returns:
+        sql (str): Comma-prefixed CTE.
+    """
+
+    return f""",
+        latest_merged AS (
+            INSERT INTO latest_measurements AS l (sensor_id, datetime, value)
+            SELECT DISTINCT ON (sensor_id) sensor_id, datetime, value
+            FROM {source}
+            ORDER BY sensor_id, datetime DESC
+            ON CONFLICT (sensor_id) DO UPDATE SET
+                datetime = EXCLUDED.datetime,
+                value = EXCLUDED.value
+            WHERE EXCLUDED.datetime > l.datetime
+            )"""
+
+def read_latest(conn: Connection, location_id: int | None = None, country_id: int | None = None, parameter_id: int | None = None) -> list:
+    """
+    Reads the current reading of every sensor at a location or in a country.
+
+    Args:
+        conn (Connection): SQLAlchemy connection to the airq database.
+        location_id (int | None): Only sensors of this location.
+        country_id (int | None): Only sensors of locations in this country.
+        parameter_id (int | None): Only sensors measuring this parameter.
+
+    Raises:
+        ValueError: If neither location_id nor country_id is given.
+
+    Returns:
+        rows (list): (location_id, sensor_id, parameter_id, datetime, value) rows, ordered by location and sensor.
+    """
+
+    from sqlalchemy import text
+
+    if location_id is None and country_id is None:
+        raise ValueError("Expected a location_id or a country_id.")
+
+    filters = []
+    params = {}
+    if location_id is not None:
+        filters.append("s.location_id = :location_id")
+        params["location_id"] = location_id
+    if country_id is not None:
+        filters.append("l.country_id = :country_id")
+        params["country_id"] = country_id
+    if parameter_id is not None:
+        filters.append("s.parameter_id = :parameter_id")
+        params["parameter_id"] = parameter_id
+
+    return conn.execute(text(f"""
+        SELECT s.location_id, m.sensor_id, s.parameter_id, m.datetime, m.value
+        FROM locations l
+        JOIN sensors s ON s.location_id = l.id
+        JOIN latest_measurements m ON m.sensor_id = s.id
+        WHERE {" AND ".join(filters)}
+        ORDER BY s.location_id, m.sensor_id
+        """), params).all()
@@ -0,0 +1,27 @@
+-- Makes measurement ingestion idempotent on databases created before sensor watermarks existed.
+-- Removes duplicate (sensor_id, datetime) rows, adds the uniqueness constraint and seeds
+-- sensor_watermarks from the data already loaded.
+
+BEGIN;
+
+DELETE FROM measurements m
+USING measurements d
+WHERE m.sensor_id = d.sensor_id
+	AND m.datetime = d.datetime
+	AND m.id > d.id;
+
+ALTER TABLE measurements
+	ADD CONSTRAINT measurements_sensor_id_datetime_key UNIQUE (sensor_id, datetime);
+
+CREATE TABLE IF NOT EXISTS sensor_watermarks (
+	sensor_id INTEGER PRIMARY KEY,
+	last_datetime TIMESTAMP NOT NULL,
+	FOREIGN KEY (sensor_id) REFERENCES sensors(id)
+	);
+
+INSERT INTO sensor_watermarks (sensor_id, last_datetime)
+SELECT sensor_id, MAX(datetime) FROM measurements GROUP BY sensor_id
+ON CONFLICT (sensor_id) DO UPDATE
+	SET last_datetime = GREATEST(sensor_watermarks.last_datetime, EXCLUDED.last_datetime);
+
+COMMIT;
@@ -0,0 +1,57 @@
+-- Converts an unpartitioned measurements table (schema after 001_measurements_unique.sql) into the
+-- monthly range-partitioned table from schema.sql. Creates a partition for every month that has data,
+-- plus the next three, copies all rows across and keeps ids.
+--
+-- The old table is kept as measurements_unpartitioned. Drop it once the new table has been checked:
+--     DROP TABLE measurements_unpartitioned;
+
+BEGIN;
+
+LOCK TABLE measurements IN ACCESS EXCLUSIVE MODE;
+
+ALTER TABLE measurements RENAME TO measurements_unpartitioned;
+ALTER TABLE measurements_unpartitioned RENAME CONSTRAINT measurements_pkey TO measurements_unpartitioned_pkey;
+ALTER TABLE measurements_unpartitioned RENAME CONSTRAINT measurements_sensor_id_datetime_key TO measurements_unpartitioned_sensor_id_datetime_key;
+ALTER TABLE measurements_unpartitioned RENAME CONSTRAINT measurements_sensor_id_fkey TO measurements_unpartitioned_sensor_id_fkey;
+ALTER SEQUENCE measurements_id_seq RENAME TO measurements_unpartitioned_id_seq;
+
+CREATE TABLE measurements (
+	id BIGSERIAL,
+	datetime TIMESTAMP NOT NULL,
+	value DOUBLE PRECISION NOT NULL,
+	sensor_id INTEGER NOT NULL,
+	PRIMARY KEY (id, datetime),
+	FOREIGN KEY (sensor_id) REFERENCES sensors(id)
+	) PARTITION BY RANGE (datetime);
+
+CREATE UNIQUE INDEX measurements_sensor_id_datetime_idx ON measurements (sensor_id, datetime DESC);
+CREATE INDEX measurements_datetime_idx ON measurements USING BRIN (datetime);
+
+CREATE TABLE measurements_default PARTITION OF measurements DEFAULT;
+
+CREATE OR REPLACE FUNCTION create_measurements_partition(month DATE) RETURNS TEXT AS $$
+DECLARE
+	start_month DATE := date_trunc('month', month);
+	partition_name TEXT := format('measurements_y%sm%s', to_char(start_month, 'YYYY'), to_char(start_month, 'MM'));
+BEGIN
+	EXECUTE format(
+		'CREATE TABLE IF NOT EXISTS %I PARTITION OF measurements FOR VALUES FROM (%L) TO (%L)',
+		partition_name, start_month, start_month + INTERVAL '1 month'
+		);
+	RETURN partition_name;
+END;
+$$ LANGUAGE plpgsql;
+
+SELECT create_measurements_partition(month::DATE)
+FROM generate_series(
+	date_trunc('month', COALESCE((SELECT MIN(datetime) FROM measurements_unpartitioned), now())),
+	date_trunc('month', GREATEST((SELECT MAX(datetime) FROM measurements_unpartitioned), now())) + INTERVAL '3 months',
+	INTERVAL '1 month'
+	) AS month;
+
+INSERT INTO measurements (id, datetime, value, sensor_id)
+SELECT id, datetime, value, sensor_id FROM measurements_unpartitioned;
+
+SELECT setval('measurements_id_seq', COALESCE((SELECT MAX(id) FROM measurements), 0) + 1, false);
+
+COMMIT;
@@ -0,0 +1,25 @@
+-- Adds the checkpoint tables of hourly ingestion runs to databases created before they existed.
+
+BEGIN;
+
+CREATE TABLE IF NOT EXISTS ingestion_runs (
+	run_id TEXT NOT NULL,
+	shard TEXT NOT NULL,
+	mode TEXT NOT NULL,
+	status TEXT NOT NULL,
+	attempts INTEGER NOT NULL DEFAULT 1,
+	started_at TIMESTAMP NOT NULL,
+	finished_at TIMESTAMP,
+	PRIMARY KEY (run_id, shard)
+	);
+
+CREATE TABLE IF NOT EXISTS ingestion_run_locations (
+	run_id TEXT NOT NULL,
+	location_id INTEGER NOT NULL,
+	status TEXT NOT NULL,
+	updated_at TIMESTAMP NOT NULL,
+	PRIMARY KEY (run_id, location_id),
+	FOREIGN KEY (location_id) REFERENCES locations(id)
+	);
+
+COMMIT;
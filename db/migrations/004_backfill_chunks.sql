@@ -0,0 +1,17 @@
+-- Adds the chunk progress table of historical backfills to databases created before it existed.
+
+BEGIN;
+
+CREATE TABLE IF NOT EXISTS backfill_chunks (
+	backfill_id TEXT NOT NULL,
+	sensor_id INTEGER NOT NULL,
+	datetime_from TIMESTAMP NOT NULL,
+	datetime_to TIMESTAMP NOT NULL,
+	status TEXT NOT NULL,
+	rows_loaded INTEGER,
+	updated_at TIMESTAMP NOT NULL,
+	PRIMARY KEY (backfill_id, sensor_id, datetime_from),
+	FOREIGN KEY (sensor_id) REFERENCES sensors(id)
+	);
+
+COMMIT;
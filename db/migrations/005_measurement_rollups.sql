@@ -0,0 +1,42 @@
+-- Adds the hourly and daily rollup tables to databases created before they existed, and fills them from the
+-- measurements already loaded.
+
+BEGIN;
+
+CREATE TABLE IF NOT EXISTS measurements_hourly (
+	sensor_id INTEGER NOT NULL,
+	bucket TIMESTAMP NOT NULL,
+	count INTEGER NOT NULL,
+	min DOUBLE PRECISION NOT NULL,
+	max DOUBLE PRECISION NOT NULL,
+	sum DOUBLE PRECISION NOT NULL,
+	mean DOUBLE PRECISION GENERATED ALWAYS AS (sum / count) STORED,
+	PRIMARY KEY (sensor_id, bucket),
+	FOREIGN KEY (sensor_id) REFERENCES sensors(id)
+	);
+
+CREATE TABLE IF NOT EXISTS measurements_daily (
+	sensor_id INTEGER NOT NULL,
+	bucket TIMESTAMP NOT NULL,
+	count INTEGER NOT NULL,
+	min DOUBLE PRECISION NOT NULL,
+	max DOUBLE PRECISION NOT NULL,
+	sum DOUBLE PRECISION NOT NULL,
+	mean DOUBLE PRECISION GENERATED ALWAYS AS (sum / count) STORED,
+	PRIMARY KEY (sensor_id, bucket),
+	FOREIGN KEY (sensor_id) REFERENCES sensors(id)
+	);
+
+INSERT INTO measurements_hourly (sensor_id, bucket, count, min, max, sum)
+SELECT sensor_id, date_trunc('hour', datetime), count(*), min(value), max(value), sum(value)
+FROM measurements
+GROUP BY 1, 2
+ON CONFLICT (sensor_id, bucket) DO NOTHING;
+
+INSERT INTO measurements_daily (sensor_id, bucket, count, min, max, sum)
+SELECT sensor_id, date_trunc('day', datetime), count(*), min(value), max(value), sum(value)
+FROM measurements
+GROUP BY 1, 2
+ON CONFLICT (sensor_id, bucket) DO NOTHING;
+
+COMMIT;
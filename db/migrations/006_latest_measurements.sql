@@ -0,0 +1,22 @@
+-- Adds latest_measurements to databases created before it existed, and fills it from the measurements already loaded.
+
+BEGIN;
+
+CREATE TABLE IF NOT EXISTS latest_measurements (
+	sensor_id INTEGER PRIMARY KEY,
+	datetime TIMESTAMP NOT NULL,
+	value DOUBLE PRECISION NOT NULL,
+	FOREIGN KEY (sensor_id) REFERENCES sensors(id)
+	);
+
+-- Serve the location and country lookups of latest readings.
+CREATE INDEX IF NOT EXISTS sensors_location_id_idx ON sensors (location_id);
+CREATE INDEX IF NOT EXISTS locations_country_id_idx ON locations (country_id);
+
+INSERT INTO latest_measurements (sensor_id, datetime, value)
+SELECT DISTINCT ON (sensor_id) sensor_id, datetime, value
+FROM measurements
+ORDER BY sensor_id, datetime DESC
+ON CONFLICT (sensor_id) DO NOTHING;
+
+COMMIT;
@@ -0,0 +1,59 @@
+-- Adds the generated geohash column and its prefix index to locations on databases created before they existed.
+-- Adding the column computes the geohash of every existing location.
+
+BEGIN;
+
+-- Geohash of a point, the same as db.spatial.geohash_encode. IMMUTABLE so it can back the generated locations.geohash column.
+CREATE OR REPLACE FUNCTION geohash_encode(latitude DOUBLE PRECISION, longitude DOUBLE PRECISION, chars INTEGER) RETURNS TEXT AS $$
+DECLARE
+	alphabet CONSTANT TEXT := '0123456789bcdefghjkmnpqrstuvwxyz';
+	lat_min DOUBLE PRECISION := -90;
+	lat_max DOUBLE PRECISION := 90;
+	lon_min DOUBLE PRECISION := -180;
+	lon_max DOUBLE PRECISION := 180;
+	mid DOUBLE PRECISION;
+	geohash TEXT := '';
+	bits INTEGER := 0;
+	code INTEGER := 0;
+	even BOOLEAN := TRUE;
+BEGIN
+	IF latitude IS NULL OR longitude IS NULL THEN
+		RETURN NULL;
+	END IF;
+	WHILE length(geohash) < chars LOOP
+		IF even THEN
+			mid := (lon_min + lon_max) / 2;
+			IF longitude >= mid THEN
+				code := code * 2 + 1;
+				lon_min := mid;
+			ELSE
+				code := code * 2;
+				lon_max := mid;
+			END IF;
+		ELSE
+			mid := (lat_min + lat_max) / 2;
+			IF latitude >= mid THEN
+				code := code * 2 + 1;
+				lat_min := mid;
+			ELSE
+				code := code * 2;
+				lat_max := mid;
+			END IF;
+		END IF;
+		even := NOT even;
+		bits := bits + 1;
+		IF bits = 5 THEN
+			geohash := geohash || substr(alphabet, code + 1, 1);
+			bits := 0;
+			code := 0;
+		END IF;
+	END LOOP;
+	RETURN geohash;
+END;
+$$ LANGUAGE plpgsql IMMUTABLE;
+
+ALTER TABLE locations ADD COLUMN IF NOT EXISTS geohash TEXT GENERATED ALWAYS AS (geohash_encode(latitude, longitude, 9)) STORED;
+
+CREATE INDEX IF NOT EXISTS locations_geohash_idx ON locations (geohash text_pattern_ops);
+
+COMMIT;
@@ -0,0 +1,7 @@
+-- Adds the per-location attempt count of hourly ingestion runs to databases created before it existed.
+
+BEGIN;
+
+ALTER TABLE ingestion_run_locations ADD COLUMN IF NOT EXISTS attempts INTEGER NOT NULL DEFAULT 0;
+
+COMMIT;
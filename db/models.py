@@ -1,5 +1,5 @@
 from datetime import datetime
-from sqlalchemy import ForeignKey
+from sqlalchemy import BigInteger, Computed, DateTime, ForeignKey, Index, text
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column, relationship
 
 class Base(DeclarativeBase):
@@ -7,12 +7,17 @@ class Base(DeclarativeBase):
 
 class Location(Base):
     __tablename__ = "locations"
+    __table_args__ = (
+        Index("locations_country_id_idx", "country_id"),
+        Index("locations_geohash_idx", "geohash", postgresql_ops={"geohash": "text_pattern_ops"}),
+        )
 
     id: Mapped[int] = mapped_column(primary_key=True)
     name: Mapped[str]
     latitude: Mapped[float]
     longitude: Mapped[float]
     country_id: Mapped[int] = mapped_column(ForeignKey("countries.id"))
+    geohash: Mapped[str | None] = mapped_column(Computed("geohash_encode(latitude, longitude, 9)"))
 
 class Country(Base):
     __tablename__ = "countries"
@@ -30,6 +35,9 @@ class Parameter(Base):
 
 class Sensor(Base):
     __tablename__ = "sensors"
+    __table_args__ = (
+        Index("sensors_location_id_idx", "location_id"),
+        )
 
     id: Mapped[int] = mapped_column(primary_key=True)
     name: Mapped[str]
@@ -38,8 +46,78 @@ class Sensor(Base):
 
 class Measurement(Base):
     __tablename__ = "measurements"
+    __table_args__ = (
+        Index("measurements_sensor_id_datetime_idx", "sensor_id", text("datetime DESC"), unique=True),
+        {"postgresql_partition_by": "RANGE (datetime)"},
+        )
 
-    id: Mapped[int] = mapped_column(primary_key=True)
-    datetime: Mapped[datetime]
+    id: Mapped[int] = mapped_column(BigInteger, primary_key=True)
+    datetime: Mapped[datetime] = mapped_column(DateTime, primary_key=True)
     value: Mapped[float]
     sensor_id: Mapped[int] = mapped_column(ForeignKey("sensors.id"))
+
+class SensorWatermark(Base):
+    __tablename__ = "sensor_watermarks"
+
+    sensor_id: Mapped[int] = mapped_column(ForeignKey("sensors.id"), primary_key=True)
+    last_datetime: Mapped[datetime]
+
+class IngestionRun(Base):
+    __tablename__ = "ingestion_runs"
+
+    run_id: Mapped[str] = mapped_column(primary_key=True)
+    shard: Mapped[str] = mapped_column(primary_key=True)
+    mode: Mapped[str]
+    status: Mapped[str]
+    attempts: Mapped[int]
+    started_at: Mapped[datetime]
+    finished_at: Mapped[datetime | None]
+
+class IngestionRunLocation(Base):
+    __tablename__ = "ingestion_run_locations"
+
+    run_id: Mapped[str] = mapped_column(primary_key=True)
+    location_id: Mapped[int] = mapped_column(ForeignKey("locations.id"), primary_key=True)
+    status: Mapped[str]
+    attempts: Mapped[int]
+    updated_at: Mapped[datetime]
+
+class BackfillChunk(Base):
+    __tablename__ = "backfill_chunks"
+
+    backfill_id: Mapped[str] = mapped_column(primary_key=True)
+    sensor_id: Mapped[int] = mapped_column(ForeignKey("sensors.id"), primary_key=True)
+    datetime_from: Mapped[datetime] = mapped_column(DateTime, primary_key=True)
+    datetime_to: Mapped[datetime] = mapped_column(DateTime)
+    status: Mapped[str]
+    rows_loaded: Mapped[int | None]
+    updated_at: Mapped[datetime] = mapped_column(DateTime)
+
+class MeasurementHourly(Base):
+    __tablename__ = "measurements_hourly"
+
+    sensor_id: Mapped[int] = mapped_column(ForeignKey("sensors.id"), primary_key=True)
+    bucket: Mapped[datetime] = mapped_column(DateTime, primary_key=True)
+    count: Mapped[int]
+    min: Mapped[float]
+    max: Mapped[float]
+    sum: Mapped[float]
+    mean: Mapped[float] = mapped_column(Computed("sum / count"))
+
+class MeasurementDaily(Base):
+    __tablename__ = "measurements_daily"
+
+    sensor_id: Mapped[int] = mapped_column(ForeignKey("sensors.id"), primary_key=True)
+    bucket: Mapped[datetime] = mapped_column(DateTime, primary_key=True)
+    count: Mapped[int]
+    min: Mapped[float]
+    max: Mapped[float]
+    sum: Mapped[float]
+    mean: Mapped[float] = mapped_column(Computed("sum / count"))
+
+class LatestMeasurement(Base):
+    __tablename__ = "latest_measurements"
+
+    sensor_id: Mapped[int] = mapped_column(ForeignKey("sensors.id"), primary_key=True)
+    datetime: Mapped[datetime] = mapped_column(DateTime)
+    value: Mapped[float]
@@ -0,0 +1,204 @@
+from __future__ import annotations
+import argparse
+from datetime import date
+import logging
+from pathlib import Path
+from typing import TYPE_CHECKING
+from db.db import get_engine
+from etl.config import init
+
+if TYPE_CHECKING:
+    from sqlalchemy import Connection
+
+DEFAULT_PARTITION = "measurements_default"
+ARCHIVE_BATCH_ROWS = 100_000
+
+def month_start(day: date) -> date:
+    return day.replace(day=1)
+
+def add_months(month: date, months: int) -> date:
+    index = month.year * 12 + month.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+def list_partitions(conn: Connection) -> list[tuple[str, date]]:
+    """
+    Lists the monthly partitions currently attached to measurements.
+
+    Args:
+        conn (Connection): SQLAlchemy connection to the airq database.
+
+    Returns:
+        partitions (list[tuple[str, date]]): (partition name, first day of its month), oldest first. The default partition is left out.
+    """
+
+    from sqlalchemy import text
+
+    names = conn.execute(text("""
+        SELECT c.relname FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = 'measurements'::regclass
+        """)).scalars()
+
+    partitions = []
+    for name in names:
+        if name == DEFAULT_PARTITION:
+            continue
+        year, month = name.removeprefix("measurements_y").split("m")
+        partitions.append((name, date(int(year), int(month), 1)))
+
+    return sorted(partitions, key=lambda partition: partition[1])
+
+def create_partition(conn: Connection, month: date) -> str:
+    """
+    Creates the monthly partition for a month if it does not exist yet.
+
+    Rows for that month that already landed in the default partition are moved into the new partition, since
+    Postgres refuses to create a partition whose range overlaps rows in the default partition.
+
+    Args:
+        conn (Connection): SQLAlchemy connection to the airq database, inside a transaction.
+        month (date): Any day of the month to create.
+
+    Returns:
+        name (str): Name of the partition.
+    """
+
+    from sqlalchemy import text
+
+    month = month_start(month)
+    bounds = {"start": month, "end": add_months(month, 1)}
+
+    stray_rows = conn.execute(
+            text(f"SELECT EXISTS (SELECT 1 FROM {DEFAULT_PARTITION} WHERE datetime >= :start AND datetime < :end)"),
+            bounds
+            ).scalar()
+
+    if not stray_rows:
+        return conn.execute(text("SELECT create_measurements_partition(:month)"), {"month": month}).scalar()
+
+    logging.info(f"Moving rows for {month:%Y-%m} out of {DEFAULT_PARTITION}.")
+    conn.execute(text(f"ALTER TABLE measurements DETACH PARTITION {DEFAULT_PARTITION}"))
+    name = conn.execute(text("SELECT create_measurements_partition(:month)"), {"month": month}).scalar()
+    conn.execute(text(f"""
+        WITH moved AS (
+            DELETE FROM {DEFAULT_PARTITION} WHERE datetime >= :start AND datetime < :end RETURNING *
+            )
+        INSERT INTO measurements (id, datetime, value, sensor_id) SELECT id, datetime, value, sensor_id FROM moved
+        """), bounds)
+    conn.execute(text(f"ALTER TABLE measurements ATTACH PARTITION {DEFAULT_PARTITION} DEFAULT"))
+
+    return name
+
+def archive_partition(conn: Connection, name: str, archive_dir: Path) -> Path:
+    """
+    Exports a partition to a parquet file, streaming it in batches.
+
+    Args:
+        conn (Connection): SQLAlchemy connection to the airq database.
+        name (str): Partition to export.
+        archive_dir (Path): Directory to write {name}.parquet into.
+
+    Returns:
+        filepath (Path): Path object that points to the parquet file.
+    """
+
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    from sqlalchemy import text
+
+    archive_dir.mkdir(parents=True, exist_ok=True)
+    filepath = archive_dir / f"{name}.parquet"
+    schema = pa.schema([("id", pa.int64()), ("datetime", pa.timestamp("us")), ("value", pa.float64()), ("sensor_id", pa.int32())])
+
+    result = conn.execute(
+            text(f"SELECT id, datetime, value, sensor_id FROM {name} ORDER BY sensor_id, datetime").execution_options(stream_results=True)
+            )
+
+    rows = 0
+    with pq.ParquetWriter(filepath, schema, compression="zstd") as writer:
+        while batch := result.fetchmany(ARCHIVE_BATCH_ROWS):
+            writer.write_table(pa.Table.from_pylist([row._asdict() for row in batch], schema=schema))
+            rows += len(batch)
+
+    logging.info(f"Archived {rows} records from {name} to {filepath}.")
+
+    return filepath
+
+def retire_partitions(conn: Connection, before: date, archive_dir: Path | None = None, drop: bool = False) -> list[str]:
+    """
+    Detaches every monthly partition for a month before a given one, optionally archiving and dropping it.
+
+    Args:
+        conn (Connection): SQLAlchemy connection to the airq database, inside a transaction.
+        before (date): Partitions for months before this one are retired.
+        archive_dir (Path | None): If given, export each retired partition to parquet in this directory first.
+        drop (bool): Drop the detached tables. Without this they are kept as standalone tables.
+
+    Returns:
+        retired (list[str]): Names of the retired partitions.
+    """
+
+    from sqlalchemy import text
+
+    before = month_start(before)
+    retired = []
+
+    for name, month in list_partitions(conn):
+        if month >= before:
+            continue
+        conn.execute(text(f"ALTER TABLE measurements DETACH PARTITION {name}"))
+        if archive_dir is not None:
+            archive_partition(conn, name, archive_dir)
+        if drop:
+            conn.execute(text(f"DROP TABLE {name}"))
+        logging.info(f"Retired partition {name}{' (dropped)' if drop else ''}.")
+        retired.append(name)
+
+    return retired
+
+def manage_partitions(months_ahead: int = 3, retain_months: int | None = None, archive_dir: Path | None = None, drop: bool = False, today: date | None = None):
+    """
+    Creates the partitions for the current month and the next months_ahead months, and retires partitions older than retain_months.
+
+    Args:
+        months_ahead (int): Number of future monthly partitions to keep ready.
+        retain_months (int | None): Number of months, including the current one, to keep attached. None keeps everything.
+        archive_dir (Path | None): Export retired partitions to parquet in this directory.
+        drop (bool): Drop retired partitions after detaching (and archiving) them.
+        today (date | None): Reference day. Defaults to today.
+    """
+
+    current = month_start(today or date.today())
+
+    with get_engine().begin() as conn:
+        for offset in range(months_ahead + 1):
+            create_partition(conn, add_months(current, offset))
+
+        if retain_months is not None:
+            retire_partitions(conn, add_months(current, -(retain_months - 1)), archive_dir=archive_dir, drop=drop)
+
+    with get_engine().connect() as conn:
+        logging.info(f"Partitions: {', '.join(name for name, _ in list_partitions(conn))}")
+
+def main():
+    init()
+
+    parser = argparse.ArgumentParser(description="Create upcoming and retire old monthly measurements partitions.")
+    parser.add_argument("--ahead", type=int, default=3, help="Number of future monthly partitions to create.")
+    parser.add_argument("--retain-months", type=int, help="Months to keep attached, including the current one. Older partitions are detached.")
+    parser.add_argument("--archive-dir", help="Export detached partitions to parquet in this directory.")
+    parser.add_argument("--drop", action="store_true", help="Drop detached partitions.")
+    args = parser.parse_args()
+
+    if args.drop and args.retain_months is None:
+        parser.error("--drop requires --retain-months")
+
+    manage_partitions(
+            months_ahead=args.ahead,
+            retain_months=args.retain_months,
+            archive_dir=Path(args.archive_dir) if args.archive_dir else None,
+            drop=args.drop
+            )
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,194 @@
+from __future__ import annotations
+import argparse
+from datetime import date, datetime, time
+import logging
+from typing import TYPE_CHECKING
+from db.db import get_engine
+from db.partitions import add_months, month_start
+from etl.config import init
+
+if TYPE_CHECKING:
+    from sqlalchemy import Connection
+
+# Rollup table and the date_trunc precision of its buckets.
+ROLLUPS = {
+        "measurements_hourly": "hour",
+        "measurements_daily": "day",
+        }
+GRAINS = {grain: table for table, grain in ROLLUPS.items()}
+
+def merge_rollups_sql(source: str) -> str:
+    """
+    Returns data-modifying CTEs that add the rows of `source` to every rollup table.
+
+    The CTEs are meant to follow a `WITH source AS (INSERT INTO measurements ... RETURNING sensor_id, datetime, value)`
+    clause, so exactly the rows that were inserted, and none that were skipped as duplicates, are merged into the
+    buckets they touch, in the same statement and transaction as the insert itself.
+
+    Args:
+        source (str): Name of a CTE or table with sensor_id, datetime and value columns.
+
+    Returns:
+        sql (str): Comma-prefixed CTEs, one per rollup table.
+    """
+
+    return "".join(f""",
+        {table}_merged AS (
+            INSERT INTO {table} AS r (sensor_id, bucket, count, min, max, sum)
+            SELECT sensor_id, date_trunc('{grain}', datetime), count(*), min(value), max(value), sum(value)
+            FROM {source}
+            GROUP BY 1, 2
+            ON CONFLICT (sensor_id, bucket) DO UPDATE SET
+                count = r.count + EXCLUDED.count,
+                min = LEAST(r.min, EXCLUDED.min),
+                max = GREATEST(r.max, EXCLUDED.max),
+                sum = r.sum + EXCLUDED.sum
+            )""" for table, grain in ROLLUPS.items())
+
+def rebuild_rollups_range(conn: Connection, start: datetime, end: datetime, sensor_ids: list[int] | None = None) -> dict[str, int]:
+    """
+    Recomputes every rollup bucket in [start, end) from the raw measurements.
+
+    Only raw rows still attached to measurements are counted, so rebuilding a range whose partitions were retired
+    empties its buckets.
+
+    Args:
+        conn (Connection): SQLAlchemy connection to the airq database, inside a transaction.
+        start (datetime): Start of the range. Should be midnight, so daily buckets are whole.
+        end (datetime): End of the range. Should be midnight.
+        sensor_ids (list[int] | None): Only rebuild these sensors' buckets.
+
+    Returns:
+        buckets (dict[str, int]): Mapping of rollup table to number of buckets written.
+    """
+
+    from sqlalchemy import bindparam, text
+
+    sensor_filter = "AND sensor_id IN :sensor_ids" if sensor_ids else ""
+    params = {"start": start, "end": end}
+    if sensor_ids:
+        params["sensor_ids"] = [int(sensor_id) for sensor_id in sensor_ids]
+
+    buckets = {}
+    for table, grain in ROLLUPS.items():
+        delete = text(f"DELETE FROM {table} WHERE bucket >= :start AND bucket < :end {sensor_filter}")
+        insert = text(f"""
+            INSERT INTO {table} (sensor_id, bucket, count, min, max, sum)
+            SELECT sensor_id, date_trunc('{grain}', datetime), count(*), min(value), max(value), sum(value)
+            FROM measurements
+            WHERE datetime >= :start AND datetime < :end {sensor_filter}
+            GROUP BY 1, 2
+            """)
+        if sensor_ids:
+            delete = delete.bindparams(bindparam("sensor_ids", expanding=True))
+            insert = insert.bindparams(bindparam("sensor_ids", expanding=True))
+
+        conn.execute(delete, params)
+        buckets[table] = conn.execute(insert, params).rowcount
+
+    return buckets
+
+def rebuild_rollups(start: date, end: date, sensor_ids: list[int] | None = None) -> dict[str, int]:
+    """
+    Recomputes the rollup tables from raw measurements for the days from start up to, but excluding, end.
+
+    The range is rebuilt one month at a time, each in its own transaction, so long ranges never hold locks on
+    every bucket at once.
+
+    Args:
+        start (date): First day to rebuild.
+        end (date): Day after the last day to rebuild.
+        sensor_ids (list[int] | None): Only rebuild these sensors' buckets.
+
+    Raises:
+        ValueError: If end is not after start.
+
+    Returns:
+        buckets (dict[str, int]): Mapping of rollup table to number of buckets written.
+    """
+
+    if end <= start:
+        raise ValueError(f"Expected end after start. Got {start} to {end}")
+
+    totals = {table: 0 for table in ROLLUPS}
+    month_from = start
+
+    while month_from < end:
+        month_to = min(add_months(month_start(month_from), 1), end)
+        with get_engine().begin() as conn:
+            buckets = rebuild_rollups_range(conn, datetime.combine(month_from, time()), datetime.combine(month_to, time()), sensor_ids)
+        logging.info(f"Rebuilt rollups from {month_from} to {month_to}: {buckets}.")
+        for table, count in buckets.items():
+            totals[table] += count
+        month_from = month_to
+
+    return totals
+
+def read_rollups(conn: Connection, grain: str, start: datetime, end: datetime, sensor_ids: list[int] | None = None,
+                 location_id: int | None = None, parameter_id: int | None = None) -> list:
+    """
+    Reads rollup buckets, e.g. the daily PM2.5 means of a location.
+
+    Args:
+        conn (Connection): SQLAlchemy connection to the airq database.
+        grain (str): 'hour' or 'day'.
+        start (datetime): Start of the range.
+        end (datetime): End of the range, exclusive.
+        sensor_ids (list[int] | None): Only these sensors.
+        location_id (int | None): Only sensors of this location.
+        parameter_id (int | None): Only sensors measuring this parameter.
+
+    Raises:
+        ValueError: If grain is not one of GRAINS.
+
+    Returns:
+        rows (list): (sensor_id, bucket, count, min, max, sum, mean) rows, ordered by sensor and bucket.
+    """
+
+    from sqlalchemy import bindparam, text
+
+    if grain not in GRAINS:
+        raise ValueError(f"Expected grain to be one of {tuple(GRAINS)}. Got {grain}")
+
+    filters = ["r.bucket >= :start", "r.bucket < :end"]
+    params = {"start": start, "end": end}
+    if sensor_ids:
+        filters.append("r.sensor_id IN :sensor_ids")
+        params["sensor_ids"] = [int(sensor_id) for sensor_id in sensor_ids]
+    if location_id is not None:
+        filters.append("s.location_id = :location_id")
+        params["location_id"] = location_id
+    if parameter_id is not None:
+        filters.append("s.parameter_id = :parameter_id")
+        params["parameter_id"] = parameter_id
+
+    stmt = text(f"""
+        SELECT r.sensor_id, r.bucket, r.count, r.min, r.max, r.sum, r.mean
+        FROM {GRAINS[grain]} r
+        JOIN sensors s ON s.id = r.sensor_id
+        WHERE {" AND ".join(filters)}
+        ORDER BY r.sensor_id, r.bucket
+        """)
+    if sensor_ids:
+        stmt = stmt.bindparams(bindparam("sensor_ids", expanding=True))
+
+    return conn.execute(stmt, params).all()
+
+def main():
+    init()
+
+    parser = argparse.ArgumentParser(description="Rebuild the hourly and daily measurement rollups from raw measurements.")
+    parser.add_argument("--start", required=True, type=date.fromisoformat, help="First day to rebuild, e.g. 2025-01-01.")
+    parser.add_argument("--end", required=True, type=date.fromisoformat, help="Day after the last day to rebuild, e.g. 2025-02-01.")
+    parser.add_argument("--sensors", nargs="+", type=int, help="Only rebuild these sensors.")
+    args = parser.parse_args()
+
+    try:
+        totals = rebuild_rollups(args.start, args.end, args.sensors)
+    except ValueError as e:
+        parser.error(str(e))
+
+    logging.info(f"Rebuilt {totals}.")
+
+if __name__ == "__main__":
+    main()
@@ -10,15 +10,68 @@ CREATE TABLE IF NOT EXISTS parameters (
 	description TEXT
 	);
 
+-- Geohash of a point, the same as db.spatial.geohash_encode. IMMUTABLE so it can back the generated locations.geohash column.
+CREATE OR REPLACE FUNCTION geohash_encode(latitude DOUBLE PRECISION, longitude DOUBLE PRECISION, chars INTEGER) RETURNS TEXT AS $$
+DECLARE
+	alphabet CONSTANT TEXT := '0123456789bcdefghjkmnpqrstuvwxyz';
+	lat_min DOUBLE PRECISION := -90;
+	lat_max DOUBLE PRECISION := 90;
+	lon_min DOUBLE PRECISION := -180;
+	lon_max DOUBLE PRECISION := 180;
+	mid DOUBLE PRECISION;
+	geohash TEXT := '';
+	bits INTEGER := 0;
+	code INTEGER := 0;
+	even BOOLEAN := TRUE;
+BEGIN
+	IF latitude IS NULL OR longitude IS NULL THEN
+		RETURN NULL;
+	END IF;
+	WHILE length(geohash) < chars LOOP
+		IF even THEN
+			mid := (lon_min + lon_max) / 2;
+			IF longitude >= mid THEN
+				code := code * 2 + 1;
+				lon_min := mid;
+			ELSE
+				code := code * 2;
+				lon_max := mid;
+			END IF;
+		ELSE
+			mid := (lat_min + lat_max) / 2;
+			IF latitude >= mid THEN
+				code := code * 2 + 1;
+				lat_min := mid;
+			ELSE
+				code := code * 2;
+				lat_max := mid;
+			END IF;
+		END IF;
+		even := NOT even;
+		bits := bits + 1;
+		IF bits = 5 THEN
+			geohash := geohash || substr(alphabet, code + 1, 1);
+			bits := 0;
+			code := 0;
+		END IF;
+	END LOOP;
+	RETURN geohash;
+END;
+$$ LANGUAGE plpgsql IMMUTABLE;
+
 CREATE TABLE IF NOT EXISTS locations (
 	id INTEGER PRIMARY KEY,
 	name TEXT,
 	latitude DOUBLE PRECISION,
 	longitude DOUBLE PRECISION,
 	country_id INTEGER,
+	geohash TEXT GENERATED ALWAYS AS (geohash_encode(latitude, longitude, 9)) STORED,
 	FOREIGN KEY (country_id) REFERENCES countries(id)
 	);
 
+-- Serves geohash prefix lookups (geohash LIKE 'u4pru%'), see db.spatial.locations_in_geohash.
+CREATE INDEX IF NOT EXISTS locations_geohash_idx ON locations (geohash text_pattern_ops);
+
 CREATE TABLE IF NOT EXISTS sensors (
 	id INTEGER PRIMARY KEY,
 	name TEXT,
@@ -28,10 +81,115 @@ CREATE TABLE IF NOT EXISTS sensors (
 	FOREIGN KEY (parameter_id) REFERENCES parameters(id)
 	);
 
+-- Partitioned by month on datetime. Partitions are created ahead of time by `python -m db.partitions`;
+-- rows outside every monthly partition land in measurements_default.
 CREATE TABLE IF NOT EXISTS measurements (
-	id INTEGER PRIMARY KEY GENERATED ALWAYS AS IDENTITY,
+	id BIGSERIAL,
 	datetime TIMESTAMP NOT NULL,
 	value DOUBLE PRECISION NOT NULL,
 	sensor_id INTEGER NOT NULL,
+	PRIMARY KEY (id, datetime),
+	FOREIGN KEY (sensor_id) REFERENCES sensors(id)
+	) PARTITION BY RANGE (datetime);
+
+-- Enforces one reading per sensor and time, and serves "latest for sensor" queries.
+CREATE UNIQUE INDEX IF NOT EXISTS measurements_sensor_id_datetime_idx ON measurements (sensor_id, datetime DESC);
+CREATE INDEX IF NOT EXISTS measurements_datetime_idx ON measurements USING BRIN (datetime);
+
+CREATE TABLE IF NOT EXISTS measurements_default PARTITION OF measurements DEFAULT;
+
+CREATE OR REPLACE FUNCTION create_measurements_partition(month DATE) RETURNS TEXT AS $$
+DECLARE
+	start_month DATE := date_trunc('month', month);
+	partition_name TEXT := format('measurements_y%sm%s', to_char(start_month, 'YYYY'), to_char(start_month, 'MM'));
+BEGIN
+	EXECUTE format(
+		'CREATE TABLE IF NOT EXISTS %I PARTITION OF measurements FOR VALUES FROM (%L) TO (%L)',
+		partition_name, start_month, start_month + INTERVAL '1 month'
+		);
+	RETURN partition_name;
+END;
+$$ LANGUAGE plpgsql;
+
+SELECT create_measurements_partition(month::DATE)
+FROM generate_series(date_trunc('month', now()) - INTERVAL '1 month', date_trunc('month', now()) + INTERVAL '3 months', INTERVAL '1 month') AS month;
+
+CREATE TABLE IF NOT EXISTS sensor_watermarks (
+	sensor_id INTEGER PRIMARY KEY,
+	last_datetime TIMESTAMP NOT NULL,
+	FOREIGN KEY (sensor_id) REFERENCES sensors(id)
+	);
+
+-- Checkpoints of hourly ingestion runs. A run, or each shard of a sharded run, has one row in ingestion_runs
+-- and every location it has to ingest one row in ingestion_run_locations, so retries only redo what is not done.
+CREATE TABLE IF NOT EXISTS ingestion_runs (
+	run_id TEXT NOT NULL,
+	shard TEXT NOT NULL,
+	mode TEXT NOT NULL,
+	status TEXT NOT NULL,
+	attempts INTEGER NOT NULL DEFAULT 1,
+	started_at TIMESTAMP NOT NULL,
+	finished_at TIMESTAMP,
+	PRIMARY KEY (run_id, shard)
+	);
+
+CREATE TABLE IF NOT EXISTS ingestion_run_locations (
+	run_id TEXT NOT NULL,
+	location_id INTEGER NOT NULL,
+	status TEXT NOT NULL,
+	attempts INTEGER NOT NULL DEFAULT 0,
+	updated_at TIMESTAMP NOT NULL,
+	PRIMARY KEY (run_id, location_id),
+	FOREIGN KEY (location_id) REFERENCES locations(id)
+	);
+
+-- Progress of historical backfills, one row per sensor and time chunk, so a backfill can be stopped and resumed.
+CREATE TABLE IF NOT EXISTS backfill_chunks (
+	backfill_id TEXT NOT NULL,
+	sensor_id INTEGER NOT NULL,
+	datetime_from TIMESTAMP NOT NULL,
+	datetime_to TIMESTAMP NOT NULL,
+	status TEXT NOT NULL,
+	rows_loaded INTEGER,
+	updated_at TIMESTAMP NOT NULL,
+	PRIMARY KEY (backfill_id, sensor_id, datetime_from),
+	FOREIGN KEY (sensor_id) REFERENCES sensors(id)
+	);
+
+-- Per sensor hourly and daily aggregates of measurements, keyed by the date_trunc of datetime. The loader merges
+-- every inserted row into them, and `python -m db.rollups` recomputes any range from the raw rows.
+CREATE TABLE IF NOT EXISTS measurements_hourly (
+	sensor_id INTEGER NOT NULL,
+	bucket TIMESTAMP NOT NULL,
+	count INTEGER NOT NULL,
+	min DOUBLE PRECISION NOT NULL,
+	max DOUBLE PRECISION NOT NULL,
+	sum DOUBLE PRECISION NOT NULL,
+	mean DOUBLE PRECISION GENERATED ALWAYS AS (sum / count) STORED,
+	PRIMARY KEY (sensor_id, bucket),
 	FOREIGN KEY (sensor_id) REFERENCES sensors(id)
 	);
+
+CREATE TABLE IF NOT EXISTS measurements_daily (
+	sensor_id INTEGER NOT NULL,
+	bucket TIMESTAMP NOT NULL,
+	count INTEGER NOT NULL,
+	min DOUBLE PRECISION NOT NULL,
+	max DOUBLE PRECISION NOT NULL,
+	sum DOUBLE PRECISION NOT NULL,
+	mean DOUBLE PRECISION GENERATED ALWAYS AS (sum / count) STORED,
+	PRIMARY KEY (sensor_id, bucket),
+	FOREIGN KEY (sensor_id) REFERENCES sensors(id)
+	);
+
+-- Newest measurement per sensor, moved forward by the loader in the same statement that inserts into measurements.
+CREATE TABLE IF NOT EXISTS latest_measurements (
+	sensor_id INTEGER PRIMARY KEY,
+	datetime TIMESTAMP NOT NULL,
+	value DOUBLE PRECISION NOT NULL,
+	FOREIGN KEY (sensor_id) REFERENCES sensors(id)
+	);
+
+-- Serve the location and country lookups of latest readings.
+CREATE INDEX IF NOT EXISTS sensors_location_id_idx ON sensors (location_id);
+CREATE INDEX IF NOT EXISTS locations_country_id_idx ON locations (country_id);
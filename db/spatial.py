@@ -0,0 +1,432 @@
+from __future__ import annotations
+import argparse
+import heapq
+import logging
+import math
+import os
+import threading
+import time
+from typing import TYPE_CHECKING
+from etl.config import init, load_env
+
+if TYPE_CHECKING:
+    from sqlalchemy import Connection, Engine
+
+load_env()
+
+SPATIAL_CELL_DEGREES = float(os.getenv("SPATIAL_CELL_DEGREES", "0.5"))
+SPATIAL_INDEX_TTL = float(os.getenv("SPATIAL_INDEX_TTL", "900"))
+# Locations added or removed since the KD-tree was built are handled outside it until there are this many, or a
+# tenth of all locations, whichever is more.
+REBUILD_MIN_PENDING = 256
+
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE = math.pi * EARTH_RADIUS_KM / 180
+GEOHASH_ALPHABET = "0123456789bcdefghjkmnpqrstuvwxyz"
+
+def haversine_km(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    """
+    Returns the great-circle distance between two points in kilometres.
+    """
+
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    a = math.sin((phi2 - phi1) / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(math.radians(lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+def geohash_encode(latitude: float, longitude: float, chars: int = 9) -> str:
+    """
+    Encodes a point as a geohash, the same way as the geohash_encode SQL function behind locations.geohash.
+    """
+
+    lat_range = [-90.0, 90.0]
+    lon_range = [-180.0, 180.0]
+    geohash = []
+    bits = 0
+    char = 0
+    even = True
+
+    while len(geohash) < chars:
+        value, bounds = (longitude, lon_range) if even else (latitude, lat_range)
+        mid = (bounds[0] + bounds[1]) / 2
+        if value >= mid:
+            char = char * 2 + 1
+            bounds[0] = mid
+        else:
+            char = char * 2
+            bounds[1] = mid
+        even = not even
+        bits += 1
+        if bits == 5:
+            geohash.append(GEOHASH_ALPHABET[char])
+            bits = 0
+            char = 0
+
+    return "".join(geohash)
+
+def _unit_vector(latitude: float, longitude: float) -> tuple[float, float, float]:
+    phi, lam = math.radians(latitude), math.radians(longitude)
+    return (math.cos(phi) * math.cos(lam), math.cos(phi) * math.sin(lam), math.sin(phi))
+
+def _squared_distance(a: tuple[float, float, float], b: tuple[float, float, float]) -> float:
+    return (a[0] - b[0]) ** 2 + (a[1] - b[1]) ** 2 + (a[2] - b[2]) ** 2
+
+def _chord(km: float) -> float:
+    # Straight-line distance through the unit sphere between two points km apart along its surface.
+    return 2 * math.sin(min(km / EARTH_RADIUS_KM, math.pi) / 2)
+
+def _chord_to_km(chord: float) -> float:
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, chord / 2))
+
+class _KDTree:
+    """
+    Static KD-tree over unit vectors, laid out in one array: every subrange is split at its median on the axis
+    with the largest spread, down to small leaves that are scanned linearly.
+    """
+
+    LEAF_SIZE = 8
+
+    def __init__(self, points: dict[int, tuple[float, float]]):
+        self.items = [(_unit_vector(*point), location_id) for location_id, point in points.items()]
+        self.axes = [0] * len(self.items)
+        self._build(0, len(self.items))
+
+    def _build(self, lo: int, hi: int):
+        if hi - lo <= self.LEAF_SIZE:
+            return
+        spans = []
+        for axis in range(3):
+            values = [vector[axis] for vector, _ in self.items[lo:hi]]
+            spans.append(max(values) - min(values))
+        axis = spans.index(max(spans))
+        self.items[lo:hi] = sorted(self.items[lo:hi], key=lambda item: item[0][axis])
+        mid = (lo + hi) // 2
+        self.axes[mid] = axis
+        self._build(lo, mid)
+        self._build(mid + 1, hi)
+
+    def nearest(self, query: tuple[float, float, float], k: int, max_chord: float | None = None, skip: set = frozenset()) -> list:
+        """
+        Returns a max-heap of (-squared chord, location_id) for the k nearest items, ignoring location ids in skip.
+        """
+
+        best = []
+        limit = max_chord ** 2 if max_chord is not None else math.inf
+
+        def consider(item):
+            vector, location_id = item
+            if location_id in skip:
+                return
+            distance = _squared_distance(query, vector)
+            if distance > limit:
+                return
+            if len(best) < k:
+                heapq.heappush(best, (-distance, location_id))
+            elif distance < -best[0][0]:
+                heapq.heapreplace(best, (-distance, location_id))
+
+        def search(lo: int, hi: int):
+            if hi - lo <= self.LEAF_SIZE:
+                for item in self.items[lo:hi]:
+                    consider(item)
+                return
+            mid = (lo + hi) // 2
+            axis = self.axes[mid]
+            consider(self.items[mid])
+            diff = query[axis] - self.items[mid][0][axis]
+            near, far = ((lo, mid), (mid + 1, hi)) if diff < 0 else ((mid + 1, hi), (lo, mid))
+            search(*near)
+            worst = -best[0][0] if len(best) == k else limit
+            if diff * diff <= worst:
+                search(*far)
+
+        search(0, len(self.items))
+        return best
+
+class SpatialIndex:
+    """
+    In-memory spatial index of location coordinates for nearest-location, radius and bounding-box queries.
+
+    Nearest-location queries use a KD-tree over the locations' positions on the unit sphere. Box and radius
+    queries use a grid of cell_degrees by cell_degrees cells, so they only look at the cells the box overlaps.
+    Like db.dimensions.DimensionCache, the index reloads on first use after `ttl` seconds. A reload reads the id and
+    coordinates of every located row, then only touches the locations that are new, moved or deleted.
+    """
+
+    def __init__(self, engine: Engine, cell_degrees: float = SPATIAL_CELL_DEGREES, ttl: float = SPATIAL_INDEX_TTL):
+        self.engine = engine
+        self.cell_degrees = cell_degrees
+        self.ttl = ttl
+        self.rows = math.ceil(180 / cell_degrees)
+        self.cols = math.ceil(360 / cell_degrees)
+        self.lock = threading.Lock()
+        self.loaded_at = None
+        self.points = {}
+        self.cells = {}
+        self.tree = _KDTree({})
+        self.pending = set()
+        self.stale = set()
+
+    def _cell(self, latitude: float, longitude: float) -> tuple[int, int]:
+        row = min(int((latitude + 90) // self.cell_degrees), self.rows - 1)
+        col = int(((longitude + 180) % 360) // self.cell_degrees) % self.cols
+        return row, col
+
+    def add(self, location_id: int, latitude: float, longitude: float):
+        """
+        Adds a location to the index, or moves it if its coordinates changed.
+        """
+
+        with self.lock:
+            self._remove(location_id)
+            self.points[location_id] = (latitude, longitude)
+            self.cells.setdefault(self._cell(latitude, longitude), set()).add(location_id)
+            self.pending.add(location_id)
+
+    def remove(self, location_id: int):
+        with self.lock:
+            self._remove(location_id)
+
+    def _remove(self, location_id: int):
+        point = self.points.pop(location_id, None)
+        if point is not None:
+            cell = self.cells.get(self._cell(*point))
+            cell.discard(location_id)
+            if not cell:
+                del self.cells[self._cell(*point)]
+            if location_id in self.pending:
+                self.pending.discard(location_id)
+            else:
+                self.stale.add(location_id)
+
+    def _rebuild_if_needed(self):
+        if len(self.pending) + len(self.stale) > max(REBUILD_MIN_PENDING, len(self.points) // 10):
+            self.tree = _KDTree(self.points)
+            self.pending = set()
+            self.stale = set()
+
+    def refresh(self, conn: Connection | None = None):
+        """
+        Brings the index in line with the locations table: adds new locations, moves the ones whose coordinates
+        changed and removes the ones deleted or left without coordinates.
+
+        Only the id and coordinate columns are read, and only changed locations touch the index.
+
+        Args:
+            conn (Connection | None): SQLAlchemy connection to the airq database. A new one is opened if None.
+        """
+
+        from sqlalchemy import select
+        from db import models
+
+        if conn is None:
+            with self.engine.connect() as conn:
+                return self.refresh(conn)
+
+        start = time.perf_counter()
+        table = models.Location
+
+        rows = conn.execute(
+                select(table.id, table.latitude, table.longitude)
+                .where(table.latitude.is_not(None), table.longitude.is_not(None))
+                ).all()
+        with self.lock:
+            points = dict(self.points)
+
+        changed = [(location_id, latitude, longitude) for location_id, latitude, longitude in rows if points.get(location_id) != (latitude, longitude)]
+        removed_ids = points.keys() - {location_id for location_id, _, _ in rows}
+
+        for location_id, latitude, longitude in changed:
+            self.add(location_id, latitude, longitude)
+        for location_id in removed_ids:
+            self.remove(location_id)
+
+        with self.lock:
+            self._rebuild_if_needed()
+            self.loaded_at = time.monotonic()
+
+        logging.info(f"Refreshed the spatial index with {len(changed)} new or moved and {len(removed_ids)} removed locations in {time.perf_counter() - start:.2f}s.")
+
+    def invalidate(self):
+        """
+        Marks the index stale so the next query refreshes it.
+        """
+
+        with self.lock:
+            self.loaded_at = None
+
+    def _ensure_fresh(self):
+        if self.loaded_at is None or time.monotonic() - self.loaded_at > self.ttl:
+            self.refresh()
+
+    def nearest(self, latitude: float, longitude: float, k: int = 1, max_km: float | None = None) -> list[tuple[int, float]]:
+        """
+        Finds the k locations nearest to a point.
+
+        Served by a KD-tree over the locations' unit vectors, so distances are exact great-circle distances
+        and neither the antimeridian nor the poles need special cases. Locations added since the tree was
+        built are checked one by one until enough of them pile up to rebuild it.
+
+        Args:
+            latitude (float): Latitude of the point.
+            longitude (float): Longitude of the point.
+            k (int): Number of locations to return.
+            max_km (float | None): Ignore locations further away than this.
+
+        Returns:
+            nearest (list[tuple[int, float]]): (location_id, distance in km), nearest first.
+        """
+
+        self._ensure_fresh()
+        query = _unit_vector(latitude, longitude)
+        max_chord = _chord(max_km) if max_km is not None else None
+
+        with self.lock:
+            self._rebuild_if_needed()
+            # Moved and deleted locations are still in the tree at their old place, so it skips them.
+            best = self.tree.nearest(query, k, max_chord, skip=self.stale)
+            for location_id in self.pending:
+                distance = _squared_distance(query, _unit_vector(*self.points[location_id]))
+                if max_chord is not None and distance > max_chord ** 2:
+                    continue
+                if len(best) < k:
+                    heapq.heappush(best, (-distance, location_id))
+                elif distance < -best[0][0]:
+                    heapq.heapreplace(best, (-distance, location_id))
+
+        return [(location_id, _chord_to_km(math.sqrt(-distance))) for distance, location_id in sorted(best, reverse=True)]
+
+    def within_km(self, latitude: float, longitude: float, km: float) -> list[tuple[int, float]]:
+        """
+        Finds every location within km of a point, e.g. stations within 10 km.
+
+        Returns:
+            locations (list[tuple[int, float]]): (location_id, distance in km), nearest first.
+        """
+
+        self._ensure_fresh()
+        lat_span = km / KM_PER_DEGREE
+        cos_lat = math.cos(math.radians(min(90.0, abs(latitude) + lat_span)))
+        lon_span = 180.0 if cos_lat < 1e-9 else min(180.0, lat_span / cos_lat)
+
+        found = []
+        for location_id in self.within_bbox(max(-90.0, latitude - lat_span), longitude - lon_span, min(90.0, latitude + lat_span), longitude + lon_span):
+            distance = haversine_km(latitude, longitude, *self.points[location_id])
+            if distance <= km:
+                found.append((location_id, distance))
+
+        return sorted(found, key=lambda item: item[1])
+
+    def within_bbox(self, min_latitude: float, min_longitude: float, max_latitude: float, max_longitude: float) -> list[int]:
+        """
+        Finds every location inside a bounding box, e.g. a map viewport.
+
+        A box whose min_longitude is greater than its max_longitude crosses the antimeridian.
+
+        Returns:
+            location_ids (list[int]): Ids of the locations inside the box.
+        """
+
+        self._ensure_fresh()
+
+        if max_longitude - min_longitude >= 360:
+            min_longitude, max_longitude = -180.0, 180.0
+        else:
+            min_longitude = (min_longitude + 180) % 360 - 180
+            max_longitude = (max_longitude + 180) % 360 - 180 if max_longitude != 180.0 else 180.0
+        crosses = min_longitude > max_longitude
+        # -180 and 180 are the same meridian. Locations there are compared as -180 and sit in the first column,
+        # so a box reaching 180 also takes them.
+        reaches_antimeridian = max_longitude == 180.0
+
+        def inside_longitude(longitude: float) -> bool:
+            if longitude == 180.0:
+                longitude = -180.0
+            if crosses:
+                return longitude >= min_longitude or longitude <= max_longitude
+            return min_longitude <= longitude <= max_longitude or (reaches_antimeridian and longitude == -180.0)
+
+        min_row = self._cell(min_latitude, 0.0)[0]
+        max_row = self._cell(max_latitude, 0.0)[0]
+        min_col = min(int((min_longitude + 180) // self.cell_degrees), self.cols - 1)
+        max_col = min(int((max_longitude + 180) // self.cell_degrees), self.cols - 1)
+        cols = range(min_col, max_col + 1) if not crosses else [*range(min_col, self.cols), *range(0, max_col + 1)]
+        if reaches_antimeridian and min_col > 0:
+            cols = [*cols, 0]
+
+        found = []
+        with self.lock:
+            for r in range(min_row, max_row + 1):
+                for c in cols:
+                    for location_id in self.cells.get((r, c), ()):
+                        latitude, longitude = self.points[location_id]
+                        if min_latitude <= latitude <= max_latitude and inside_longitude(longitude):
+                            found.append(location_id)
+
+        return found
+
+_spatial_index = None
+_spatial_index_lock = threading.Lock()
+
+def get_spatial_index(engine: Engine) -> SpatialIndex:
+    """
+    Returns the process-wide SpatialIndex, creating it on first use.
+
+    Args:
+        engine (Engine): SQLAlchemy engine connected to the airq database, e.g. db.get_bind().
+
+    Returns:
+        spatial_index (SpatialIndex): Shared index of location coordinates.
+    """
+
+    global _spatial_index
+
+    with _spatial_index_lock:
+        if _spatial_index is None:
+            _spatial_index = SpatialIndex(engine)
+        return _spatial_index
+
+def locations_in_geohash(conn: Connection, prefix: str) -> list[int]:
+    """
+    Finds the locations whose geohash starts with prefix, through the btree index on locations.geohash.
+
+    A prefix of n characters covers a cell of roughly 5000 / 8**(n/2) km, e.g. 5 characters for about 5 km.
+
+    Returns:
+        location_ids (list[int]): Ids of the locations in the geohash cell.
+    """
+
+    from sqlalchemy import text
+
+    return list(conn.scalars(
+            text("SELECT id FROM locations WHERE geohash LIKE :pattern ORDER BY id"),
+            {"pattern": prefix.replace("%", "").replace("_", "") + "%"}
+            ))
+
+def main():
+    init()
+
+    parser = argparse.ArgumentParser(description="Query the spatial index of locations.")
+    parser.add_argument("--latitude", required=True, type=float)
+    parser.add_argument("--longitude", required=True, type=float)
+    parser.add_argument("--k", type=int, default=5, help="Number of nearest locations to list.")
+    parser.add_argument("--km", type=float, help="List every location within this distance instead.")
+    args = parser.parse_args()
+
+    from db.db import get_engine
+
+    index = get_spatial_index(get_engine())
+    index.refresh()
+
+    start = time.perf_counter()
+    if args.km is not None:
+        found = index.within_km(args.latitude, args.longitude, args.km)
+    else:
+        found = index.nearest(args.latitude, args.longitude, args.k)
+    elapsed = time.perf_counter() - start
+
+    for location_id, distance in found:
+        print(f"{location_id}\t{distance:.2f} km")
+    logging.info(f"Found {len(found)} locations in {elapsed * 1000:.3f} ms.")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+from __future__ import annotations
+from contextlib import contextmanager
+import logging
+import os
+from typing import TYPE_CHECKING, Iterator
+from etl.config import load_env
+
+if TYPE_CHECKING:
+    from sqlalchemy import Connection, Engine
+
+load_env()
+
+UOW_COMMIT_EVERY = int(os.getenv("UOW_COMMIT_EVERY", "500"))
+
+class UnitOfWork:
+    """
+    One connection and one open transaction for a pipeline run, committed in groups.
+
+    Every location, or other unit of work, runs in its own savepoint. A unit that raises rolls back to its savepoint
+    alone, and the transaction carries on with the next one. Once commit_every units have been released, the
+    transaction is committed and a new one begun, so a run of thousands of locations commits a few times instead of
+    once per location, and a crash loses at most the last group.
+
+    Usage:
+        with UnitOfWork(engine) as uow:
+            for location_id in location_ids:
+                with uow.savepoint(f"location {location_id}") as conn:
+                    load(conn, location_id)
+    """
+
+    def __init__(self, engine: Engine, commit_every: int = UOW_COMMIT_EVERY):
+        if commit_every < 1:
+            raise ValueError(f"Expected commit_every to be at least 1. Got {commit_every}")
+
+        self.engine = engine
+        self.commit_every = commit_every
+        self.conn = None
+        self.transaction = None
+        self.uncommitted = 0
+
+    def __enter__(self) -> "UnitOfWork":
+        self.conn = self.engine.connect()
+        self.transaction = self.conn.begin()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            if exc_type is None:
+                self._commit()
+            else:
+                self.rollback()
+        finally:
+            self.conn.close()
+            self.conn = None
+            self.transaction = None
+
+    @contextmanager
+    def savepoint(self, label: object = None, units: int = 1) -> Iterator[Connection]:
+        """
+        Runs a unit of work in a savepoint of the current transaction.
+
+        If the body raises, or its savepoint cannot be released because a statement in it failed, the savepoint is
+        rolled back and the error re-raised; the caller decides whether to log it and move on. Otherwise its units count
+        towards the next group commit.
+
+        Args:
+            label (object): Name of the unit in log messages, e.g. 'location 42'.
+            units (int): Units of work the savepoint holds, e.g. the number of locations loaded together in one batch.
+
+        Yields:
+            conn (Connection): The unit of work's connection, inside the savepoint.
+        """
+
+        nested = self.conn.begin_nested()
+        try:
+            yield self.conn
+            nested.commit()
+        except Exception:
+            if nested.is_active:
+                nested.rollback()
+            logging.warning(f"Rolled back {label if label is not None else 'unit of work'} to its savepoint.")
+            raise
+
+        self.uncommitted += units
+        if self.uncommitted >= self.commit_every:
+            self.commit()
+
+    def _commit(self):
+        if self.uncommitted:
+            logging.info(f"Committing {self.uncommitted} units of work.")
+        self.transaction.commit()
+        self.uncommitted = 0
+
+    def commit(self):
+        """
+        Commits every unit released since the last commit, and whatever ran outside savepoints, and begins a new transaction.
+        """
+
+        self._commit()
+        self.transaction = self.conn.begin()
+
+    def rollback(self):
+        """
+        Rolls back every unit released since the last commit.
+        """
+
+        if self.uncommitted:
+            logging.warning(f"Rolled back {self.uncommitted} uncommitted units of work.")
+        self.transaction.rollback()
+        self.uncommitted = 0
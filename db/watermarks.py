@@ -0,0 +1,59 @@
+from __future__ import annotations
+from datetime import datetime
+from typing import TYPE_CHECKING, Iterable
+
+if TYPE_CHECKING:
+    from sqlalchemy import Connection
+
+def get_watermarks(conn: Connection, sensor_ids: Iterable[int]) -> dict[int, datetime]:
+    """
+    Reads the last loaded measurement datetime for each of the given sensors.
+
+    Args:
+        conn (Connection): SQLAlchemy connection to the airq database.
+        sensor_ids (Iterable[int]): Sensor ids to look up.
+
+    Returns:
+        watermarks (dict[int, datetime]): Mapping of sensor id to last loaded datetime. Sensors without any loaded measurements are left out.
+    """
+
+    from sqlalchemy import select
+    from db import models
+
+    sensor_ids = [int(sensor_id) for sensor_id in sensor_ids]
+    if not sensor_ids:
+        return {}
+
+    table = models.SensorWatermark
+    rows = conn.execute(
+            select(table.sensor_id, table.last_datetime).where(table.sensor_id.in_(sensor_ids))
+            )
+
+    return {sensor_id: last_datetime for sensor_id, last_datetime in rows}
+
+def update_watermarks(conn: Connection, watermarks: dict[int, datetime]):
+    """
+    Advances the watermark of each given sensor. A watermark never moves backwards.
+
+    Args:
+        conn (Connection): SQLAlchemy connection to the airq database. Should be the connection that loaded the measurements so both commit together.
+        watermarks (dict[int, datetime]): Mapping of sensor id to the newest datetime just loaded for that sensor.
+    """
+
+    from sqlalchemy import func
+    from sqlalchemy.dialects.postgresql import insert
+    from db import models
+
+    if not watermarks:
+        return
+
+    table = models.SensorWatermark.__table__
+    stmt = insert(table).values([
+        {"sensor_id": int(sensor_id), "last_datetime": last_datetime} for sensor_id, last_datetime in watermarks.items()
+        ])
+    stmt = stmt.on_conflict_do_update(
+            index_elements=[table.c.sensor_id],
+            set_={"last_datetime": func.greatest(table.c.last_datetime, stmt.excluded.last_datetime)}
+            )
+
+    conn.execute(stmt)
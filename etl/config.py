@@ -0,0 +1,34 @@
+import logging
+from dotenv import load_dotenv
+
+LOG_FORMAT = "%(asctime)s %(levelname)s: %(message)s"
+
+_env_loaded = False
+
+def load_env():
+    """
+    Loads the .env file into the environment, once per process.
+
+    Modules that read settings into constants at import time, e.g. DATA_DIR, call this first. Values already set in
+    the environment win over the .env file.
+    """
+
+    global _env_loaded
+
+    if not _env_loaded:
+        load_dotenv()
+        _env_loaded = True
+
+def init(level: int = logging.INFO):
+    """
+    Sets up the process for a command line entry point: loads the .env file and configures logging.
+
+    Library modules leave logging alone, so importing them, e.g. from Airflow or a notebook, does not override the
+    host's logging configuration. Every main() and the airq command line call this before doing any work.
+
+    Args:
+        level (int): Root logging level.
+    """
+
+    load_env()
+    logging.basicConfig(level=level, format=LOG_FORMAT)
@@ -0,0 +1,182 @@
+import logging
+import os
+import random
+import threading
+import time
+from etl.config import load_env
+import requests
+from requests.adapters import HTTPAdapter
+from etl.metrics import metrics
+
+load_env()
+
+API_BASE_URL = os.getenv("OPENAQ_API_BASE")
+API_KEY = os.getenv("API_KEY")
+
+CONNECT_TIMEOUT = float(os.getenv("OPENAQ_CONNECT_TIMEOUT", "5"))
+READ_TIMEOUT = float(os.getenv("OPENAQ_READ_TIMEOUT", "30"))
+POOL_SIZE = int(os.getenv("OPENAQ_POOL_SIZE", "32"))
+MAX_RETRIES = int(os.getenv("OPENAQ_MAX_RETRIES", "5"))
+BACKOFF_BASE = float(os.getenv("OPENAQ_BACKOFF_BASE", "0.5"))
+BACKOFF_MAX = float(os.getenv("OPENAQ_BACKOFF_MAX", "30"))
+# Requests per minute allowed before the API has told us its actual quota.
+RATE_LIMIT_PER_MINUTE = float(os.getenv("OPENAQ_RATE_LIMIT_PER_MINUTE", "60"))
+# Requests kept in reserve so we stay just under the quota reported by the API.
+RATE_LIMIT_RESERVE = int(os.getenv("OPENAQ_RATE_LIMIT_RESERVE", "1"))
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+class TokenBucket:
+    """
+    Thread-safe token bucket that paces requests to the OpenAQ API.
+
+    The bucket starts at a configured rate and is re-tuned from the x-ratelimit-* response headers, so the
+    remaining quota is spread evenly over what is left of the current rate-limit window.
+    """
+
+    def __init__(self, rate: float, capacity: float, reserve: int = RATE_LIMIT_RESERVE):
+        self.rate = rate
+        self.capacity = capacity
+        self.reserve = reserve
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self):
+        """
+        Blocks until a token is available and takes it.
+        """
+
+        while True:
+            with self.lock:
+                self._refill()
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+    def update_from_headers(self, headers):
+        """
+        Re-tunes the bucket from the rate-limit headers of an OpenAQ response.
+
+        Args:
+            headers (Mapping): Response headers. Missing or malformed rate-limit headers are ignored.
+        """
+
+        try:
+            remaining = int(headers["x-ratelimit-remaining"])
+            reset = float(headers["x-ratelimit-reset"])
+        except (KeyError, TypeError, ValueError):
+            return
+
+        with self.lock:
+            self._refill()
+            usable = max(remaining - self.reserve, 0)
+            self.tokens = min(self.tokens, usable)
+            if reset > 0:
+                self.rate = max(usable, 1) / reset
+            if "x-ratelimit-limit" in headers:
+                try:
+                    self.capacity = max(int(headers["x-ratelimit-limit"]) - self.reserve, 1)
+                except ValueError:
+                    pass
+
+class OpenAQClient:
+    """
+    Shared HTTP client for the OpenAQ API.
+
+    Keeps one pooled keep-alive session, applies connect and read timeouts to every request, retries
+    429 and 5xx responses with jittered exponential backoff, and paces requests through a TokenBucket.
+    """
+
+    def __init__(self, base_url: str = API_BASE_URL, api_key: str = API_KEY, pool_size: int = POOL_SIZE,
+                 timeout: tuple = (CONNECT_TIMEOUT, READ_TIMEOUT), max_retries: int = MAX_RETRIES):
+        self.base_url = base_url.rstrip("/") if base_url else base_url
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.bucket = TokenBucket(rate=RATE_LIMIT_PER_MINUTE / 60, capacity=RATE_LIMIT_PER_MINUTE)
+
+        self.session = requests.Session()
+        self.session.headers.update({"X-API-KEY": api_key or ""})
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def _backoff(self, attempt: int, response: requests.Response | None = None) -> float:
+        if response is not None and response.headers.get("Retry-After", "").isdigit():
+            return float(response.headers["Retry-After"])
+        return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt))
+
+    def get(self, path: str, params: dict | None = None) -> requests.Response:
+        """
+        Sends a GET request to an OpenAQ endpoint, retrying on throttling, server errors and dropped connections.
+
+        Args:
+            path (str): Endpoint path relative to the API base, e.g. '/locations/8118/latest'.
+            params (dict | None): Query string parameters.
+
+        Raises:
+            requests.RequestException: If the request still fails once retries are exhausted.
+
+        Returns:
+            response (requests.Response): Successful response.
+        """
+
+        url = f"{self.base_url}{path}"
+
+        for attempt in range(self.max_retries + 1):
+            self.bucket.acquire()
+            try:
+                response = self.session.get(url, params=params, timeout=self.timeout)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                metrics.inc("http_errors", error=type(e).__name__)
+                if attempt == self.max_retries:
+                    raise
+                delay = self._backoff(attempt)
+                logging.warning(f"Request to {path} failed ({e}). Retrying in {delay:.1f}s.")
+                time.sleep(delay)
+                continue
+
+            self.bucket.update_from_headers(response.headers)
+            metrics.inc("http_responses", status=response.status_code)
+            metrics.inc("bytes_downloaded", len(response.content))
+
+            if response.status_code in RETRY_STATUSES and attempt < self.max_retries:
+                delay = self._backoff(attempt, response)
+                logging.warning(f"Request to {path} returned {response.status_code}. Retrying in {delay:.1f}s.")
+                time.sleep(delay)
+                continue
+
+            response.raise_for_status()
+            return response
+
+    def get_json(self, path: str, params: dict | None = None) -> dict:
+        """
+        Same as get, but returns the decoded json body.
+        """
+
+        return self.get(path, params=params).json()
+
+_client = None
+_client_lock = threading.Lock()
+
+def get_client() -> OpenAQClient:
+    """
+    Returns the process-wide OpenAQClient, creating it on first use.
+
+    Returns:
+        client (OpenAQClient): Shared client used by every fetcher in etl.ingestion.
+    """
+
+    global _client
+
+    with _client_lock:
+        if _client is None:
+            _client = OpenAQClient()
+        return _client
@@ -1,45 +1,52 @@
+from __future__ import annotations
 from datetime import datetime
 import argparse
 import logging
 import json
 from pathlib import Path
 import os
-from dotenv import load_dotenv
-import requests
+from typing import TYPE_CHECKING
+from etl.config import init, load_env
+from etl.metrics import metrics
 
-load_dotenv()
+if TYPE_CHECKING:
+    from etl.ingestion.raw_archive import ArchivedPayload, SegmentArchive
 
-logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s: %(message)s")
+load_env()
 
 RAW_DATA_DIR = Path(os.getenv("DATA_DIR")) / "raw"
-RAW_DATA_DIR.mkdir(parents=True, exist_ok=True)
-API_KEY = os.getenv("API_KEY")
-API_BASE_URL = os.getenv("OPENAQ_API_BASE")
 
-def fetch_country(country_id: int) -> Path:
+@metrics.timed("fetch", "country")
+def fetch_country(country_id: int, archive: SegmentArchive | None = None) -> Path | ArchivedPayload:
     """
     Calls the countries/country_id OpenAQ endpoint for a given country_id and saves the raw json data.
 
     Args:
         country_id (int): The country id as recognized by the OpenAQ API.
+        archive (SegmentArchive | None): Append the raw json to this archive instead of saving a loose file.
 
     Returns:
-        filepath (Path): Path object pointing to raw json file.
+        filepath (Path | ArchivedPayload): Path object pointing to raw json file, or the payload's place in the archive, which the transforms accept in place of a file.
     """
-    headers= {"X-API-KEY": API_KEY}
+
+    import requests
+    from etl.ingestion.client import get_client
 
     try:
         logging.info(f"Fetching data for country: {country_id}")
 
-        response = requests.get(f"{API_BASE_URL}/countries/{country_id}", headers=headers)
-        response.raise_for_status()
+        response = get_client().get(f"/countries/{country_id}")
         data = response.json()
 
-        timestamp = datetime.utcnow().strftime("%Y-%m-%dT%H%M%SZ")
-        filepath = RAW_DATA_DIR / f"country_{country_id}_{timestamp}.json"
+        if archive is not None:
+            filepath = archive.append("country", country_id, data)
+        else:
+            timestamp = datetime.utcnow().strftime("%Y-%m-%dT%H%M%SZ")
+            RAW_DATA_DIR.mkdir(parents=True, exist_ok=True)
+            filepath = RAW_DATA_DIR / f"country_{country_id}_{timestamp}.json"
 
-        with open(filepath, "w", encoding="utf-8") as f:
-            json.dump(data, f, ensure_ascii=True, indent=2)
+            with open(filepath, "w", encoding="utf-8") as f:
+                json.dump(data, f, ensure_ascii=True, indent=2)
 
         logging.info(f"Saved {len(data.get('results', []))} records to {filepath}")
 
@@ -51,6 +58,8 @@ def fetch_country(country_id: int) -> Path:
     return filepath
 
 def main():
+    init()
+
     parser = argparse.ArgumentParser(description="Fetch OpenAQ data for a specified country ID.")
     parser.add_argument("--country", required=True, help="Country id as recognized by the OpenAQ API.")
     args = parser.parse_args()
@@ -0,0 +1,45 @@
+import argparse
+import logging
+import os
+from typing import Iterator
+from etl.config import init, load_env
+from etl.ingestion.paginate import iter_pages
+
+load_env()
+
+LOCATIONS_PAGE_SIZE = int(os.getenv("LOCATIONS_PAGE_SIZE", "1000"))
+
+def iter_country_locations(country_id: int, limit: int = LOCATIONS_PAGE_SIZE, prefetch: bool = True) -> Iterator[dict]:
+    """
+    Pages through the locations OpenAQ API endpoint for every location in a country, without saving the responses.
+
+    Args:
+        country_id (int): The country id as recognized by the OpenAQ API.
+        limit (int): Locations per page. OpenAQ allows at most 1000.
+        prefetch (bool): Request the next page while the current one is being processed.
+
+    Raises:
+        requests.RequestException: If a page request fails.
+
+    Yields:
+        data (dict): Decoded json response for one page of locations.
+    """
+
+    logging.info(f"Fetching locations for country: {country_id}")
+
+    yield from iter_pages("/locations", {"countries_id": country_id}, limit=limit, prefetch=prefetch, step="country_locations")
+
+def main():
+    init()
+
+    parser = argparse.ArgumentParser(description="List the OpenAQ locations of a specified country ID.")
+    parser.add_argument("--country", required=True, help="Country id as recognized by the OpenAQ API.")
+    parser.add_argument("--limit", type=int, default=LOCATIONS_PAGE_SIZE, help="Locations per page.")
+    args = parser.parse_args()
+
+    for data in iter_country_locations(args.country, args.limit):
+        for r in data["results"]:
+            print(r["id"], r["name"])
+
+if __name__ == "__main__":
+    main()
@@ -1,46 +1,52 @@
+from __future__ import annotations
 from datetime import datetime
 import argparse
 import json
 from pathlib import Path
 import os
-from dotenv import load_dotenv
+from etl.config import init, load_env
 import logging
-import requests
+from typing import TYPE_CHECKING
+from etl.metrics import metrics
 
-load_dotenv()
+if TYPE_CHECKING:
+    from etl.ingestion.raw_archive import ArchivedPayload, SegmentArchive
 
-logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s: %(message)s")
+load_env()
 
-API_KEY = os.getenv("API_KEY")
-API_BASE_URL = os.getenv("OPENAQ_API_BASE")
 RAW_DATA_DIR = Path(os.getenv("DATA_DIR")) / "raw"
-RAW_DATA_DIR.mkdir(parents=True, exist_ok=True)
 
-def fetch_location(location_id: int) -> Path:
+@metrics.timed("fetch", "location")
+def fetch_location(location_id: int, archive: SegmentArchive | None = None) -> Path | ArchivedPayload:
     """
     Calls the /locations/location_id endpoint of the OpenAQ API to get location information.
 
     Args:
         location_id (int): Location id as recognized by the OpenAQ API.
+        archive (SegmentArchive | None): Append the raw json to this archive instead of saving a loose file.
 
     Returns:
-        filepath (Path): Path object that points to saved json data.
+        filepath (Path | ArchivedPayload): Path object that points to saved json data, or the payload's place in the archive, which the transforms accept in place of a file.
     """
 
-    headers = {"X-API-KEY": API_KEY}
+    import requests
+    from etl.ingestion.client import get_client
 
     try:
         logging.info(f"Fetching location information for location: {location_id}")
 
-        response = requests.get(f"{API_BASE_URL}/locations/{location_id}", headers=headers)
-        response.raise_for_status()
+        response = get_client().get(f"/locations/{location_id}")
         data = response.json()
 
-        timestamp = datetime.utcnow().strftime("%Y-%m-%dT%H%MSZ")
-        filepath = RAW_DATA_DIR / f"location_{location_id}_{timestamp}.json"
+        if archive is not None:
+            filepath = archive.append("location", location_id, data)
+        else:
+            timestamp = datetime.utcnow().strftime("%Y-%m-%dT%H%MSZ")
+            RAW_DATA_DIR.mkdir(parents=True, exist_ok=True)
+            filepath = RAW_DATA_DIR / f"location_{location_id}_{timestamp}.json"
 
-        with open(filepath, "w", encoding="utf-8") as f:
-            json.dump(data, f, ensure_ascii=True, indent=2)
+            with open(filepath, "w", encoding="utf-8") as f:
+                json.dump(data, f, ensure_ascii=True, indent=2)
 
         logging.info(f"Saved {len(data.get('results', []))} records to {filepath}")
     except requests.RequestException as e:
@@ -51,6 +57,8 @@ def fetch_location(location_id: int) -> Path:
     return filepath
 
 def main():
+    init()
+
     parser = argparse.ArgumentParser()
     parser.add_argument("--location", required=True, help="Location id as recognized by the OpenAQ API")
     args = parser.parse_args()
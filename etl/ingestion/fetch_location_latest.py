@@ -1,57 +1,113 @@
+from __future__ import annotations
 import argparse
-import requests
 import os
-import json
 from datetime import datetime
+from functools import partial
 from pathlib import Path
 import logging
-from dotenv import load_dotenv
+from typing import TYPE_CHECKING, Callable, Iterable
+from etl.config import init, load_env
+from etl.metrics import metrics
+from etl.ingestion.fetch_many import fetch_many, FETCH_CONCURRENCY
 
-load_dotenv()
+if TYPE_CHECKING:
+    from etl.ingestion.raw_archive import ArchivedPayload, SegmentArchive
 
-logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s: %(message)s")
+load_env()
 
-API_BASE_URL = os.getenv("OPENAQ_API_BASE")
-API_KEY = os.getenv("API_KEY")
 RAW_DATA_DIR = Path(os.getenv("DATA_DIR")) / "raw"
-RAW_DATA_DIR.mkdir(parents=True, exist_ok=True)
 
-def fetch_location_latest(location_id: int) -> Path:
+@metrics.timed("fetch", "location_latest")
+def fetch_location_latest_data(location_id: int) -> bytes:
+    """
+    Calls the locations/location_id/latest OpenAQ API endpoint for a given location_id and returns the raw json body without saving it.
+
+    The body is left undecoded so transform_location_latest_records can decode it straight into typed records.
+
+    Args:
+        location_id (int): The location id as recognized by the OpenAQ API.
+
+    Raises:
+        requests.RequestException: If the request fails.
+
+    Returns:
+        data (bytes): Raw json response body.
+    """
+
+    from etl.ingestion.client import get_client
+
+    logging.info(f"Fetching data for location: {location_id}")
+    response = get_client().get(f"/locations/{location_id}/latest")
+
+    return response.content
+
+def fetch_location_latest(location_id: int, archive: SegmentArchive | None = None) -> Path | ArchivedPayload:
     """
     Calls the locations/location_id/latest OpenAQ API endpoint for a given location_id. Saves raw json data.
 
     Args:
         location_id (int): The location id as recognized by the OpenAQ API.
+        archive (SegmentArchive | None): Append the raw json to this archive instead of saving a loose file.
+
+    Raises:
+        requests.RequestException: If the request fails, so callers can tell e.g. a retired location's 404 from a timeout.
 
     Returns:
-        filepath (Path): Path object that points to saved json data.
+        filepath (Path | ArchivedPayload): Path object that points to saved json data, or the payload's place in the archive, which the transforms accept in place of a file.
     """
-    headers = {
-        "X-API-KEY": API_KEY
-    }
+
+    import requests
 
     try:
-        logging.info(f"Fetching data for location: {location_id}")
-        response = requests.get(f"{API_BASE_URL}/locations/{location_id}/latest", headers=headers)
-        response.raise_for_status()
-        data = response.json()
+        data = fetch_location_latest_data(location_id)
+
+        with metrics.timer("fetch", "save_raw"):
+            if archive is not None:
+                filepath = archive.append("location_latest", location_id, data)
+            else:
+                timestamp = datetime.utcnow().strftime("%Y-%m-%dT%H%M%SZ")
+                RAW_DATA_DIR.mkdir(parents=True, exist_ok=True)
+                filepath = RAW_DATA_DIR / f"location_latest_{location_id}_{timestamp}.json"
 
-        timestamp = datetime.utcnow().strftime("%Y-%m-%dT%H%M%SZ")
-        filepath = RAW_DATA_DIR / f"location_latest_{location_id}_{timestamp}.json"
+                filepath.write_bytes(data)
 
-        with open(filepath, "w", encoding="utf-8") as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
-        
-        logging.info(f"Saved {len(data.get('results', []))} records to {filepath}")
+        logging.info(f"Saved {len(data)} bytes of raw data for location {location_id} to {filepath}")
 
     except requests.RequestException as e:
         logging.error(f"Error fetching data from OpenAQ: {e}")
+        raise
     except Exception as e:
         logging.error(f"Unexpected error: {e}")
 
     return filepath
 
+def fetch_locations_latest_many(location_ids: Iterable[int], concurrency: int = FETCH_CONCURRENCY, archive: SegmentArchive | None = None,
+                                on_error: Callable | None = None) -> dict[int, Path | ArchivedPayload]:
+    """
+    Calls the locations/location_id/latest OpenAQ API endpoint for many locations concurrently. Saves raw json data for each.
+
+    Args:
+        location_ids (Iterable[int]): Location ids as recognized by the OpenAQ API.
+        concurrency (int): Maximum number of requests in flight.
+        archive (SegmentArchive | None): Append the raw json to this archive instead of saving loose files.
+        on_error (Callable | None): Called with the location id and the exception of every fetch that failed.
+
+    Returns:
+        filepaths (dict[int, Path | ArchivedPayload]): Mapping of location id to saved json data, or to its place in the archive. Locations that failed to fetch are left out.
+    """
+
+    location_ids = list(location_ids)
+    logging.info(f"Fetching latest data for {len(location_ids)} locations with concurrency {concurrency}.")
+
+    filepaths = fetch_many(partial(fetch_location_latest, archive=archive), location_ids, concurrency, on_error)
+
+    logging.info(f"Fetched latest data for {len(filepaths)} of {len(location_ids)} locations.")
+
+    return filepaths
+
 def main():
+    init()
+
     parser = argparse.ArgumentParser(description="Fetch OpenAQ data for a specified city.")
     parser.add_argument("--location", required=True, help="Location id as recognized by the OpenAQ API.")
     args = parser.parse_args()
@@ -1,45 +1,70 @@
+from __future__ import annotations
 import argparse
-import requests
 import os
 import json
 from pathlib import Path
 import logging
-from dotenv import load_dotenv
+from etl.config import init, load_env
+from etl.ingestion.paginate import iter_results
+from etl.metrics import metrics
 from datetime import datetime
+from typing import TYPE_CHECKING
 
-load_dotenv()
+if TYPE_CHECKING:
+    from etl.ingestion.raw_archive import ArchivedPayload, SegmentArchive
 
-logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s: %(message)s")
+load_env()
 
-API_BASE_URL = os.getenv("OPENAQ_API_BASE")
-API_KEY = os.getenv("API_KEY")
 RAW_DATA_DIR = Path(os.getenv("DATA_DIR")) / "raw"
-RAW_DATA_DIR.mkdir(parents=True, exist_ok=True)
 
-def fetch_location_sensors(location_id: int) -> Path:
+@metrics.timed("fetch", "location_sensors")
+def fetch_location_sensors_data(location_id: int) -> dict:
+    """
+    Calls the locations/location_id/sensors OpenAQ API endpoint for a given location_id and returns the decoded json without saving it.
+
+    Every page of sensors is requested, so the results array holds all of the location's sensors.
+
+    Args:
+        location_id (int): The location id as recognized by the OpenAQ API.
+
+    Raises:
+        requests.RequestException: If the request fails.
+
+    Returns:
+        data (dict): Decoded json response.
+    """
+
+    logging.info(f"Fetching sensor data for location: {location_id}")
+    results = list(iter_results(f"/locations/{location_id}/sensors", prefetch=False, step=None))
+
+    return {"results": results}
+
+def fetch_location_sensors(location_id: int, archive: SegmentArchive | None = None) -> Path | ArchivedPayload:
     """
     Calls the locations/location_id/sensors OpenAQ API endpoint for a given location_id. Saves the raw json data.
 
     Args:
         location_id (int): The location id as recognized by the OpenAQ API.
+        archive (SegmentArchive | None): Append the raw json to this archive instead of saving a loose file.
 
     Returns:
-        filepath (Path): Path object that points to raw json file.
+        filepath (Path | ArchivedPayload): Path object that points to raw json file, or the payload's place in the archive, which the transforms accept in place of a file.
     """
-    headers = {
-            "X-API-KEY": API_KEY
-            }
+
+    import requests
     try:
-        logging.info(f"Fetching sensor data for location: {location_id}")
-        response = requests.get(f"{API_BASE_URL}/locations/{location_id}/sensors", headers=headers)
-        response.raise_for_status()
-        data = response.json()
+        data = fetch_location_sensors_data(location_id)
 
-        timestamp = datetime.utcnow().strftime("%Y-%m-%dT%H%M%SZ")
-        filepath = RAW_DATA_DIR / f"location_sensors_{location_id}_{timestamp}.json"
+        with metrics.timer("fetch", "save_raw"):
+            if archive is not None:
+                filepath = archive.append("location_sensors", location_id, data)
+            else:
+                timestamp = datetime.utcnow().strftime("%Y-%m-%dT%H%M%SZ")
+                RAW_DATA_DIR.mkdir(parents=True, exist_ok=True)
+                filepath = RAW_DATA_DIR / f"location_sensors_{location_id}_{timestamp}.json"
 
-        with open(filepath, "w", encoding="utf-8") as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
+                with open(filepath, "w", encoding="utf-8") as f:
+                    json.dump(data, f, ensure_ascii=False, indent=2)
 
         logging.info(f"Saved sensor data for location {location_id} to {filepath}.")
 
@@ -51,6 +76,8 @@ def fetch_location_sensors(location_id: int) -> Path:
     return filepath
 
 def main():
+    init()
+
     parser = argparse.ArgumentParser(description="Fetch OpenAQ sensor data for a specified location.")
     parser.add_argument("--location", required=True, help="Location id as recognized by the OpenAQ API.")
     args = parser.parse_args()
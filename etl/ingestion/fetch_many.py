@@ -0,0 +1,91 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import logging
+import os
+from typing import AsyncIterator, Callable, Hashable, Iterable
+from etl.config import load_env
+from etl.metrics import metrics
+
+load_env()
+
+FETCH_CONCURRENCY = int(os.getenv("FETCH_CONCURRENCY", "16"))
+
+async def fetch_concurrently(fetch: Callable, keys: Iterable[Hashable], concurrency: int = FETCH_CONCURRENCY, on_error: Callable | None = None) -> AsyncIterator[tuple]:
+    """
+    Runs a blocking fetch function for many keys at once and yields results as they complete.
+
+    `concurrency` workers take keys one at a time and run each call on a dedicated thread. Finished results wait in
+    a queue of at most `concurrency` entries, and a worker does not start its next call until its result fits, so a
+    consumer slower than the fetches, e.g. one loading every result into the database, holds at most twice
+    `concurrency` results in memory however many keys there are. A call that raises is logged and skipped, so one
+    failing key never stops the others.
+
+    Args:
+        fetch (Callable): Blocking function taking a single key, e.g. fetch_location_latest.
+        keys (Iterable[Hashable]): Keys to fetch, e.g. location ids.
+        concurrency (int): Maximum number of calls in flight.
+        on_error (Callable | None): Called with the key and the exception of every call that raised, e.g. to checkpoint it.
+
+    Yields:
+        (key, result) (tuple): The key and the value returned by fetch for that key.
+    """
+
+    if concurrency < 1:
+        raise ValueError(f"Expected concurrency of at least 1. Got {concurrency}")
+
+    loop = asyncio.get_running_loop()
+    keys = iter(keys)
+    results = asyncio.Queue(maxsize=concurrency)
+    finished = object()
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+
+        async def worker():
+            # Workers share the keys iterator, so each key is fetched once.
+            for key in keys:
+                try:
+                    result = key, await loop.run_in_executor(executor, fetch, key), None
+                except Exception as e:
+                    result = key, None, e
+                await results.put(result)
+            await results.put(finished)
+
+        workers = [asyncio.create_task(worker()) for _ in range(concurrency)]
+        try:
+            running = len(workers)
+            while running:
+                item = await results.get()
+                if item is finished:
+                    running -= 1
+                    continue
+                key, result, error = item
+                if error is not None:
+                    logging.error(f"Error while fetching data for {key}: {error}. Skipping.")
+                    metrics.inc("failures", stage="fetch")
+                    if on_error is not None:
+                        on_error(key, error)
+                    continue
+                yield key, result
+        finally:
+            for task in workers:
+                task.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+
+async def _collect(fetch: Callable, keys: Iterable[Hashable], concurrency: int, on_error: Callable | None) -> dict:
+    return {key: result async for key, result in fetch_concurrently(fetch, keys, concurrency, on_error)}
+
+def fetch_many(fetch: Callable, keys: Iterable[Hashable], concurrency: int = FETCH_CONCURRENCY, on_error: Callable | None = None) -> dict:
+    """
+    Blocking wrapper around fetch_concurrently that collects every successful result.
+
+    Args:
+        fetch (Callable): Blocking function taking a single key.
+        keys (Iterable[Hashable]): Keys to fetch.
+        concurrency (int): Maximum number of calls in flight.
+        on_error (Callable | None): Called with the key and the exception of every call that raised.
+
+    Returns:
+        results (dict): Mapping of key to fetch result. Keys whose fetch failed are left out.
+    """
+
+    return asyncio.run(_collect(fetch, keys, concurrency, on_error))
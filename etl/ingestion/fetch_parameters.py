@@ -1,42 +1,50 @@
+from __future__ import annotations
+import argparse
 import json
 from pathlib import Path
 import logging
-from dotenv import load_dotenv
+from etl.config import init, load_env
 from datetime import datetime
-import requests
+from etl.metrics import metrics
 import os
+from typing import TYPE_CHECKING
 
-load_dotenv()
+if TYPE_CHECKING:
+    from etl.ingestion.raw_archive import ArchivedPayload, SegmentArchive
 
-logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s: %(message)s")
+load_env()
 
-API_BASE_URL = os.getenv("OPENAQ_API_BASE")
-API_KEY = os.getenv("API_KEY")
 RAW_DATA_DIR = Path(os.getenv("DATA_DIR")) / "raw"
-RAW_DATA_DIR.mkdir(parents=True, exist_ok=True)
 
-def fetch_parameters() -> Path:
+@metrics.timed("fetch", "parameters")
+def fetch_parameters(archive: SegmentArchive | None = None) -> Path | ArchivedPayload:
     """
     Calls the /parameters endpoint of the OpenAQ API to get information on the API's parameters. Saves raw json data.
 
+    Args:
+        archive (SegmentArchive | None): Append the raw json to this archive instead of saving a loose file.
+
     Returns:
-        filepath (Path): Path object that points to raw json file.
+        filepath (Path | ArchivedPayload): Path object that points to raw json file, or the payload's place in the archive, which the transforms accept in place of a file.
     """
-    headers = {
-            "X-API-KEY": API_KEY
-            }
+
+    import requests
+    from etl.ingestion.client import get_client
 
     try:
         logging.info(f"Fetching parameter data.")
-        response = requests.get(f"{API_BASE_URL}/parameters", headers=headers)
-        response.raise_for_status()
+        response = get_client().get("/parameters")
         data = response.json()
 
-        timestamp = datetime.utcnow().strftime("%Y-%m-%dT%H%M%SZ")
-        filepath = RAW_DATA_DIR / f"parameters_{timestamp}.json"
+        if archive is not None:
+            filepath = archive.append("parameters", "all", data)
+        else:
+            timestamp = datetime.utcnow().strftime("%Y-%m-%dT%H%M%SZ")
+            RAW_DATA_DIR.mkdir(parents=True, exist_ok=True)
+            filepath = RAW_DATA_DIR / f"parameters_{timestamp}.json"
 
-        with open(filepath, "w", encoding="utf-8") as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
+            with open(filepath, "w", encoding="utf-8") as f:
+                json.dump(data, f, ensure_ascii=False, indent=2)
 
         logging.info(f"Saved parameter data to {filepath}.")
 
@@ -48,6 +56,11 @@ def fetch_parameters() -> Path:
     return filepath
 
 def main():
+    init()
+
+    parser = argparse.ArgumentParser(description="Fetch every parameter from the OpenAQ API.")
+    parser.parse_args()
+
     fetch_parameters()
 
 if __name__ == "__main__":
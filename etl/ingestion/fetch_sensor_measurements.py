@@ -0,0 +1,52 @@
+import argparse
+from datetime import datetime
+import json
+import logging
+from etl.config import init, load_env
+from etl.ingestion.paginate import iter_results, PAGE_LIMIT
+from etl.metrics import metrics
+
+load_env()
+
+@metrics.timed("fetch", "sensor_measurements")
+def fetch_sensor_measurements_data(sensor_id: int, datetime_from: datetime, datetime_to: datetime, limit: int = PAGE_LIMIT) -> dict:
+    """
+    Calls the sensors/sensor_id/measurements OpenAQ API endpoint for a time range and returns the decoded json without saving it.
+
+    Every page of the range is requested, so the results array holds all of the sensor's measurements in the range.
+
+    Args:
+        sensor_id (int): The sensor id as recognized by the OpenAQ API.
+        datetime_from (datetime): Start of the range, in UTC.
+        datetime_to (datetime): End of the range, in UTC.
+        limit (int): Measurements per page.
+
+    Raises:
+        requests.RequestException: If a request fails.
+
+    Returns:
+        data (dict): {'results': [...]} with the measurements of every page.
+    """
+
+    params = {
+            "datetime_from": datetime_from.strftime("%Y-%m-%dT%H:%M:%SZ"),
+            "datetime_to": datetime_to.strftime("%Y-%m-%dT%H:%M:%SZ"),
+            }
+    logging.info(f"Fetching measurements for sensor {sensor_id} from {params['datetime_from']} to {params['datetime_to']}")
+    results = list(iter_results(f"/sensors/{sensor_id}/measurements", params, limit=limit, prefetch=False, step=None))
+
+    return {"results": results}
+
+def main():
+    init()
+
+    parser = argparse.ArgumentParser(description="Fetch historical OpenAQ measurements for a sensor.")
+    parser.add_argument("--sensor", required=True, type=int, help="Sensor id as recognized by the OpenAQ API.")
+    parser.add_argument("--start", required=True, type=datetime.fromisoformat, help="Start of the range in UTC, e.g. 2025-01-01.")
+    parser.add_argument("--end", required=True, type=datetime.fromisoformat, help="End of the range in UTC, e.g. 2025-01-08.")
+    args = parser.parse_args()
+
+    print(json.dumps(fetch_sensor_measurements_data(args.sensor, args.start, args.end), indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+import logging
+import os
+from typing import Iterator
+from etl.config import load_env
+from etl.metrics import metrics
+
+load_env()
+
+PAGE_LIMIT = int(os.getenv("OPENAQ_PAGE_LIMIT", "1000"))
+
+def _fetch_page(path: str, params: dict, page: int, limit: int, step: str | None) -> dict:
+    # Imported here so PAGE_LIMIT can be read without loading requests.
+    from etl.ingestion.client import get_client
+
+    with metrics.timer("fetch", step) if step else nullcontext():
+        logging.info(f"Fetching page {page} of {path}")
+        return get_client().get(path, params={**params, "page": page, "limit": limit}).json()
+
+def _is_last_page(data: dict, page: int, limit: int) -> bool:
+    found = data.get("meta", {}).get("found")
+    if isinstance(found, int) and page * limit >= found:
+        return True
+    return len(data.get("results", [])) < limit
+
+def iter_pages(path: str, params: dict | None = None, limit: int = PAGE_LIMIT, prefetch: bool = True, step: str | None = "pages") -> Iterator[dict]:
+    """
+    Pages through an OpenAQ list endpoint and yields each decoded page as it arrives.
+
+    Paging stops at the first page with fewer than `limit` results, or once meta.found results have been
+    covered. With prefetch, the next page is requested on a background thread while the caller processes the
+    current one, so at most two pages are held in memory.
+
+    Args:
+        path (str): Endpoint path relative to the API base, e.g. '/locations'.
+        params (dict | None): Query string parameters other than page and limit.
+        limit (int): Results per page. OpenAQ allows at most 1000.
+        prefetch (bool): Request the next page while the current one is being processed.
+        step (str | None): Name to record page fetch times under in etl.metrics. None skips timing.
+
+    Raises:
+        requests.RequestException: If a page request fails.
+
+    Yields:
+        data (dict): Decoded json response for one page.
+    """
+
+    params = dict(params or {})
+    executor = ThreadPoolExecutor(max_workers=1) if prefetch else None
+
+    try:
+        page = 1
+        data = _fetch_page(path, params, page, limit, step)
+
+        while data.get("results"):
+            is_last = _is_last_page(data, page, limit)
+            next_data = None
+            if not is_last and executor is not None:
+                next_data = executor.submit(_fetch_page, path, params, page + 1, limit, step)
+
+            yield data
+
+            if is_last:
+                return
+            page += 1
+            data = next_data.result() if next_data is not None else _fetch_page(path, params, page, limit, step)
+    finally:
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+def iter_results(path: str, params: dict | None = None, limit: int = PAGE_LIMIT, prefetch: bool = True, step: str | None = "pages") -> Iterator[dict]:
+    """
+    Same as iter_pages, but yields the individual records of every page's results array.
+    """
+
+    for data in iter_pages(path, params, limit, prefetch, step):
+        yield from data["results"]
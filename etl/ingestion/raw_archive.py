@@ -0,0 +1,239 @@
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import datetime
+import fcntl
+import gzip
+import json
+import logging
+import os
+from pathlib import Path
+import threading
+from typing import Iterator, NamedTuple
+from etl.config import load_env
+import msgspec
+
+load_env()
+
+RAW_DATA_DIR = Path(os.getenv("DATA_DIR")) / "raw"
+RAW_ARCHIVE_DIR = RAW_DATA_DIR / "archive"
+# 'segments' appends raw payloads to compressed hourly segments, 'files' writes one json file per payload.
+RAW_ARCHIVE_FORMAT = os.getenv("RAW_ARCHIVE_FORMAT", "segments")
+
+class ArchivedPayload(NamedTuple):
+    """
+    Where SegmentArchive.append put a payload, which is all SegmentArchive.read needs to find it again.
+
+    name is the name the payload would have had as a loose file in RAW_DATA_DIR, so the file transforms accept an
+    ArchivedPayload in place of a raw file path, see read_raw.
+    """
+
+    archive_dir: Path
+    kind: str
+    key: str
+    fetched_at: datetime
+
+    @property
+    def name(self) -> str:
+        return f"{self.kind}_{self.key}_{self.fetched_at:%Y-%m-%dT%H%M%SZ}.json"
+
+    @property
+    def segment_path(self) -> Path:
+        return SegmentArchive(self.archive_dir).segment_path(self.kind, self.fetched_at)
+
+    def read(self) -> dict:
+        return SegmentArchive(self.archive_dir).read(self.kind, self.key, self.fetched_at)
+
+    def __str__(self) -> str:
+        return f"{self.segment_path} ({self.kind} {self.key})"
+
+class SegmentArchive:
+    """
+    Append-only archive of raw OpenAQ payloads in rolling compressed NDJSON segments, one per kind and UTC hour.
+
+    Segments live at RAW_ARCHIVE_DIR/{kind}/{YYYY-MM-DD}/{HH}.ndjson.gz. Each payload is written as its own gzip
+    member, so a segment is still one valid gzip stream of NDJSON while any single payload can be decompressed
+    on its own. A sidecar {HH}.idx file records one json line per payload with its key, fetch time, byte offset
+    and length, which is all read() needs to find it.
+
+    Shards of one run share the data volume and append to the same segments, so each append holds an exclusive
+    flock on the segment while it writes the payload and its index line.
+    """
+
+    def __init__(self, archive_dir: Path = RAW_ARCHIVE_DIR):
+        self.archive_dir = archive_dir
+        self.lock = threading.Lock()
+
+    def segment_path(self, kind: str, fetched_at: datetime) -> Path:
+        return self.archive_dir / kind / f"{fetched_at:%Y-%m-%d}" / f"{fetched_at:%H}.ndjson.gz"
+
+    def append(self, kind: str, key, data: dict | bytes, fetched_at: datetime | None = None) -> ArchivedPayload:
+        """
+        Appends a payload to the segment for its kind and hour.
+
+        Args:
+            kind (str): Payload type, e.g. 'location_latest'.
+            key: Identifier of the payload within its kind, e.g. the location id.
+            data (dict | bytes): Decoded json payload, or the raw json body as received.
+            fetched_at (datetime | None): UTC time the payload was fetched. Defaults to now.
+
+        Returns:
+            payload (ArchivedPayload): Where the payload was archived, to read it back with.
+        """
+
+        fetched_at = fetched_at or datetime.utcnow()
+        segment_path = self.segment_path(kind, fetched_at)
+        index_path = segment_path.with_name(f"{fetched_at:%H}.idx")
+        if isinstance(data, bytes):
+            # Raw bodies are re-emitted on one line without re-parsing them into Python objects.
+            line = msgspec.json.format(data, indent=0)
+        else:
+            line = json.dumps(data, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        member = gzip.compress(line + b"\n")
+
+        with self.lock:
+            segment_path.parent.mkdir(parents=True, exist_ok=True)
+            with open(segment_path, "ab") as f:
+                # flock is per open file, so it also excludes other processes, which the thread lock does not.
+                fcntl.flock(f, fcntl.LOCK_EX)
+                try:
+                    offset = f.seek(0, os.SEEK_END)
+                    f.write(member)
+                    f.flush()
+                    with open(index_path, "a", encoding="utf-8") as index:
+                        index.write(json.dumps({"key": str(key), "fetched_at": fetched_at.isoformat(), "offset": offset, "length": len(member)}) + "\n")
+                finally:
+                    fcntl.flock(f, fcntl.LOCK_UN)
+
+        return ArchivedPayload(self.archive_dir, kind, str(key), fetched_at)
+
+    def read(self, kind: str, key, fetched_at: datetime) -> dict:
+        """
+        Reads a single payload back without decompressing the rest of its segment.
+
+        Args:
+            kind (str): Payload type, e.g. 'location_latest'.
+            key: Identifier of the payload within its kind, e.g. the location id.
+            fetched_at (datetime): Fetch time of the payload. Selects the hourly segment; if the key was archived
+                more than once that hour, the latest payload fetched at or before this time is returned.
+
+        Raises:
+            KeyError: If no matching payload is archived.
+
+        Returns:
+            data (dict): Decoded json payload.
+        """
+
+        segment_path = self.segment_path(kind, fetched_at)
+        index_path = segment_path.with_name(f"{fetched_at:%H}.idx")
+        if not index_path.exists():
+            raise KeyError(f"No {kind} archive segment for {fetched_at:%Y-%m-%d %H}:00")
+
+        match = None
+        with open(index_path, "r", encoding="utf-8") as f:
+            for line in f:
+                entry = json.loads(line)
+                if entry["key"] == str(key) and datetime.fromisoformat(entry["fetched_at"]) <= fetched_at:
+                    match = entry
+
+        if match is None:
+            raise KeyError(f"No {kind} payload for {key} archived at or before {fetched_at}")
+
+        with open(segment_path, "rb") as f:
+            f.seek(match["offset"])
+            member = f.read(match["length"])
+
+        return json.loads(gzip.decompress(member))
+
+    def iter_segment(self, segment_path: Path) -> Iterator[dict]:
+        """
+        Yields every payload in a segment, in the order they were archived.
+        """
+
+        with gzip.open(segment_path, "rt", encoding="utf-8") as f:
+            for line in f:
+                yield json.loads(line)
+
+def read_raw(filename: Path | ArchivedPayload) -> bytes | dict:
+    """
+    Reads a raw payload saved by a fetcher, from its loose json file in RAW_DATA_DIR or from the archive.
+
+    Args:
+        filename (Path | ArchivedPayload): Path object that points to the raw json file, or the payload's place in a SegmentArchive.
+
+    Raises:
+        KeyError: If an archived payload is not in its segment.
+
+    Returns:
+        data (bytes | dict): Raw json body of a loose file, or the decoded payload of an archived one.
+    """
+
+    if isinstance(filename, ArchivedPayload):
+        return filename.read()
+
+    return (RAW_DATA_DIR / filename.name).read_bytes()
+
+class RawArchiver:
+    """
+    Saves raw OpenAQ payloads on a background thread, so archiving stays off the ingestion hot path.
+
+    Payloads go to a SegmentArchive, or with RAW_ARCHIVE_FORMAT=files to one compact json file each in
+    RAW_DATA_DIR. Use as a context manager, or call close() to wait for pending writes.
+    """
+
+    def __init__(self, raw_dir: Path = RAW_DATA_DIR, archive_format: str = RAW_ARCHIVE_FORMAT):
+        if archive_format not in ("segments", "files"):
+            raise ValueError(f"Expected archive format 'segments' or 'files'. Got {archive_format}")
+
+        self.raw_dir = raw_dir
+        self.segments = SegmentArchive() if archive_format == "segments" else None
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="raw-archive")
+
+    def _write(self, filepath: Path, data: dict | bytes):
+        try:
+            filepath.parent.mkdir(parents=True, exist_ok=True)
+            if isinstance(data, bytes):
+                filepath.write_bytes(data)
+                return
+            with open(filepath, "w", encoding="utf-8") as f:
+                json.dump(data, f, ensure_ascii=False)
+        except Exception as e:
+            logging.error(f"Error archiving raw data to {filepath}: {e}")
+
+    def _append(self, kind: str, key, data: dict | bytes, fetched_at: datetime):
+        try:
+            self.segments.append(kind, key, data, fetched_at)
+        except Exception as e:
+            logging.error(f"Error archiving raw {kind} data for {key}: {e}")
+
+    def submit(self, kind: str, key, data: dict | bytes) -> Future:
+        """
+        Queues a payload to be archived, as {kind}_{key}_{timestamp}.json in 'files' format.
+
+        Args:
+            kind (str): Payload type, e.g. 'location_latest'.
+            key: Identifier of the payload within its kind, e.g. the location id.
+            data (dict | bytes): Decoded json payload, or the raw json body as received.
+
+        Returns:
+            future (Future): Completes once the payload is written.
+        """
+
+        fetched_at = datetime.utcnow()
+        if self.segments is not None:
+            return self.executor.submit(self._append, kind, key, data, fetched_at)
+
+        filepath = self.raw_dir / f"{kind}_{key}_{fetched_at:%Y-%m-%dT%H%M%SZ}.json"
+
+        return self.executor.submit(self._write, filepath, data)
+
+    def close(self):
+        """
+        Waits for pending writes and stops the background thread.
+        """
+
+        self.executor.shutdown(wait=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,345 @@
+from __future__ import annotations
+from datetime import date, datetime, time, timedelta
+import io
+import logging
+import os
+from pathlib import Path
+from typing import TYPE_CHECKING
+from etl.config import load_env
+
+if TYPE_CHECKING:
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+    from sqlalchemy import Connection
+
+load_env()
+
+LAKEHOUSE_DIR = Path(os.getenv("LAKEHOUSE_DIR", Path(os.getenv("DATA_DIR", ".")) / "lakehouse" / "measurements"))
+LAKEHOUSE_ROW_GROUP_ROWS = int(os.getenv("LAKEHOUSE_ROW_GROUP_ROWS", "65536"))
+PART_FILENAME = "part-0.parquet"
+
+# Country first so country filters skip row groups too, then each sensor's rows in time order.
+SORT_KEYS = [("country_id", "ascending"), ("sensor_id", "ascending"), ("datetime", "ascending")]
+
+def lakehouse_schema() -> pa.Schema:
+    """
+    Returns the columns stored in every file. date and parameter_id live in the partition path.
+    """
+
+    import pyarrow as pa
+
+    return pa.schema([
+            ("datetime", pa.timestamp("us")),
+            ("sensor_id", pa.int32()),
+            ("location_id", pa.int32()),
+            ("country_id", pa.int32()),
+            ("value", pa.float64()),
+            ])
+
+def lakehouse_partitioning() -> ds.Partitioning:
+    """
+    Returns the hive partitioning of the dataset, by date and then parameter_id.
+    """
+
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+
+    return ds.partitioning(pa.schema([("date", pa.date32()), ("parameter_id", pa.int32())]), flavor="hive")
+
+def partition_path(day: date, parameter_id: int, root: Path = LAKEHOUSE_DIR) -> Path:
+    """
+    Returns the parquet file holding one day of measurements of one parameter.
+    """
+
+    return root / f"date={day.isoformat()}" / f"parameter_id={parameter_id}" / PART_FILENAME
+
+def exported_counts(days: list[date], root: Path = LAKEHOUSE_DIR) -> dict[tuple[date, int], int]:
+    """
+    Counts the rows already exported per day and parameter, from the parquet footers alone.
+
+    Args:
+        days (list[date]): Days to look at.
+        root (Path): Root of the lakehouse dataset.
+
+    Returns:
+        counts (dict[tuple[date, int], int]): Mapping of (day, parameter_id) to number of exported rows.
+    """
+
+    import pyarrow.parquet as pq
+
+    counts = {}
+    for day in days:
+        for filepath in (root / f"date={day.isoformat()}").glob(f"parameter_id=*/{PART_FILENAME}"):
+            parameter_id = int(filepath.parent.name.split("=", 1)[1])
+            counts[(day, parameter_id)] = pq.read_metadata(filepath).num_rows
+
+    return counts
+
+def source_counts(conn: Connection, since: date | None = None, until: date | None = None) -> dict[tuple[date, int], int]:
+    """
+    Counts the measurements in Postgres per day and parameter, from the daily rollups rather than the raw rows.
+
+    Args:
+        conn (Connection): SQLAlchemy connection to the airq database.
+        since (date | None): First day to count.
+        until (date | None): Last day to count.
+
+    Returns:
+        counts (dict[tuple[date, int], int]): Mapping of (day, parameter_id) to number of measurements.
+    """
+
+    from sqlalchemy import text
+
+    filters = ["TRUE"]
+    params = {}
+    if since is not None:
+        filters.append("d.bucket >= :since")
+        params["since"] = datetime.combine(since, time())
+    if until is not None:
+        filters.append("d.bucket <= :until")
+        params["until"] = datetime.combine(until, time())
+
+    rows = conn.execute(text(f"""
+        SELECT d.bucket::date, s.parameter_id, sum(d.count)
+        FROM measurements_daily d
+        JOIN sensors s ON s.id = d.sensor_id
+        WHERE {" AND ".join(filters)}
+        GROUP BY 1, 2
+        """), params)
+
+    return {(day, parameter_id): int(count) for day, parameter_id, count in rows if parameter_id is not None}
+
+def fetch_day(conn: Connection, day: date, parameter_ids: list[int]) -> pa.Table:
+    """
+    Reads one day of measurements of some parameters, with their sensor's location and country, as an Arrow table.
+
+    Rows are streamed out with COPY ... TO STDOUT and parsed with Arrow's CSV reader, the reverse of
+    etl.load.copy_loader.copy_to_staging.
+
+    Args:
+        conn (Connection): SQLAlchemy connection to the airq database.
+        day (date): Day to read, in UTC.
+        parameter_ids (list[int]): Parameters to read.
+
+    Returns:
+        table (pa.Table): lakehouse_schema() columns plus parameter_id.
+    """
+
+    import pyarrow as pa
+    import pyarrow.csv as pcsv
+
+    start = datetime.combine(day, time())
+    params = {"start": start, "end": start + timedelta(days=1), "parameter_ids": tuple(int(parameter_id) for parameter_id in parameter_ids)}
+
+    with conn.connection.cursor() as cursor:
+        # COPY takes no bind parameters, so they are rendered into the query by the driver.
+        query = cursor.mogrify("""
+            SELECT m.datetime, m.sensor_id, s.location_id, l.country_id, m.value, s.parameter_id
+            FROM measurements m
+            JOIN sensors s ON s.id = m.sensor_id
+            LEFT JOIN locations l ON l.id = s.location_id
+            WHERE m.datetime >= %(start)s AND m.datetime < %(end)s AND s.parameter_id IN %(parameter_ids)s
+            """, params).decode("utf-8")
+        buffer = io.BytesIO()
+        cursor.copy_expert(f"COPY ({query}) TO STDOUT WITH (FORMAT csv, ENCODING 'UTF8')", buffer)
+        buffer.seek(0)
+
+    schema = lakehouse_schema().append(pa.field("parameter_id", pa.int32()))
+    return pcsv.read_csv(
+            buffer,
+            read_options=pcsv.ReadOptions(column_names=schema.names),
+            convert_options=pcsv.ConvertOptions(column_types=schema),
+            )
+
+def write_partition(table: pa.Table, day: date, parameter_id: int, root: Path = LAKEHOUSE_DIR) -> Path:
+    """
+    Writes one day of measurements of one parameter to its parquet file, replacing the previous file atomically.
+
+    Rows are sorted by SORT_KEYS and written in row groups of LAKEHOUSE_ROW_GROUP_ROWS, each with min/max statistics,
+    so readers filtering on country, sensor or time skip the row groups that cannot match.
+
+    Args:
+        table (pa.Table): Rows with at least the lakehouse_schema() columns.
+        day (date): Day of the rows.
+        parameter_id (int): Parameter of the rows.
+        root (Path): Root of the lakehouse dataset.
+
+    Returns:
+        filepath (Path): Path object that points to the parquet file.
+    """
+
+    import pyarrow.parquet as pq
+
+    schema = lakehouse_schema()
+    table = table.select(schema.names).cast(schema).sort_by(SORT_KEYS)
+    filepath = partition_path(day, parameter_id, root)
+    filepath.parent.mkdir(parents=True, exist_ok=True)
+    # Dataset discovery ignores dot files, so readers never see a half-written part.
+    tmp_filepath = filepath.with_name(f".{filepath.name}.tmp")
+
+    pq.write_table(
+            table,
+            tmp_filepath,
+            row_group_size=LAKEHOUSE_ROW_GROUP_ROWS,
+            compression="zstd",
+            write_statistics=True,
+            sorting_columns=pq.SortingColumn.from_ordering(schema, SORT_KEYS),
+            )
+    os.replace(tmp_filepath, filepath)
+
+    return filepath
+
+def export_measurements(conn: Connection, since: date | None = None, until: date | None = None, root: Path = LAKEHOUSE_DIR) -> dict:
+    """
+    Incrementally exports measurements to the lakehouse dataset, partitioned by date and parameter.
+
+    The number of measurements per day and parameter in Postgres, taken from the daily rollups, is compared with the
+    number of rows in the exported parquet footers. Only partitions that gained rows since they were written, e.g.
+    the current day or days that were backfilled, are read back from Postgres and rewritten. Partitions whose rows
+    were since removed from Postgres, e.g. by retiring old monthly partitions, are left as they are.
+
+    Args:
+        conn (Connection): SQLAlchemy connection to the airq database.
+        since (date | None): First day to export. Defaults to the first day with measurements.
+        until (date | None): Last day to export. Defaults to the last day with measurements.
+        root (Path): Root of the lakehouse dataset.
+
+    Returns:
+        summary (dict): Number of partitions and rows written.
+    """
+
+    import pyarrow.compute as pc
+
+    counts = source_counts(conn, since, until)
+    exported = exported_counts(sorted({day for day, _ in counts}), root)
+    stale = sorted(key for key, count in counts.items() if count > exported.get(key, 0))
+
+    stale_days = {}
+    for day, parameter_id in stale:
+        stale_days.setdefault(day, []).append(parameter_id)
+
+    logging.info(f"Exporting {len(stale)} of {len(counts)} partitions over {len(stale_days)} days to {root}.")
+
+    rows = 0
+    for day, parameter_ids in stale_days.items():
+        table = fetch_day(conn, day, parameter_ids)
+        for parameter_id in parameter_ids:
+            partition = table.filter(pc.equal(table["parameter_id"], parameter_id))
+            if len(partition) != counts[(day, parameter_id)]:
+                logging.warning(f"Exported {len(partition)} measurements of parameter {parameter_id} on {day}, but the daily rollups count "
+                                f"{counts[(day, parameter_id)]}. Rebuild the rollups with `python -m db.rollups` if this persists.")
+            write_partition(partition, day, parameter_id, root)
+            rows += len(partition)
+        logging.info(f"Exported {len(table)} measurements for {day}.")
+
+    return {"partitions": len(stale), "rows": rows}
+
+def _ids_filter(column: str, ids: list[int] | None) -> ds.Expression | None:
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+
+    if not ids:
+        return None
+    return ds.field(column).isin(pa.array([int(value) for value in ids], pa.int32()))
+
+def measurements_filter(start: datetime | None = None, end: datetime | None = None, parameter_ids: list[int] | None = None,
+                        country_ids: list[int] | None = None, location_ids: list[int] | None = None, sensor_ids: list[int] | None = None) -> ds.Expression | None:
+    """
+    Builds the dataset filter of a lakehouse query.
+
+    Time and parameter conditions are stated on the date and parameter_id partition columns as well, so whole files
+    are pruned from their paths before any footer is read. The rest is left to the row-group statistics.
+
+    Returns:
+        expression (ds.Expression | None): Filter for pyarrow.dataset scans, or None to read everything.
+    """
+
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+
+    conditions = []
+    if start is not None:
+        conditions.append(ds.field("date") >= pa.scalar(start.date(), pa.date32()))
+        conditions.append(ds.field("datetime") >= pa.scalar(start, pa.timestamp("us")))
+    if end is not None:
+        conditions.append(ds.field("date") <= pa.scalar((end - timedelta(microseconds=1)).date(), pa.date32()))
+        conditions.append(ds.field("datetime") < pa.scalar(end, pa.timestamp("us")))
+    for column, ids in (("parameter_id", parameter_ids), ("country_id", country_ids), ("location_id", location_ids), ("sensor_id", sensor_ids)):
+        condition = _ids_filter(column, ids)
+        if condition is not None:
+            conditions.append(condition)
+
+    expression = None
+    for condition in conditions:
+        expression = condition if expression is None else expression & condition
+
+    return expression
+
+def lakehouse_dataset(root: Path = LAKEHOUSE_DIR) -> ds.Dataset:
+    """
+    Opens the lakehouse dataset, with date and parameter_id as partition columns.
+
+    Raises:
+        FileNotFoundError: If root does not exist.
+    """
+
+    import pyarrow.dataset as ds
+
+    if not root.exists():
+        raise FileNotFoundError(f"{root} does not exist")
+
+    return ds.dataset(root, format="parquet", partitioning=lakehouse_partitioning())
+
+def read_measurements(start: datetime | None = None, end: datetime | None = None, parameter_ids: list[int] | None = None,
+                      country_ids: list[int] | None = None, location_ids: list[int] | None = None, sensor_ids: list[int] | None = None,
+                      columns: list[str] | None = None, root: Path = LAKEHOUSE_DIR) -> pa.Table:
+    """
+    Reads measurements from the lakehouse dataset, e.g. a year of PM2.5 across a country, without touching Postgres.
+
+    Filters are pushed down into the scan: files are pruned by their date and parameter partitions, and row groups
+    by their country, location, sensor and datetime statistics, so only matching row groups are read and decoded.
+
+    Args:
+        start (datetime | None): Start of the range, in UTC.
+        end (datetime | None): End of the range, in UTC, exclusive.
+        parameter_ids (list[int] | None): Only these parameters.
+        country_ids (list[int] | None): Only locations in these countries.
+        location_ids (list[int] | None): Only these locations.
+        sensor_ids (list[int] | None): Only these sensors.
+        columns (list[str] | None): Columns to read. Defaults to all, including date and parameter_id.
+        root (Path): Root of the lakehouse dataset.
+
+    Raises:
+        FileNotFoundError: If root does not exist.
+
+    Returns:
+        table (pa.Table): Matching measurements.
+    """
+
+    dataset = lakehouse_dataset(root)
+    expression = measurements_filter(start, end, parameter_ids, country_ids, location_ids, sensor_ids)
+
+    return dataset.to_table(columns=columns, filter=expression)
+
+def scan_plan(start: datetime | None = None, end: datetime | None = None, parameter_ids: list[int] | None = None,
+              country_ids: list[int] | None = None, location_ids: list[int] | None = None, sensor_ids: list[int] | None = None,
+              root: Path = LAKEHOUSE_DIR) -> dict:
+    """
+    Reports how many files and row groups a read_measurements call with the same filters would scan.
+
+    Returns:
+        plan (dict): Files and row groups that would be scanned, and the totals in the dataset.
+    """
+
+    dataset = lakehouse_dataset(root)
+    expression = measurements_filter(start, end, parameter_ids, country_ids, location_ids, sensor_ids)
+
+    fragments = list(dataset.get_fragments())
+    matching = list(dataset.get_fragments(filter=expression)) if expression is not None else fragments
+
+    return {
+            "files": len(matching),
+            "row_groups": sum(len(fragment.split_by_row_group(filter=expression, schema=dataset.schema)) for fragment in matching),
+            "total_files": len(fragments),
+            "total_row_groups": sum(fragment.metadata.num_row_groups for fragment in fragments),
+            }
@@ -0,0 +1,79 @@
+from __future__ import annotations
+import io
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    import pandas as pd
+    import pyarrow as pa
+    from sqlalchemy import Connection
+
+def to_arrow(df: pd.DataFrame | pa.Table) -> pa.Table:
+    """
+    Returns the rows as an Arrow table, converting a pandas dataframe if needed.
+    """
+
+    import pyarrow as pa
+
+    if isinstance(df, pa.Table):
+        return df
+    return pa.Table.from_pandas(df, preserve_index=False)
+
+def drop_duplicate_keys(table: pa.Table, key: list[str]) -> pa.Table:
+    """
+    Keeps only the last row for each key, like pandas' drop_duplicates(subset=key, keep='last').
+
+    Args:
+        table (pa.Table): Rows to deduplicate.
+        key (list[str]): Columns that identify a row.
+
+    Returns:
+        table (pa.Table): One row per key, with the table's original column order.
+    """
+
+    others = [column for column in table.column_names if column not in key]
+    if not others:
+        deduplicated = table.group_by(key, use_threads=False).aggregate([])
+    else:
+        deduplicated = table.group_by(key, use_threads=False).aggregate([(column, "last") for column in others])
+        deduplicated = deduplicated.rename_columns([*key, *others])
+
+    return deduplicated.select(table.column_names)
+
+def copy_to_staging(conn: Connection, df: pd.DataFrame | pa.Table, table: str) -> str:
+    """
+    Streams a dataframe or Arrow table into a temporary staging copy of a table with COPY ... FROM STDIN.
+
+    The staging table has the same column types as the target table for the dataframe's columns, lives only
+    for the current transaction and is emptied before every copy, so it can be reused within one transaction.
+    Arrow tables are serialized with Arrow's CSV writer, without converting them to pandas first.
+
+    Args:
+        conn (Connection): SQLAlchemy connection to the airq database, inside a transaction.
+        df (pd.DataFrame | pa.Table): Rows to stage. Column names must match columns of the target table.
+        table (str): Name of the target table, e.g. 'measurements'.
+
+    Returns:
+        staging_table (str): Name of the temporary staging table holding the rows.
+    """
+
+    import pyarrow as pa
+    import pyarrow.csv as pcsv
+    from sqlalchemy import text
+
+    staging_table = f"{table}_staging"
+    columns = ", ".join(df.column_names if isinstance(df, pa.Table) else df.columns)
+
+    conn.execute(text(f"CREATE TEMP TABLE IF NOT EXISTS {staging_table} ON COMMIT DROP AS SELECT {columns} FROM {table} WITH NO DATA"))
+    conn.execute(text(f"TRUNCATE {staging_table}"))
+
+    if isinstance(df, pa.Table):
+        buffer = io.BytesIO()
+        pcsv.write_csv(df, buffer, pcsv.WriteOptions(include_header=False))
+        buffer.seek(0)
+    else:
+        buffer = io.BytesIO(df.to_csv(index=False, header=False).encode("utf-8"))
+
+    with conn.connection.cursor() as cursor:
+        cursor.copy_expert(f"COPY {staging_table} ({columns}) FROM STDIN WITH (FORMAT csv, ENCODING 'UTF8')", buffer)
+
+    return staging_table
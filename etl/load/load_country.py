@@ -1,16 +1,17 @@
+from __future__ import annotations
 import argparse
-import pandas as pd
 from pathlib import Path
-from dotenv import load_dotenv
+from etl.config import init, load_env
 import os
 import logging
-from sqlalchemy.exc import SQLAlchemyError
+from typing import TYPE_CHECKING
 from db.db import get_db
-from sqlalchemy.orm import Session
+from etl.load.upsert import upsert_dataframe
 
-load_dotenv()
+if TYPE_CHECKING:
+    from sqlalchemy.orm import Session
 
-logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s: %(message)s")
+load_env()
 
 CLEAN_DATA_DIR = Path(os.getenv("DATA_DIR")) / "clean"
 
@@ -18,6 +19,8 @@ def load_country(filename: Path, db: Session):
     """
     Loads clean parquet data into countries db table.
 
+    Existing rows with the same id are updated in place, so loading the same file again is safe.
+
     Args:
         filename (Path): Path object that points to filename of the clean parquet data.
         db (Session): SQLAlchemy session object connected to airq database.
@@ -26,6 +29,9 @@ def load_country(filename: Path, db: Session):
         ValueError: If file is not .parquet, parquet file is empty or contains improper column names, or filename does not contain 'country'.
     """
 
+    import pandas as pd
+    from sqlalchemy.exc import SQLAlchemyError
+
     if not filename.name.endswith(".parquet"):
         raise ValueError(f"Expected parquet file. Got {filename}")
     if 'country' not in filename.name:
@@ -43,14 +49,17 @@ def load_country(filename: Path, db: Session):
     engine = db.get_bind()
     try:
         logging.info(f"Loading {len(df)} records into countries table.")
-        df.to_sql("countries", engine, if_exists="append", index=False)
-        logging.info("Succesfully loaded data for country {country_id} into database.")
+        with engine.begin() as conn:
+            upsert_dataframe(conn, df, "countries")
+        logging.info(f"Succesfully loaded data for country {country_id} into database.")
     except SQLAlchemyError as e:
         logging.error(f"Error writing to database: {e}")
     except Exception as e:
         logging.error(f"Unexpected error writing to database: {e}")
 
 def main():
+    init()
+
     parser = argparse.ArgumentParser()
     parser.add_argument("--filename", required=True, help="Filename of parquet data to be uploaded to database.")
     args = parser.parse_args()
@@ -1,31 +1,40 @@
+from __future__ import annotations
 from pathlib import Path
 import logging
 import argparse
-from sqlalchemy.exc import SQLAlchemyError
-import pandas as pd
 import os
-from dotenv import load_dotenv
+from typing import TYPE_CHECKING
+from etl.config import init, load_env
 from db.db import get_db
-from sqlalchemy.orm import Session
+from etl.load.upsert import upsert_dataframe
 
-load_dotenv()
+if TYPE_CHECKING:
+    from sqlalchemy import Connection
+    from sqlalchemy.orm import Session
 
-logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s: %(message)s")
+load_env()
 
 CLEAN_DATA_DIR = Path(os.getenv("DATA_DIR")) / "clean"
 
-def load_location(filename: Path, db: Session):
+def load_location(filename: Path, db: Session, conn: Connection | None = None):
     """
     Loads clean parquet data into db locations table."
 
+    Existing rows with the same id are updated in place, so loading the same file again is safe.
+
     Args:
         filename (Path): Path object that points to filename of the clean parquet file to be written to database.
         db (Session): SQLAlchemy database session.
+        conn (Connection | None): Upsert within this connection's transaction, e.g. a db.unit_of_work.UnitOfWork savepoint.
+            Errors are then raised, so the savepoint rolls back, instead of logged.
 
     Raises:
         ValueError: If filename is not .parquet, no records are present in the file, or 'location' is not in the filename.
     """
 
+    from sqlalchemy.exc import SQLAlchemyError
+    import pandas as pd
+
     if not filename.name.endswith(".parquet"):
         raise ValueError(f"Expected .parquet file. Got {filename}")
     if not 'location' in filename.name:
@@ -41,16 +50,24 @@ def load_location(filename: Path, db: Session):
     location_id = int(df.loc[0].id)
     engine = db.get_bind()
 
+    if conn is not None:
+        logging.info(f"Loading {len(df)} records into locations table.")
+        upsert_dataframe(conn, df, "locations")
+        return
+
     try:
         logging.info(f"Loading {len(df)} records into locations table.")
-        df.to_sql("locations", engine, if_exists="append", index=False)
-        logging.info("Succesfully added location {location_id} to database.")
+        with engine.begin() as conn:
+            upsert_dataframe(conn, df, "locations")
+        logging.info(f"Succesfully added location {location_id} to database.")
     except SQLAlchemyError as e:
         logging.error(f"Error writing to database: {e}")
     except Exception as e:
         logging.error(f"Unexpected error while writing to locations table: {e}")
 
 def main():
+    init()
+
     parser = argparse.ArgumentParser()
     parser.add_argument("--filename", required=True, help="Filename of the parquet file containing location information to be written to database.")
     args = parser.parse_args()
@@ -1,31 +1,243 @@
-import pandas as pd
+from __future__ import annotations
+from contextlib import nullcontext
+from datetime import datetime, timedelta
 from pathlib import Path
 import argparse
 import logging
 import os
-from dotenv import load_dotenv
-from sqlalchemy.exc import SQLAlchemyError
-from sqlalchemy.orm import Session
+import time
+from uuid import uuid4
+from typing import TYPE_CHECKING
+from etl.config import init, load_env
 from db.db import get_db
+from db.dimensions import DimensionCache, get_dimensions
+from db.latest import merge_latest_sql
+from db.rollups import merge_rollups_sql
+from db.watermarks import get_watermarks, update_watermarks
+from etl.load.copy_loader import copy_to_staging, drop_duplicate_keys, to_arrow
+from etl.metrics import metrics
 
-load_dotenv()
+if TYPE_CHECKING:
+    import pandas as pd
+    import pyarrow as pa
+    from sqlalchemy import Connection
+    from sqlalchemy.orm import Session
 
-logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s: %(message)s")
+load_env()
 
 CLEAN_DATA_DIR = Path(os.getenv("DATA_DIR")) / "clean"
+MEASUREMENTS_DATASET_DIR = CLEAN_DATA_DIR / "measurements"
+DATASET_LOAD_ROWS = int(os.getenv("DATASET_LOAD_ROWS", "500000"))
+ORPHANS_DIR = Path(os.getenv("DATA_DIR")) / "orphans"
+ORPHAN_POLICY = os.getenv("ORPHAN_POLICY", "queue")
+ORPHAN_POLICIES = ("queue", "drop")
+# Queued orphans older than this are dropped, so readings of sensors that are never onboarded do not pile up.
+ORPHAN_RETENTION_DAYS = float(os.getenv("ORPHAN_RETENTION_DAYS", "7"))
 
-def load_location_latest(filename: Path, db: Session):
+_orphans_pruned = False
+
+def measurements_table(df: pd.DataFrame | pa.Table) -> pa.Table:
+    """
+    Normalizes measurements to an Arrow table of naive UTC datetime, int64 sensor_id and float64 value, without rows missing a value.
+
+    Args:
+        df (pd.DataFrame | pa.Table): Measurements with datetime, sensor_id and value columns. datetime may be ISO 8601
+            strings, timezone-aware timestamps, or naive timestamps already in UTC.
+
+    Raises:
+        ValueError: If there are no rows or the columns are improper.
+
+    Returns:
+        table (pa.Table): Normalized measurements.
+    """
+
+    import pyarrow as pa
+
+    table = to_arrow(df)
+    if len(table)==0 or table.column_names!=["datetime", "sensor_id", "value"]:
+        raise ValueError("Improper measurements dataframe")
+
+    datetimes = table["datetime"]
+    if pa.types.is_string(datetimes.type) or pa.types.is_large_string(datetimes.type):
+        datetimes = datetimes.cast(pa.timestamp("us", tz="UTC"))
+    if datetimes.type.tz is not None:
+        datetimes = datetimes.cast(pa.timestamp("us", tz="UTC"))
+    datetimes = datetimes.cast(pa.timestamp("us"), safe=False)
+
+    return pa.table({
+        "datetime": datetimes,
+        "sensor_id": table["sensor_id"].cast(pa.int64()),
+        "value": table["value"].cast(pa.float64()),
+        }).drop_null()
+
+def drop_seen_measurements(table: pa.Table, watermarks: dict) -> pa.Table:
+    """
+    Drops measurements at or before their sensor's watermark, and duplicates within the table itself.
+
+    Args:
+        table (pa.Table): Measurements as returned by measurements_table.
+        watermarks (dict): Mapping of sensor id to last loaded datetime, as returned by db.watermarks.get_watermarks.
+
+    Returns:
+        table (pa.Table): Only the measurements newer than their sensor's watermark.
+    """
+
+    import pyarrow as pa
+    import pyarrow.compute as pc
+
+    table = drop_duplicate_keys(table, ["sensor_id", "datetime"])
+    if not watermarks:
+        return table
+
+    last_seen = pa.table({
+        "sensor_id": pa.array(list(watermarks), pa.int64()),
+        "last_seen": pa.array(list(watermarks.values()), pa.timestamp("us")),
+        })
+    joined = table.join(last_seen, "sensor_id", join_type="left outer")
+    newer = pc.or_kleene(pc.is_null(joined["last_seen"]), pc.greater(joined["datetime"], joined["last_seen"]))
+
+    return joined.filter(newer).select(table.column_names)
+
+def drop_orphan_measurements(table: pa.Table, dimensions: DimensionCache, policy: str = ORPHAN_POLICY) -> pa.Table:
+    """
+    Drops measurements whose sensor is not in the sensors table, so they never reach Postgres as foreign key errors.
+
+    Args:
+        table (pa.Table): Measurements as returned by measurements_table.
+        dimensions (DimensionCache): Cache of known sensor ids.
+        policy (str): 'queue' also writes the orphan rows to ORPHANS_DIR so replay_orphans can load them once their
+            sensors are onboarded, 'drop' discards them. Rows measured more than ORPHAN_RETENTION_DAYS ago are
+            never queued, and the first queueing in a process prunes expired files, see prune_orphans.
+
+    Raises:
+        ValueError: If policy is not one of ORPHAN_POLICIES.
+
+    Returns:
+        table (pa.Table): Only the measurements of known sensors.
+    """
+
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.parquet as pq
+
+    global _orphans_pruned
+
+    if policy not in ORPHAN_POLICIES:
+        raise ValueError(f"Expected orphan policy to be one of {ORPHAN_POLICIES}. Got {policy}")
+
+    known = dimensions.known_sensors(table["sensor_id"])
+    orphans = table.filter(pc.invert(known))
+    if len(orphans)==0:
+        return table
+
+    sensor_ids = sorted(pc.unique(orphans["sensor_id"]).to_pylist())
+    metrics.inc("rows_orphaned", len(orphans), table="measurements")
+
+    if policy == "queue":
+        if not _orphans_pruned:
+            prune_orphans()
+            _orphans_pruned = True
+
+        cutoff = pa.scalar(datetime.utcnow() - timedelta(days=ORPHAN_RETENTION_DAYS), pa.timestamp("us"))
+        expired = pc.less(orphans["datetime"], cutoff)
+        if pc.any(expired).as_py():
+            logging.warning(f"Dropped {pc.sum(expired).as_py()} measurements for unknown sensors older than {ORPHAN_RETENTION_DAYS} days.")
+            orphans = orphans.filter(pc.invert(expired))
+
+        if len(orphans):
+            ORPHANS_DIR.mkdir(parents=True, exist_ok=True)
+            timestamp = datetime.utcnow().strftime("%Y-%m-%dT%H%M%SZ")
+            orphans_filepath = ORPHANS_DIR / f"measurements_{timestamp}_{uuid4().hex[:8]}.parquet"
+            pq.write_table(orphans, orphans_filepath)
+            logging.warning(f"Queued {len(orphans)} measurements for unknown sensors {sensor_ids} to {orphans_filepath}.")
+    else:
+        logging.warning(f"Dropped {len(orphans)} measurements for unknown sensors {sensor_ids}.")
+
+    return table.filter(known)
+
+@metrics.timed("load", "measurements")
+def load_measurements(df: pd.DataFrame | pa.Table, db: Session, use_watermarks: bool = True, conn: Connection | None = None) -> int:
+    """
+    Loads measurements, possibly spanning many locations, into the PostgreSQL measurements table.
+
+    Rows at or before their sensor's watermark, missing a value, or for a sensor missing from the sensors table
+    (see drop_orphan_measurements) are dropped before loading. The rest are streamed into a staging table with
+    COPY and merged into measurements in one statement, skipping any (sensor_id, datetime) already present. The same
+    statement adds the inserted rows to the hourly and daily rollups (see db.rollups) and moves latest_measurements
+    forward (see db.latest), so neither ever drifts from measurements.
+    Watermarks are advanced in the same transaction, so loading the same rows twice is a no-op. The transaction is
+    committed on its own unless conn is given, e.g. a db.unit_of_work.UnitOfWork savepoint. Filtering
+    and serialization run on Arrow tables, so Arrow input is never converted to pandas.
+
+    Args:
+        df (pd.DataFrame | pa.Table): Measurements with datetime, sensor_id and value columns.
+        db (Session): SQLAlchemy session object
+        use_watermarks (bool): Drop rows at or before their sensor's watermark. Backfills of historical data turn
+            this off and rely on the (sensor_id, datetime) unique index alone to skip rows already present.
+        conn (Connection | None): Load within this connection's transaction, which the caller commits, instead of in a new one.
+
+    Raises:
+        ValueError: If there are no rows or the columns are improper.
+
+    Returns:
+        loaded (int): Number of new records written.
+    """
+
+    import pyarrow.compute as pc
+    from sqlalchemy import text
+
+    received = len(df)
+    table = measurements_table(df)
+    engine = db.get_bind()
+    table = drop_orphan_measurements(table, get_dimensions(engine))
+    start = time.perf_counter()
+
+    with engine.begin() if conn is None else nullcontext(conn) as conn:
+        if use_watermarks:
+            new_table = drop_seen_measurements(table, get_watermarks(conn, pc.unique(table["sensor_id"]).to_pylist()))
+        else:
+            new_table = drop_duplicate_keys(table, ["sensor_id", "datetime"])
+        if len(new_table)==0:
+            logging.info(f"No new measurements. Skipped {received} records.")
+            metrics.inc("rows_skipped", received, table="measurements")
+            return 0
+
+        staging_table = copy_to_staging(conn, new_table, "measurements")
+        loaded = conn.execute(text(f"""
+            WITH inserted AS (
+                INSERT INTO measurements (datetime, sensor_id, value)
+                SELECT datetime, sensor_id, value FROM {staging_table}
+                ON CONFLICT (sensor_id, datetime) DO NOTHING
+                RETURNING sensor_id, datetime, value
+                ){merge_rollups_sql("inserted")}{merge_latest_sql("inserted")}
+            SELECT count(*) FROM inserted
+            """)).scalar()
+        last_loaded = new_table.group_by("sensor_id").aggregate([("datetime", "max")])
+        update_watermarks(conn, dict(zip(last_loaded["sensor_id"].to_pylist(), last_loaded["datetime_max"].to_pylist())))
+
+    elapsed = time.perf_counter() - start
+    logging.info(f"Loaded {loaded} records into measurements in {elapsed:.2f}s ({loaded/elapsed:.0f} rows/s). Skipped {received-loaded} records.")
+    metrics.inc("rows_written", loaded, table="measurements")
+    metrics.inc("rows_skipped", received - loaded, table="measurements")
+
+    return loaded
+
+def load_location_latest(filename: Path, db: Session, conn: Connection | None = None):
     """
     Loads clean parquet data into PostgreSQL measurements table.
 
     Args:
         filename (Path): Path object that points to the filename of the clean parquet data.
         db (Session): SQLAlchemy session object
+        conn (Connection | None): Load within this connection's transaction, e.g. a db.unit_of_work.UnitOfWork savepoint.
 
     Raises:
         ValueError: If file is not .parquet, parquet file is empty or contains improper columns, or filename does not contain 'location_latest'. 
+        SQLAlchemyError: If writing to the database fails, so callers such as hourly ingestion can mark the location failed.
     """
 
+    import pyarrow.parquet as pq
+
     if not filename.name.endswith(".parquet"):
         raise ValueError(f"Expected parquet file. Got {filename}")
     if "location_latest" not in filename.name:
@@ -37,32 +249,136 @@ def load_location_latest(filename: Path, db: Session):
     if not filepath.exists():
         raise FileNotFoundError(f"{filepath} does not exist")
 
-    df = pd.read_parquet(filepath)
+    table = pq.read_table(filepath)
     
-    if len(df)==0 or list(df.columns)!=["datetime", "sensor_id", "value"]:
+    if len(table)==0 or table.column_names!=["datetime", "sensor_id", "value"]:
         raise ValueError(f"Improper dataframe from {filename}")
     file_split = filename.split("_")
     location_id = file_split[file_split.index("latest")+1]
-    engine = db.get_bind()
-    
-    try:
-        logging.info(f"Loading {len(df)} records into measurements.")
-        df.to_sql("measurements", engine, if_exists="append", index=False)
-        logging.info("Succesfully updated measurements for location {location_id}.")
-    except SQLAlchemyError as e:
-        logging.error(f"Error writing to database: {e}")
-    except Exception as e:
-        logging.error(f"Unexpected error: {e}")
+
+    load_measurements(table, db, conn=conn)
+    logging.info(f"Succesfully updated measurements for location {location_id}.")
+
+def load_measurements_dataset(path: Path, db: Session, date: str | None = None, hour: int | None = None, conn: Connection | None = None) -> int:
+    """
+    Loads measurements from the Hive-partitioned measurements dataset into the PostgreSQL measurements table.
+
+    Args:
+        path (Path): A parquet part, a partition directory or the dataset root. Relative paths are resolved against CLEAN_DATA_DIR.
+        db (Session): SQLAlchemy session object
+        date (str | None): Only load the date=YYYY-MM-DD partition.
+        hour (int | None): Only load the hour=HH partition.
+        conn (Connection | None): Load within this connection's transaction, which the caller commits, instead of one transaction per batch.
+
+    Raises:
+        FileNotFoundError: If path does not exist.
+
+    Returns:
+        loaded (int): Number of new records written.
+    """
+
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+
+    path = path if path.is_absolute() else CLEAN_DATA_DIR / path
+    if not path.exists():
+        raise FileNotFoundError(f"{path} does not exist")
+
+    dataset = ds.dataset(path, format="parquet", partitioning="hive")
+
+    row_filter = None
+    if date is not None and "date" in dataset.schema.names:
+        row_filter = ds.field("date") == date
+    if hour is not None and "hour" in dataset.schema.names:
+        hour_filter = ds.field("hour") == int(hour)
+        row_filter = hour_filter if row_filter is None else row_filter & hour_filter
+
+    loaded = 0
+    for record_batch in dataset.to_batches(columns=["datetime", "sensor_id", "value"], filter=row_filter, batch_size=DATASET_LOAD_ROWS):
+        if record_batch.num_rows == 0:
+            continue
+        loaded += load_measurements(pa.Table.from_batches([record_batch]), db, conn=conn)
+
+    logging.info(f"Loaded {loaded} new records from {path}.")
+
+    return loaded
+
+def prune_orphans(retention_days: float = ORPHAN_RETENTION_DAYS) -> int:
+    """
+    Deletes orphan files in ORPHANS_DIR written more than retention_days ago.
+
+    Every row of such a file is older than the retention too, since rows are only queued while within it.
+
+    Args:
+        retention_days (float): Age in days after which queued orphans are given up on.
+
+    Returns:
+        pruned (int): Number of files deleted.
+    """
+
+    cutoff = time.time() - retention_days * 86400
+    pruned = 0
+    for orphans_filepath in ORPHANS_DIR.glob("measurements_*.parquet"):
+        if orphans_filepath.stat().st_mtime < cutoff:
+            orphans_filepath.unlink()
+            pruned += 1
+
+    if pruned:
+        logging.info(f"Pruned {pruned} orphan files older than {retention_days} days.")
+
+    return pruned
+
+def replay_orphans(db: Session) -> int:
+    """
+    Retries loading the measurements queued in ORPHANS_DIR. Rows whose sensors are still unknown are queued again,
+    unless they have expired, see prune_orphans.
+
+    Watermarks are not applied: by the time a sensor is onboarded, hourly ingestion has usually moved its watermark
+    past the queued rows. Like a backfill, the replay relies on the (sensor_id, datetime) unique index to skip rows
+    already loaded.
+
+    Args:
+        db (Session): SQLAlchemy session object
+
+    Returns:
+        loaded (int): Number of new records written.
+    """
+
+    import pyarrow.parquet as pq
+
+    prune_orphans()
+
+    loaded = 0
+    for orphans_filepath in sorted(ORPHANS_DIR.glob("measurements_*.parquet")):
+        loaded += load_measurements(pq.read_table(orphans_filepath), db, use_watermarks=False)
+        orphans_filepath.unlink()
+
+    logging.info(f"Loaded {loaded} previously orphaned records.")
+
+    return loaded
 
 def main():
+    init()
+
     parser = argparse.ArgumentParser(description="Load clean parquet data into PostgreSQL.")
-    parser.add_argument("--filename", required=True, help="Clean parquet filename to load into measurements table.")
+    parser.add_argument("--filename", help="Clean parquet filename to load into measurements table.")
+    parser.add_argument("--dataset", help="Part, partition directory or root of the partitioned measurements dataset to load.")
+    parser.add_argument("--date", help="Only load this date=YYYY-MM-DD partition of the dataset.")
+    parser.add_argument("--hour", type=int, help="Only load this hour=HH partition of the dataset.")
+    parser.add_argument("--replay-orphans", action="store_true", help="Retry loading measurements queued for unknown sensors.")
     args = parser.parse_args()
 
-    filepath = Path(args.filename)
+    if not args.filename and not args.dataset and not args.replay_orphans:
+        parser.error("one of --filename, --dataset or --replay-orphans is required")
+
     db = next(get_db())
     try:
-        load_location_latest(filepath, db)
+        if args.replay_orphans:
+            replay_orphans(db)
+        elif args.dataset:
+            load_measurements_dataset(Path(args.dataset), db, date=args.date, hour=args.hour)
+        else:
+            load_location_latest(Path(args.filename), db)
     finally:
         db.close()
 
@@ -1,31 +1,40 @@
-import pandas as pd
+from __future__ import annotations
 from pathlib import Path
 import argparse
 import logging
 import os
-from dotenv import load_dotenv
-from sqlalchemy.exc import SQLAlchemyError
+from typing import TYPE_CHECKING
+from etl.config import init, load_env
 from db.db import get_db
-from sqlalchemy.orm import Session
+from etl.load.upsert import upsert_dataframe
 
-load_dotenv()
+if TYPE_CHECKING:
+    from sqlalchemy import Connection
+    from sqlalchemy.orm import Session
 
-logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s: %(message)s")
+load_env()
 
 CLEAN_DATA_DIR = Path(os.getenv("DATA_DIR")) / "clean"
 
-def load_location_sensors(filename: Path, db: Session):
+def load_location_sensors(filename: Path, db: Session, conn: Connection | None = None):
     """
     Loads clean parquet data for a location's sensors into the sensors database table.
 
+    Existing rows with the same id are updated in place, so loading the same file again is safe.
+
     Args:
         filename (Path): Path object that points to the filename of the parquet file containing sensor data.
         db (Session): SQLAlchemy session object connected to airq database.
+        conn (Connection | None): Upsert within this connection's transaction, e.g. a db.unit_of_work.UnitOfWork savepoint.
+            Errors are then raised, so the savepoint rolls back, instead of logged.
 
     Raises:
         ValueError: If filename is not .parquet, parquet file is empty or contains improper columns, or does not include the string 'location_sensors'.
     """
 
+    import pandas as pd
+    from sqlalchemy.exc import SQLAlchemyError
+
     if not filename.name.endswith(".parquet"):
         raise ValueError(f"Expected .parquet file. Got {filename}")
     if not 'location_sensors' in filename.name:
@@ -42,16 +51,24 @@ def load_location_sensors(filename: Path, db: Session):
     engine = db.get_bind()
     location_id = int(df.loc[0].location_id)
 
+    if conn is not None:
+        logging.info(f"Loading {len(df)} records into sensors table.")
+        upsert_dataframe(conn, df, "sensors")
+        return
+
     try:
         logging.info(f"Loading {len(df)} records into sensors table.")
-        df.to_sql("sensors", engine, if_exists="append", index=False)
-        logging.info("Successfully loaded sensor data into database for location {location_id}.")
+        with engine.begin() as conn:
+            upsert_dataframe(conn, df, "sensors")
+        logging.info(f"Successfully loaded sensor data into database for location {location_id}.")
     except SQLAlchemyError as e:
         logging.error(f"Error writing to database: {e}")
     except Exception as e:
         logging.error(f"Unexpected error writing to sensors table: {e}")
 
 def main():
+    init()
+
     parser = argparse.ArgumentParser(description="Load clean parquet data into airq database.")
     parser.add_argument("--filename", required=True, help="Filename of parquet file containing sensor data to be uploaded.")
     args = parser.parse_args()
@@ -1,16 +1,17 @@
-import pandas as pd
+from __future__ import annotations
 from pathlib import Path
 import argparse
 import logging
 import os
-from dotenv import load_dotenv
-from sqlalchemy.exc import SQLAlchemyError
+from typing import TYPE_CHECKING
+from etl.config import init, load_env
 from db.db import get_db
-from sqlalchemy.orm import Session
+from etl.load.upsert import upsert_dataframe
 
-load_dotenv()
+if TYPE_CHECKING:
+    from sqlalchemy.orm import Session
 
-logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s: %(message)s")
+load_env()
 
 CLEAN_DATA_DIR = Path(os.getenv("DATA_DIR")) / "clean"
 
@@ -18,6 +19,8 @@ def load_parameters(filename: Path, db: Session):
     """
     Loads clean parquet parameter data into PostgreSQL parameters table.
 
+    Existing rows with the same id are updated in place, so loading the same file again is safe.
+
     Args:
         filename (Path): Path object that points to the file name of the clean parquet data.
         db (Session): SQLAlchemy session object.
@@ -26,6 +29,9 @@ def load_parameters(filename: Path, db: Session):
         ValueError: If file is not .parquet, parquet file is empty or contains improper column names, or 'parameters' is not in the filename.
     """
 
+    import pandas as pd
+    from sqlalchemy.exc import SQLAlchemyError
+
     if not filename.name.endswith(".parquet"):
         raise ValueError(f"Expected parquet file. Got {filename}")
     if not "parameters" in filename.name:
@@ -43,7 +49,8 @@ def load_parameters(filename: Path, db: Session):
     
     try:
         logging.info(f"Loading {len(df)} records into parameters.")
-        df.to_sql("parameters", engine, if_exists="append", index=False)
+        with engine.begin() as conn:
+            upsert_dataframe(conn, df, "parameters")
         logging.info("Load complete.")
     except SQLAlchemyError as e:
         logging.error(f"Error writing to database: {e}")
@@ -51,6 +58,8 @@ def load_parameters(filename: Path, db: Session):
         logging.error(f"Unexpected error writing to sensors table: {e}")
 
 def main():
+    init()
+
     parser = argparse.ArgumentParser(description="Load clean parquet data into airq database.")
     parser.add_argument("--filename", required=True, help="Clean parquet filename to load into parameters table.")
     args = parser.parse_args()
@@ -0,0 +1,61 @@
+from __future__ import annotations
+import logging
+from typing import TYPE_CHECKING
+from etl.load.copy_loader import copy_to_staging, drop_duplicate_keys, to_arrow
+from etl.metrics import metrics
+
+if TYPE_CHECKING:
+    import pandas as pd
+    import pyarrow as pa
+    from sqlalchemy import Connection
+
+def upsert_dataframe(conn: Connection, df: pd.DataFrame | pa.Table, table: str, key: tuple[str, ...] = ("id",)) -> int:
+    """
+    Inserts or updates a batch of rows in one round trip: COPY into a staging table, then INSERT ... ON CONFLICT DO UPDATE.
+
+    Rows whose values are unchanged are left alone, and if the batch repeats a key the last row wins, so
+    re-running the same upsert is a no-op.
+
+    Args:
+        conn (Connection): SQLAlchemy connection to the airq database, inside a transaction.
+        df (pd.DataFrame | pa.Table): Rows to upsert. Column names must match columns of the table.
+        table (str): Name of the target table, e.g. 'locations'.
+        key (tuple[str, ...]): Columns of the table's primary key or unique constraint.
+
+    Returns:
+        upserted (int): Number of rows inserted or changed.
+    """
+
+    with metrics.timer("load", table):
+        return _upsert_dataframe(conn, df, table, key)
+
+def _upsert_dataframe(conn: Connection, df: pd.DataFrame | pa.Table, table: str, key: tuple[str, ...]) -> int:
+    from sqlalchemy import text
+
+    received = len(df)
+    df = drop_duplicate_keys(to_arrow(df), list(key))
+    staging_table = copy_to_staging(conn, df, table)
+
+    columns = ", ".join(df.column_names)
+    key_columns = ", ".join(key)
+    update_columns = [column for column in df.column_names if column not in key]
+
+    if update_columns:
+        assignments = ", ".join(f"{column} = EXCLUDED.{column}" for column in update_columns)
+        current = ", ".join(f"{table}.{column}" for column in update_columns)
+        incoming = ", ".join(f"EXCLUDED.{column}" for column in update_columns)
+        on_conflict = f"DO UPDATE SET {assignments} WHERE ({current}) IS DISTINCT FROM ({incoming})"
+    else:
+        on_conflict = "DO NOTHING"
+
+    upserted = conn.execute(text(f"""
+        INSERT INTO {table} ({columns})
+        SELECT {columns} FROM {staging_table}
+        ON CONFLICT ({key_columns}) {on_conflict}
+        """)).rowcount
+
+    logging.info(f"Upserted {upserted} of {len(df)} records into {table}.")
+    metrics.inc("rows_written", upserted, table=table)
+    metrics.inc("rows_skipped", received - upserted, table=table)
+
+    return upserted
@@ -0,0 +1,258 @@
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from functools import wraps
+import json
+import os
+from pathlib import Path
+import threading
+import time
+from typing import Callable
+from etl.config import load_env
+
+load_env()
+
+METRICS_DIR = Path(os.getenv("METRICS_DIR", Path(os.getenv("DATA_DIR", ".")) / "metrics"))
+PROMETHEUS_FILENAME = os.getenv("METRICS_PROMETHEUS_FILENAME", "airq_ingestion.prom")
+
+class RunMetrics:
+    """
+    Thread-safe collector of per-run pipeline metrics: stage timings and labelled counters.
+
+    Timings are recorded per (stage, step), e.g. ('fetch', 'location_latest'), and summed across threads, so
+    with concurrent fetches the fetch total is busy time rather than wall time. Counters are keyed by name
+    and labels, e.g. http_responses{status=200} or rows_written{table=measurements}.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """
+        Clears all metrics and restarts the run clock.
+        """
+
+        with self.lock:
+            self.started_at = datetime.utcnow()
+            self.started = time.perf_counter()
+            self.durations = {}
+            self.counters = {}
+
+    def observe(self, stage: str, step: str, seconds: float):
+        with self.lock:
+            total, count = self.durations.get((stage, step), (0.0, 0))
+            self.durations[(stage, step)] = (total + seconds, count + 1)
+
+    @contextmanager
+    def timer(self, stage: str, step: str):
+        """
+        Context manager that records how long its body takes under (stage, step).
+        """
+
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, step, time.perf_counter() - start)
+
+    def timed(self, stage: str, step: str | None = None) -> Callable:
+        """
+        Decorator that records every call of a function under (stage, step). step defaults to the function name.
+        """
+
+        def decorator(func):
+            name = step or func.__name__
+
+            @wraps(func)
+            def wrapper(*args, **kwargs):
+                with self.timer(stage, name):
+                    return func(*args, **kwargs)
+
+            return wrapper
+
+        return decorator
+
+    def inc(self, name: str, value: float = 1, **labels):
+        """
+        Adds value to the counter name{labels}.
+        """
+
+        key = (name, tuple(sorted((label, str(label_value)) for label, label_value in labels.items())))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def summary(self, **info) -> dict:
+        """
+        Returns the run's metrics as a json-serializable dict.
+
+        Args:
+            **info: Extra run attributes to include, e.g. run_id or mode.
+        """
+
+        with self.lock:
+            stages = {}
+            for (stage, step), (total, count) in sorted(self.durations.items()):
+                stage_summary = stages.setdefault(stage, {"seconds": 0.0, "calls": 0, "steps": {}})
+                stage_summary["seconds"] += total
+                stage_summary["calls"] += count
+                stage_summary["steps"][step] = {"seconds": round(total, 4), "calls": count}
+            for stage_summary in stages.values():
+                stage_summary["seconds"] = round(stage_summary["seconds"], 4)
+
+            counters = {}
+            for (name, labels), value in sorted(self.counters.items()):
+                label_key = ",".join(f"{label}={label_value}" for label, label_value in labels) or "total"
+                counters.setdefault(name, {})[label_key] = value
+
+            return {
+                    **info,
+                    "started_at": self.started_at.isoformat() + "Z",
+                    "duration_seconds": round(time.perf_counter() - self.started, 4),
+                    "stages": stages,
+                    "counters": counters,
+                    }
+
+    def to_prometheus(self, **labels) -> str:
+        """
+        Renders the run's metrics in the Prometheus text exposition format.
+
+        Args:
+            **labels: Labels added to every sample, e.g. shard.
+        """
+
+        def format_labels(pairs) -> str:
+            pairs = list(labels.items()) + list(pairs)
+            if not pairs:
+                return ""
+            return "{" + ",".join(f'{name}="{value}"' for name, value in pairs) + "}"
+
+        with self.lock:
+            lines = [
+                    "# HELP airq_run_duration_seconds Wall time of the last ingestion run.",
+                    "# TYPE airq_run_duration_seconds gauge",
+                    f"airq_run_duration_seconds{format_labels([])} {time.perf_counter() - self.started:.6f}",
+                    "# HELP airq_run_timestamp_seconds Start time of the last ingestion run.",
+                    "# TYPE airq_run_timestamp_seconds gauge",
+                    f"airq_run_timestamp_seconds{format_labels([])} {self.started_at.timestamp():.0f}",
+                    "# HELP airq_stage_duration_seconds Time spent per pipeline stage and step in the last run.",
+                    "# TYPE airq_stage_duration_seconds summary",
+                    ]
+            for (stage, step), (total, count) in sorted(self.durations.items()):
+                stage_labels = format_labels([("stage", stage), ("step", step)])
+                lines.append(f"airq_stage_duration_seconds_sum{stage_labels} {total:.6f}")
+                lines.append(f"airq_stage_duration_seconds_count{stage_labels} {count}")
+
+            names = sorted({name for name, _ in self.counters})
+            for name in names:
+                lines.append(f"# TYPE airq_{name}_total counter")
+                for (counter_name, counter_labels), value in sorted(self.counters.items()):
+                    if counter_name == name:
+                        lines.append(f"airq_{name}_total{format_labels(counter_labels)} {value}")
+
+        return "\n".join(lines) + "\n"
+
+    def write(self, run_id: str, metrics_dir: Path = METRICS_DIR, shard: str | None = None, **info) -> tuple[Path, Path]:
+        """
+        Writes the run's metrics as a Prometheus textfile and a json run summary.
+
+        The textfile is replaced atomically so a node_exporter textfile collector never reads a partial file.
+        Shards of a sharded run each write their own textfile and summary, so they never overwrite each other.
+
+        Args:
+            run_id (str): Identifier of the run, used to name the summary file.
+            metrics_dir (Path): Directory holding {PROMETHEUS_FILENAME} and runs/{run_id}.json.
+            shard (str | None): Shard spec, e.g. '0/4', of a sharded run. The files are then written to
+                {PROMETHEUS_FILENAME stem}_shard_0-of-4.prom and runs/{run_id}/shard_0-of-4.json.
+            **info: Extra run attributes included in the summary and as Prometheus labels.
+
+        Returns:
+            (prometheus_filepath, summary_filepath) (tuple[Path, Path]): Paths of the written files.
+        """
+
+        if shard is None:
+            prometheus_filepath = metrics_dir / PROMETHEUS_FILENAME
+            summary_filepath = metrics_dir / "runs" / f"{run_id}.json"
+        else:
+            info["shard"] = shard
+            prometheus_filepath = metrics_dir / f"{Path(PROMETHEUS_FILENAME).stem}_{shard_filename(shard)}.prom"
+            summary_filepath = shard_summary_dir(run_id, metrics_dir) / f"{shard_filename(shard)}.json"
+
+        summary_filepath.parent.mkdir(parents=True, exist_ok=True)
+
+        tmp_filepath = prometheus_filepath.with_suffix(".prom.tmp")
+        tmp_filepath.write_text(self.to_prometheus(**{label: value for label, value in info.items() if value is not None}))
+        tmp_filepath.replace(prometheus_filepath)
+
+        summary_filepath.write_text(json.dumps(self.summary(run_id=run_id, **info), indent=2))
+
+        return prometheus_filepath, summary_filepath
+
+
+def shard_filename(shard: str) -> str:
+    """
+    Returns a filename-safe form of a shard spec, e.g. 'shard_0-of-4' for '0/4'.
+    """
+
+    return "shard_" + shard.replace("/", "-of-")
+
+def shard_summary_dir(run_id: str, metrics_dir: Path = METRICS_DIR) -> Path:
+    """
+    Returns the directory holding the per-shard summaries of a sharded run.
+    """
+
+    return metrics_dir / "runs" / run_id
+
+def merge_summaries(summaries: list[dict], **info) -> dict:
+    """
+    Combines the run summaries of the shards of one run into a single summary.
+
+    Stage timings, call counts and counters are summed. The merged run starts with the earliest shard and
+    lasts until the last shard finished.
+
+    Args:
+        summaries (list[dict]): Run summaries as returned by RunMetrics.summary.
+        **info: Extra run attributes to include, e.g. run_id or shards.
+
+    Returns:
+        summary (dict): Summary with the same layout as a single run's summary.
+    """
+
+    stages = {}
+    counters = {}
+    started_at = None
+    finished_at = None
+
+    for summary in summaries:
+        for stage, stage_summary in summary.get("stages", {}).items():
+            merged_stage = stages.setdefault(stage, {"seconds": 0.0, "calls": 0, "steps": {}})
+            merged_stage["seconds"] += stage_summary["seconds"]
+            merged_stage["calls"] += stage_summary["calls"]
+            for step, step_summary in stage_summary["steps"].items():
+                merged_step = merged_stage["steps"].setdefault(step, {"seconds": 0.0, "calls": 0})
+                merged_step["seconds"] += step_summary["seconds"]
+                merged_step["calls"] += step_summary["calls"]
+
+        for name, values in summary.get("counters", {}).items():
+            merged_values = counters.setdefault(name, {})
+            for label_key, value in values.items():
+                merged_values[label_key] = merged_values.get(label_key, 0) + value
+
+        shard_started_at = datetime.fromisoformat(summary["started_at"].removesuffix("Z"))
+        shard_finished_at = shard_started_at + timedelta(seconds=summary["duration_seconds"])
+        started_at = shard_started_at if started_at is None else min(started_at, shard_started_at)
+        finished_at = shard_finished_at if finished_at is None else max(finished_at, shard_finished_at)
+
+    for stage_summary in stages.values():
+        stage_summary["seconds"] = round(stage_summary["seconds"], 4)
+        for step_summary in stage_summary["steps"].values():
+            step_summary["seconds"] = round(step_summary["seconds"], 4)
+
+    return {
+            **info,
+            "started_at": started_at.isoformat() + "Z" if started_at else None,
+            "duration_seconds": round((finished_at - started_at).total_seconds(), 4) if started_at else 0.0,
+            "stages": {stage: stages[stage] for stage in sorted(stages)},
+            "counters": {name: dict(sorted(counters[name].items())) for name in sorted(counters)},
+            }
+
+metrics = RunMetrics()
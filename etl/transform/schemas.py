@@ -0,0 +1,84 @@
+from typing import Generic, TypeVar
+import msgspec
+
+T = TypeVar("T")
+
+class Response(msgspec.Struct, Generic[T]):
+    """
+    Envelope of every OpenAQ v3 response. Only the results array is decoded.
+    """
+
+    results: list[T] = []
+
+class CountryRef(msgspec.Struct):
+    id: int
+
+class ParameterRef(msgspec.Struct):
+    id: int
+
+class Coordinates(msgspec.Struct):
+    latitude: float
+    longitude: float
+
+class DatetimeObject(msgspec.Struct):
+    utc: str
+
+class Country(msgspec.Struct):
+    id: int
+    name: str | None = None
+
+class Location(msgspec.Struct):
+    id: int
+    coordinates: Coordinates
+    country: CountryRef
+    name: str | None = None
+
+class Sensor(msgspec.Struct):
+    id: int
+    parameter: ParameterRef
+
+class Parameter(msgspec.Struct):
+    id: int
+    units: str | None = None
+    display_name: str | None = msgspec.field(name="displayName", default=None)
+    description: str | None = None
+
+class Latest(msgspec.Struct):
+    datetime: DatetimeObject
+    sensors_id: int = msgspec.field(name="sensorsId")
+    value: float | None = None
+
+class Period(msgspec.Struct):
+    datetime_from: DatetimeObject = msgspec.field(name="datetimeFrom")
+    datetime_to: DatetimeObject = msgspec.field(name="datetimeTo")
+
+class SensorMeasurement(msgspec.Struct):
+    period: Period
+    value: float | None = None
+
+# Decoders are reusable and thread-safe, so each response shape gets one at import time.
+DECODERS = {
+        schema: msgspec.json.Decoder(Response[schema])
+        for schema in (Country, Location, Sensor, Parameter, Latest, SensorMeasurement)
+        }
+
+def decode(data: bytes | str | dict, schema: type[T]) -> list[T]:
+    """
+    Decodes an OpenAQ response into typed records, validating the fields we use and skipping every other field.
+
+    Args:
+        data (bytes | str | dict): Raw json body, or an already decoded payload, e.g. one read back from the raw archive.
+        schema (type): One of Country, Location, Sensor, Parameter, Latest or SensorMeasurement.
+
+    Raises:
+        msgspec.ValidationError: If a field we use is missing or has the wrong type. This is a ValueError.
+        msgspec.DecodeError: If data is not valid json. This is a ValueError.
+
+    Returns:
+        results (list): Records of the response's results array.
+    """
+
+    if isinstance(data, dict):
+        return msgspec.convert(data, Response[schema]).results
+
+    return DECODERS[schema].decode(data).results
@@ -1,66 +1,90 @@
+from __future__ import annotations
 import argparse
-import pandas as pd
 from pathlib import Path
 import os
-from dotenv import load_dotenv
+from etl.config import init, load_env
+from etl.ingestion.raw_archive import ArchivedPayload, read_raw
+from etl.metrics import metrics
 import logging
-import json
+from typing import TYPE_CHECKING
+from etl.transform.schemas import Country, decode
 
+if TYPE_CHECKING:
+    import pyarrow as pa
 
-load_dotenv()
-
-logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s: %(message)s")
+load_env()
 
 DATA_DIR = Path(os.getenv("DATA_DIR"))
-RAW_DATA_DIR = DATA_DIR / "raw"
-RAW_DATA_DIR.mkdir(parents=True, exist_ok=True)
 CLEAN_DATA_DIR = DATA_DIR / "clean"
-CLEAN_DATA_DIR.mkdir(parents=True, exist_ok=True)
 
-def transform_country(filename: Path) -> Path:
+@metrics.timed("transform", "country")
+def transform_country_records(data: bytes | dict) -> pa.Table:
+    """
+    Transforms a countries/country_id payload into an Arrow table of countries.
+
+    Args:
+        data (bytes | dict): Raw or decoded json response from the OpenAQ API.
+
+    Raises:
+        ValueError: If the payload does not match the country schema or contains no records in the results array.
+
+    Returns:
+        table (pa.Table): Countries with id and name columns.
+    """
+
+    import pyarrow as pa
+
+    results = decode(data, Country)
+    if len(results)==0:
+        raise ValueError("No records present in payload")
+
+    return pa.table({
+        "id": pa.array([r.id for r in results], pa.int64()),
+        "name": pa.array([r.name for r in results], pa.string()),
+        })
+
+def transform_country(filename: Path | ArchivedPayload) -> Path:
     """
     Transforms the raw json file containing a country's information into parquet format.
 
     Args:
-        filename (Path): Path object that points to the filename of the raw data json file.
+        filename (Path | ArchivedPayload): Path object that points to the filename of the raw data json file, or the payload's place in the archive as returned
+            by a fetcher given an archive.
 
     Raises:
-        ValueError: If the file is not .json, does not contain the string 'country', or contains no records in the results array.
+        ValueError: If the file is not .json, does not contain the string 'country', does not match the country schema, or contains no records in the results array.
 
     Returns:
         clean_filepath (Path): Path object pointing to clean parquet file.
     """
 
+    import pyarrow.parquet as pq
+
     if not filename.name.endswith(".json"):
         raise ValueError(f"Expected .json file. Got {filename}")
     if "country" not in filename.name:
         raise ValueError(f"Expected filename to contain 'country'. Got {filename}")
 
+    filepath = filename
     filename = filename.name
-    filepath = RAW_DATA_DIR / filename
+    CLEAN_DATA_DIR.mkdir(parents=True, exist_ok=True)
     clean_filepath = CLEAN_DATA_DIR / filename.replace(".json",".parquet")
 
-    with open(filepath, "r") as f:
-        data = json.load(f)
-
-    if len(data.get("results", []))==0:
-        raise ValueError(f"No records present in {filename}")
+    with metrics.timer("transform", "read_raw"):
+        data = read_raw(filepath)
 
     logging.info(f"Successfully loaded {filename}")
 
-    records = [
-            {
-                "id": r["id"],
-                "name": r["name"]
-                } for r in data["results"]
-            ]
-    df = pd.DataFrame(records)
-    df.to_parquet(clean_filepath, engine="pyarrow", index=False)
-    logging.info(f"Saved {len(records)} clean records to {clean_filepath.name}")
+    table = transform_country_records(data)
+    with metrics.timer("transform", "save_clean"):
+        pq.write_table(table, clean_filepath)
+    logging.info(f"Saved {len(table)} clean records to {clean_filepath.name}")
 
     return clean_filepath
 
 def main():
+    init()
+
     parser = argparse.ArgumentParser()
     parser.add_argument("--filename", required=True, help="Filename of the raw json file containing the country's information.")
     args = parser.parse_args()
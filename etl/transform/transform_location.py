@@ -1,65 +1,91 @@
+from __future__ import annotations
 import argparse
 from pathlib import Path
 import os
-from dotenv import load_dotenv
-import pandas as pd
-import json
+from etl.config import init, load_env
+from etl.ingestion.raw_archive import ArchivedPayload, read_raw
+from etl.metrics import metrics
+from etl.transform.schemas import Location, decode
 import logging
+from typing import TYPE_CHECKING
 
-load_dotenv()
+if TYPE_CHECKING:
+    import pyarrow as pa
 
-logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s: %(message)s")
+load_env()
 
 DATA_DIR = Path(os.getenv("DATA_DIR"))
-RAW_DATA_DIR = DATA_DIR / "raw"
-RAW_DATA_DIR.mkdir(parents=True, exist_ok=True)
 CLEAN_DATA_DIR = DATA_DIR / "clean"
-CLEAN_DATA_DIR.mkdir(parents=True, exist_ok=True)
 
-def transform_location(filename: Path) -> Path:
+@metrics.timed("transform", "location")
+def transform_location_records(data: bytes | dict) -> pa.Table:
+    """
+    Transforms a locations payload, for one location or a page of them, into an Arrow table of locations.
+
+    Args:
+        data (bytes | dict): Raw or decoded json response from the OpenAQ API.
+
+    Raises:
+        ValueError: If the payload does not match the location schema or contains no records in the results array.
+
+    Returns:
+        table (pa.Table): Locations with id, name, latitude, longitude and country_id columns.
+    """
+
+    import pyarrow as pa
+
+    results = decode(data, Location)
+    if len(results)==0:
+        raise ValueError("No records found in payload")
+
+    return pa.table({
+        "id": pa.array([r.id for r in results], pa.int64()),
+        "name": pa.array([r.name for r in results], pa.string()),
+        "latitude": pa.array([r.coordinates.latitude for r in results], pa.float64()),
+        "longitude": pa.array([r.coordinates.longitude for r in results], pa.float64()),
+        "country_id": pa.array([r.country.id for r in results], pa.int64()),
+        })
+
+def transform_location(filename: Path | ArchivedPayload) -> Path:
     """
     Transforms raw json file containing location information to parquet format.
 
     Args:
-        filename (Path): Path object that points to file of the raw json data to be cleaned.
+        filename (Path | ArchivedPayload): Path object that points to file of the raw json data to be cleaned, or the payload's place in the archive as returned
+            by a fetcher given an archive.
 
     Raises:
-        ValueError: If filename is not .json, filename does not contain 'location', or results array contains 0 records.
+        ValueError: If filename is not .json, filename does not contain 'location', the json does not match the location schema, or results array contains 0 records.
 
     Returns:
         clean_filepath (Path): Path object that points to saved parquet data.
     """
 
+    import pyarrow.parquet as pq
+
     if not filename.name.endswith(".json"):
         raise ValueError(f"Expected json file. Got {filename}")
     if 'location' not in filename.name:
         raise ValueError(f"Expected 'location' to be in filename. Got {filename}")
 
+    filepath = filename
     filename = filename.name
-    filepath = RAW_DATA_DIR / filename
+    CLEAN_DATA_DIR.mkdir(parents=True, exist_ok=True)
     clean_filepath = CLEAN_DATA_DIR / filename.replace(".json", ".parquet")
 
-    with open(filepath, "r") as f:
-        data = json.load(f)
-
-    if len(data.get('results', []))==0:
-        raise ValueError(f"No records found in {filename}")
+    with metrics.timer("transform", "read_raw"):
+        data = read_raw(filepath)
 
-    records = [{
-        "id": r["id"],
-        "name": r["name"],
-        "latitude": r["coordinates"]["latitude"],
-        "longitude": r["coordinates"]["longitude"],
-        "country_id": r["country"]["id"]
-        } for r in data["results"]]
-
-    df = pd.DataFrame(records)
-    df.to_parquet(clean_filepath, engine="pyarrow", index=False)
-    logging.info(f"Saved {len(df)} clean records to {clean_filepath.name}")
+    table = transform_location_records(data)
+    with metrics.timer("transform", "save_clean"):
+        pq.write_table(table, clean_filepath)
+    logging.info(f"Saved {len(table)} clean records to {clean_filepath.name}")
 
     return clean_filepath
 
 def main():
+    init()
+
     parser = argparse.ArgumentParser()
     parser.add_argument("--filename", required=True, help="Filename of the raw json file containing location information.")
     args = parser.parse_args()
@@ -1,72 +1,199 @@
-import json
-import pandas as pd
+from __future__ import annotations
+from datetime import datetime
 from pathlib import Path
+from typing import TYPE_CHECKING, Iterable
+from uuid import uuid4
 import argparse
 import logging
-from dotenv import load_dotenv
+from etl.config import init, load_env
+from etl.ingestion.raw_archive import ArchivedPayload, read_raw
+from etl.metrics import metrics
+from etl.transform.schemas import Latest, decode
 import os
 
-load_dotenv()
+if TYPE_CHECKING:
+    import pyarrow as pa
 
-logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s: %(message)s")
+load_env()
 
 DATA_DIR = Path(os.getenv("DATA_DIR"))
-RAW_DATA_DIR = DATA_DIR / "raw"
-RAW_DATA_DIR.mkdir(parents=True, exist_ok=True)
 CLEAN_DATA_DIR = DATA_DIR / "clean"
-CLEAN_DATA_DIR.mkdir(parents=True, exist_ok=True)
+MEASUREMENTS_DATASET_DIR = CLEAN_DATA_DIR / "measurements"
+ROW_GROUP_SIZE = int(os.getenv("PARQUET_ROW_GROUP_SIZE", "131072"))
 
-def transform_location_latest(filename: Path) -> Path:
+def measurements_schema() -> pa.Schema:
+    """
+    Arrow schema of clean measurements, built on call so importing this module does not load pyarrow.
+
+    Returns:
+        schema (pa.Schema): datetime, sensor_id and value columns.
+    """
+
+    import pyarrow as pa
+
+    return pa.schema([
+        ("datetime", pa.timestamp("us", tz="UTC")),
+        ("sensor_id", pa.int64()),
+        ("value", pa.float64()),
+        ])
+
+class EmptyPayloadError(ValueError):
+    """
+    Raised for a latest payload without records, e.g. from a station that is offline.
+    """
+
+@metrics.timed("transform", "location_latest")
+def transform_location_latest_records(data: bytes | dict) -> pa.Table:
+    """
+    Transforms a locations/location_id/latest payload into an Arrow table of measurements.
+
+    Columns are built directly as Arrow arrays, and datetime strings are parsed into timestamps in one vectorized cast.
+
+    Args:
+        data (bytes | dict): Raw or decoded json response from the OpenAQ API.
+
+    Raises:
+        ValueError: If the payload does not match the latest schema.
+        EmptyPayloadError: If the payload contains no records in the results array.
+
+    Returns:
+        table (pa.Table): Measurements matching measurements_schema().
+    """
+
+    import pyarrow as pa
+
+    results = decode(data, Latest)
+    if len(results)==0:
+        raise EmptyPayloadError("No records present in payload")
+
+    schema = measurements_schema()
+    return pa.table([
+        pa.array([r.datetime.utc for r in results], pa.string()).cast(schema.field("datetime").type),
+        pa.array([r.sensors_id for r in results], pa.int64()),
+        pa.array([r.value for r in results], pa.float64()),
+        ], schema=schema)
+
+def transform_location_latest(filename: Path | ArchivedPayload) -> Path:
     """
     Transforms raw json file containing latest sensor measurements into parquet format.
 
     Args:
-        filename (Path): Path object pointing to the filename of the raw data json file.
+        filename (Path | ArchivedPayload): Path object pointing to the filename of the raw data json file, or the payload's place in the archive as returned
+            by a fetcher given an archive.
 
     Raises:
-        ValueError: If the file is not .json, filename does not contain 'location_latest', or the file contains no records in the results array.
+        ValueError: If the file is not .json, filename does not contain 'location_latest', or the json does not match the latest schema.
+        EmptyPayloadError: If the file contains no records in the results array.
 
     Returns:
         clean_filepath (Path): Path object that points to parquet data file.
     """
 
+    import pyarrow.parquet as pq
+
     if not filename.name.endswith(".json"):
         raise ValueError(f"Expected json file. Got {filename}")
     if "location_latest" not in filename.name:
         raise ValueError(f"Expected filename to contain 'location_latest'. Got {filename}")
 
+    filepath = filename
     filename = filename.name
-    filepath = RAW_DATA_DIR / filename
+    CLEAN_DATA_DIR.mkdir(parents=True, exist_ok=True)
     clean_filepath = CLEAN_DATA_DIR / filename.replace(".json",".parquet")
-    with open(filepath, "r") as f:
-        data = json.load(f)
-
-    if len(data.get('results', []))==0:
-        raise ValueError(f"No records present in {filepath}")
+    with metrics.timer("transform", "read_raw"):
+        data = read_raw(filepath)
 
     logging.info(f"Successfully loaded {filename}")
 
-    records = [
-            {
-                "datetime":r["datetime"]["utc"],
-                "sensor_id":r["sensorsId"],
-                "value":r["value"]
-            } for r in data["results"]]
-
-    df = pd.DataFrame(records)
-    df.to_parquet(clean_filepath ,engine="pyarrow", index=False)
-    logging.info(f"Saved {len(records)} clean records to {clean_filepath}.")
+    table = transform_location_latest_records(data)
+    with metrics.timer("transform", "save_clean"):
+        pq.write_table(table, clean_filepath)
+    logging.info(f"Saved {len(table)} clean records to {clean_filepath}.")
 
     return clean_filepath
 
+@metrics.timed("transform", "measurements_dataset")
+def write_measurements_dataset(tables: Iterable[pa.Table], run_time: datetime | None = None) -> Path:
+    """
+    Writes the measurements of one ingestion run as a single part of the Hive-partitioned measurements dataset.
+
+    The part lands in MEASUREMENTS_DATASET_DIR/date=YYYY-MM-DD/hour=HH/, partitioned by the run's UTC hour. Rows
+    are sorted by sensor_id and datetime and written in row groups of ROW_GROUP_SIZE with column statistics,
+    so readers can skip row groups by sensor or time.
+
+    Args:
+        tables (Iterable[pa.Table]): Measurements matching measurements_schema(), e.g. one per location.
+        run_time (datetime | None): UTC time of the run. Defaults to now.
+
+    Raises:
+        ValueError: If tables contain no records.
+
+    Returns:
+        part_filepath (Path): Path object that points to the written parquet part.
+    """
+
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    tables = [table for table in tables if len(table) > 0]
+    if not tables:
+        raise ValueError("No records to write to measurements dataset")
+
+    run_time = run_time or datetime.utcnow()
+    partition_dir = MEASUREMENTS_DATASET_DIR / f"date={run_time:%Y-%m-%d}" / f"hour={run_time:%H}"
+    partition_dir.mkdir(parents=True, exist_ok=True)
+    part_filepath = partition_dir / f"part-{run_time:%Y%m%dT%H%M%SZ}-{uuid4().hex[:8]}.parquet"
+
+    table = pa.concat_tables(tables).sort_by([("sensor_id", "ascending"), ("datetime", "ascending")])
+    pq.write_table(table, part_filepath, row_group_size=ROW_GROUP_SIZE, compression="zstd", write_statistics=True)
+    logging.info(f"Saved {len(table)} clean records to {part_filepath}.")
+
+    return part_filepath
+
+def transform_location_latest_batch(filenames: Iterable[Path | ArchivedPayload], run_time: datetime | None = None) -> Path:
+    """
+    Transforms many raw location_latest json files into one part of the partitioned measurements dataset, instead of one parquet file each.
+
+    Args:
+        filenames (Iterable[Path | ArchivedPayload]): Path objects pointing to the filenames of the raw data json files, or archived payloads.
+        run_time (datetime | None): UTC time of the run. Defaults to now.
+
+    Raises:
+        ValueError: If none of the files contain records.
+
+    Returns:
+        part_filepath (Path): Path object that points to the written parquet part.
+    """
+
+    tables = []
+    for filename in filenames:
+        if not filename.name.endswith(".json") or "location_latest" not in filename.name:
+            logging.error(f"Expected location_latest json file. Got {filename}. Skipping file.")
+            continue
+        with metrics.timer("transform", "read_raw"):
+            data = read_raw(filename)
+        try:
+            tables.append(transform_location_latest_records(data))
+        except ValueError as e:
+            logging.error(f"Invalid or empty payload in {filename}: {e}. Skipping file.")
+
+    return write_measurements_dataset(tables, run_time)
+
 def main():
+    init()
+
     parser = argparse.ArgumentParser(description="Transform raw location data to parquet.")
-    parser.add_argument("--filename", required=True, help="Filename of json file containing data to be transformed.")
+    parser.add_argument("--filename", required=True, nargs="+", help="Filename of json file containing data to be transformed.")
+    parser.add_argument("--batch", action="store_true", help="Write all files into one part of the partitioned measurements dataset.")
     args = parser.parse_args()
 
-    filepath = Path(args.filename)
+    filepaths = [Path(filename) for filename in args.filename]
 
-    transform_location_latest(filepath)
+    if args.batch:
+        transform_location_latest_batch(filepaths)
+    else:
+        for filepath in filepaths:
+            transform_location_latest(filepath)
 
 if __name__ == "__main__":
     main()
@@ -1,49 +1,79 @@
-import json
-import pandas as pd
+from __future__ import annotations
 from pathlib import Path
 import argparse
 import logging
-from dotenv import load_dotenv
+from etl.config import init, load_env
+from etl.ingestion.raw_archive import ArchivedPayload, read_raw
+from etl.metrics import metrics
+from etl.transform.schemas import Sensor, decode
 import os
+from typing import TYPE_CHECKING
 
-load_dotenv()
+if TYPE_CHECKING:
+    import pyarrow as pa
 
-logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s: %(message)s")
+load_env()
 
 DATA_DIR = Path(os.getenv("DATA_DIR"))
-RAW_DATA_DIR = DATA_DIR / "raw"
-RAW_DATA_DIR.mkdir(parents=True, exist_ok=True)
 CLEAN_DATA_DIR = DATA_DIR / "clean"
-CLEAN_DATA_DIR.mkdir(parents=True, exist_ok=True)
 
-def transform_location_sensors(filename: Path) -> Path:
+@metrics.timed("transform", "location_sensors")
+def transform_location_sensors_records(data: bytes | dict, location_id: int) -> pa.Table:
+    """
+    Transforms a locations/location_id/sensors payload into an Arrow table of sensors.
+
+    Args:
+        data (bytes | dict): Raw or decoded json response from the OpenAQ API.
+        location_id (int): The location the sensors belong to.
+
+    Raises:
+        ValueError: If the payload does not match the sensor schema or contains no records in the results array.
+
+    Returns:
+        table (pa.Table): Sensors with id, location_id and parameter_id columns.
+    """
+
+    import pyarrow as pa
+
+    results = decode(data, Sensor)
+    if len(results)==0:
+        raise ValueError(f"No records present in payload for location {location_id}.")
+
+    return pa.table({
+        "id": pa.array([r.id for r in results], pa.int64()),
+        "location_id": pa.array([int(location_id)] * len(results), pa.int64()),
+        "parameter_id": pa.array([r.parameter.id for r in results], pa.int64()),
+        })
+
+def transform_location_sensors(filename: Path | ArchivedPayload) -> Path:
     """
     Transforms raw json file containing sensor information for a certain location into parquet format.
 
     Args:
-        filename (Path): Path object that points to the filename of the raw data json file.
+        filename (Path | ArchivedPayload): Path object that points to the filename of the raw data json file, or the payload's place in the archive as returned
+            by a fetcher given an archive.
 
     Raises:
-        ValueError: If the file is not .json, if the file does not contain the word 'sensors', or if the file contains no records in the results array.
+        ValueError: If the file is not .json, if the file does not contain the word 'sensors', if the json does not match the sensor schema, or if the file contains no records in the results array.
 
     Returns:
         clean_filepath (Path): Path object that points to clean parquet file.
     """
 
+    import pyarrow.parquet as pq
+
     if not filename.name.endswith(".json"):
         raise ValueError(f"Expected json file. Got {filename}")
     if not "location_sensors" in filename.name:
         raise ValueError(f"Expected filename containing 'location_sensors'. Got {filename}")
 
+    filepath = filename
     filename = filename.name
-    filepath = RAW_DATA_DIR / filename
+    CLEAN_DATA_DIR.mkdir(parents=True, exist_ok=True)
     clean_filepath = CLEAN_DATA_DIR / filename.replace(".json",".parquet")
     
-    with open(filepath, "r") as f:
-        data = json.load(f)
-
-    if len(data.get('results', []))==0:
-        raise ValueError(f"No records present in {filename}.")
+    with metrics.timer("transform", "read_raw"):
+        data = read_raw(filepath)
 
     logging.info(f"Successfully loaded {filename}.")
 
@@ -51,19 +81,16 @@ def transform_location_sensors(filename: Path) -> Path:
     filename_parts = filename.split("_")
     location_id = filename_parts[filename_parts.index("sensors")+1]
     
-    records = [{
-            "id": r["id"],
-            "location_id": location_id,
-            "parameter_id": r["parameter"]["id"]
-            } for r in data["results"]]
-
-    df = pd.DataFrame(records)
-    df.to_parquet(clean_filepath, engine="pyarrow", index=False)
-    logging.info(f"Saved {len(records)} clean records to {clean_filepath}.")
+    table = transform_location_sensors_records(data, location_id)
+    with metrics.timer("transform", "save_clean"):
+        pq.write_table(table, clean_filepath)
+    logging.info(f"Saved {len(table)} clean records to {clean_filepath}.")
     
     return clean_filepath
 
 def main():
+    init()
+
     parser = argparse.ArgumentParser(description="Transorm raw sensor data to parquet format.")
     parser.add_argument("--filename", required=True, help="Filename of json file containing data to be transformed.")
     args = parser.parse_args()
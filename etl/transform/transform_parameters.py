@@ -1,67 +1,92 @@
+from __future__ import annotations
 import argparse
-import json
-import pandas as pd
 from pathlib import Path
 import logging
 import os
-from dotenv import load_dotenv
+from typing import TYPE_CHECKING
+from etl.config import init, load_env
+from etl.ingestion.raw_archive import ArchivedPayload, read_raw
+from etl.metrics import metrics
+from etl.transform.schemas import Parameter, decode
 
-load_dotenv()
+if TYPE_CHECKING:
+    import pyarrow as pa
 
-logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s: %(message)s")
+load_env()
 
 DATA_DIR = Path(os.getenv("DATA_DIR"))
-RAW_DATA_DIR = DATA_DIR / "raw"
-RAW_DATA_DIR.mkdir(parents=True, exist_ok=True)
 CLEAN_DATA_DIR = DATA_DIR / "clean"
-CLEAN_DATA_DIR.mkdir(parents=True, exist_ok=True)
 
-def transform_parameters(filename: Path) -> Path:
+@metrics.timed("transform", "parameters")
+def transform_parameters_records(data: bytes | dict) -> pa.Table:
+    """
+    Transforms a parameters payload into an Arrow table of parameters.
+
+    Args:
+        data (bytes | dict): Raw or decoded json response from the OpenAQ API.
+
+    Raises:
+        ValueError: If the payload does not match the parameter schema or contains no records in the results array.
+
+    Returns:
+        table (pa.Table): Parameters with id, units, name and description columns.
+    """
+
+    import pyarrow as pa
+
+    results = decode(data, Parameter)
+    if len(results)==0:
+        raise ValueError("No records present in payload")
+
+    return pa.table({
+        "id": pa.array([r.id for r in results], pa.int64()),
+        "units": pa.array([r.units for r in results], pa.string()),
+        "name": pa.array([r.display_name for r in results], pa.string()),
+        "description": pa.array([r.description for r in results], pa.string()),
+        })
+
+def transform_parameters(filename: Path | ArchivedPayload) -> Path:
     """
     Transforms raw json data containing parameter information to parquet format."
     
     Args:
-        filename (Path): Path object that points to the filename of the raw data json file.
+        filename (Path | ArchivedPayload): Path object that points to the filename of the raw data json file, or the payload's place in the archive as returned
+            by a fetcher given an archive.
 
     Raises:
-        ValueError: If the file is not .json, the file does not contain the word 'parameters', or there are no records in the results array of the json.
+        ValueError: If the file is not .json, the file does not contain the word 'parameters', the json does not match the parameter schema, or there are no records in its results array.
 
     Returns:
         clean_filepath (Path): Path object that points to clean parquet file.
     """
 
+    import pyarrow.parquet as pq
+
     if not filename.name.endswith(".json"):
         raise ValueError(f"Expected json file. Got {filename}")
     if not "parameters" in filename.name:
         raise ValueError(f"Expected filename to contain 'parameters'. Got {filename}")
 
+    filepath = filename
     filename = filename.name
-    filepath = RAW_DATA_DIR / filename
+    CLEAN_DATA_DIR.mkdir(parents=True, exist_ok=True)
     clean_filepath = CLEAN_DATA_DIR / filename.replace(".json", ".parquet")
 
-    with open(filepath, "r") as f:
-        data = json.load(f)
-
-    if len(data.get('results', []))==0:
-        raise ValueError(f"No records present in {filename}")
+    with metrics.timer("transform", "read_raw"):
+        data = read_raw(filepath)
 
     logging.info(f"Successfully loaded {filename}")
 
-    records = [
-            {
-                "id": r["id"],
-                "units": r["units"],
-                "name": r["displayName"],
-                "description": r["description"]
-                } for r in data["results"]
-            ]
-    df = pd.DataFrame(records)
-    df.to_parquet(clean_filepath, engine="pyarrow", index=False)
-    logging.info(f"Saved {len(records)} clean records to {clean_filepath}")
+    table = transform_parameters_records(data)
+    with metrics.timer("transform", "save_clean"):
+        pq.write_table(table, clean_filepath)
+    logging.info(f"Saved {len(table)} clean records to {clean_filepath}")
 
     return clean_filepath
 
 def main():
+    init()
+
     parser = argparse.ArgumentParser(description="Transform raw parameter data into parquet.")
     parser.add_argument("--filename", required=True, help="Filename of json file containing parameter data.")
     args = parser.parse_args()
@@ -0,0 +1,41 @@
+from __future__ import annotations
+from typing import TYPE_CHECKING
+from etl.config import load_env
+from etl.metrics import metrics
+from etl.transform.schemas import SensorMeasurement, decode
+from etl.transform.transform_location_latest import measurements_schema
+
+if TYPE_CHECKING:
+    import pyarrow as pa
+
+load_env()
+
+@metrics.timed("transform", "sensor_measurements")
+def transform_sensor_measurements_records(data: bytes | dict, sensor_id: int) -> pa.Table:
+    """
+    Transforms a sensors/sensor_id/measurements payload into an Arrow table of measurements.
+
+    Each measurement is stamped with the end of its period, like the datetime of the locations/location_id/latest
+    endpoint, so backfilled rows line up with the ones ingested hourly.
+
+    Args:
+        data (bytes | dict): Raw or decoded json response from the OpenAQ API.
+        sensor_id (int): The sensor id the measurements were requested for.
+
+    Raises:
+        ValueError: If the payload does not match the sensor measurements schema.
+
+    Returns:
+        table (pa.Table): Measurements matching measurements_schema(). Empty if the sensor reported nothing in the range.
+    """
+
+    import pyarrow as pa
+
+    results = decode(data, SensorMeasurement)
+
+    schema = measurements_schema()
+    return pa.table([
+        pa.array([r.period.datetime_to.utc for r in results], pa.string()).cast(schema.field("datetime").type),
+        pa.array([sensor_id] * len(results), pa.int64()),
+        pa.array([r.value for r in results], pa.float64()),
+        ], schema=schema)
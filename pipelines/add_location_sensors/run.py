@@ -1,33 +1,64 @@
+from __future__ import annotations
 import argparse
 import logging
 import os
-from dotenv import load_dotenv
+from pathlib import Path
+from typing import TYPE_CHECKING
+from etl.config import init, load_env
 from etl.ingestion.fetch_location_sensors import fetch_location_sensors
 from etl.transform.transform_location_sensors import transform_location_sensors
 from etl.load.load_location_sensors import load_location_sensors
 from db.db import get_db
 
-load_dotenv()
+if TYPE_CHECKING:
+    from sqlalchemy.orm import Session
 
-logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s: %(message)s")
+load_env()
 
-def add_location_sensors(location_id: int):
+def prepare_location_sensors(location_id: int) -> Path:
+    """
+    Fetches and transforms the sensors of a location, without touching the database.
 
-    db = next(get_db())
+    Callers that load the sensors inside a larger transaction, e.g. add_new_location, run this first, so the
+    transaction is not held open across the API call.
 
-    try:
-        raw_filepath = fetch_location_sensors(location_id)
+    Args:
+        location_id (int): Location id as recognized by the OpenAQ API.
+
+    Returns:
+        clean_filepath (Path): Path object that points to the clean parquet file of the sensors.
+    """
+
+    raw_filepath = fetch_location_sensors(location_id)
+
+    return transform_location_sensors(raw_filepath)
+
+def add_location_sensors(location_id: int, db: Session | None = None):
+    """
+    Fetches, transforms and loads the sensors of a location.
 
-        clean_filepath = transform_location_sensors(raw_filepath)
+    Args:
+        location_id (int): Location id as recognized by the OpenAQ API.
+        db (Session | None): SQLAlchemy session to use. A new one is opened, and closed, if None.
+    """
+
+    own_db = db is None
+    db = next(get_db()) if own_db else db
+
+    try:
+        clean_filepath = prepare_location_sensors(location_id)
 
         load_location_sensors(clean_filepath, db)
 
     except Exception:
         logging.exception(f"Error while adding sensor data for location {location_id}")
     finally:
-        db.close()
+        if own_db:
+            db.close()
 
 def main():
+    init()
+
     parser = argparse.ArgumentParser()
     parser.add_argument("--location", required=True, help="Location id as recognized by the OpenAQ API")
     args = parser.parse_args()
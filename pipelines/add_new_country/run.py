@@ -4,13 +4,11 @@ import os
 from etl.ingestion.fetch_country import fetch_country
 from etl.transform.transform_country import transform_country
 from etl.load.load_country import load_country
-from dotenv import load_dotenv
+from etl.config import init, load_env
 from db.db import get_db
 import argparse
 
-load_dotenv()
-
-logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s: %(message)s")
+load_env()
 
 def add_new_country(country_id: int):
     
@@ -34,6 +32,8 @@ def add_new_country(country_id: int):
     db.close()
 
 def main():
+    init()
+
     parser = argparse.ArgumentParser()
     parser.add_argument("--country", required=True, help="Country id as recognized by the OpenAQ API.")
     args = parser.parse_args()
@@ -1,18 +1,27 @@
 import argparse
 import os
-from dotenv import load_dotenv
+from etl.config import init, load_env
 from db.db import get_db
 from etl.ingestion.fetch_location import fetch_location
 from etl.transform.transform_location import transform_location
 from etl.load.load_location import load_location
-from pipelines.add_location_sensors import add_location_sensors
+from etl.load.load_location_sensors import load_location_sensors
+from pipelines.add_location_sensors.run import prepare_location_sensors
+from db.unit_of_work import UnitOfWork
 import logging
 
-load_dotenv()
-
-logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s: %(message)s")
+load_env()
 
 def add_new_location(location_id: int):
+    """
+    Adds a location and its sensors.
+
+    Both are fetched and transformed first, then loaded through one session and one transaction, so a location is
+    never left without its sensors and the transaction is not held open across API calls.
+
+    Args:
+        location_id (int): Location id as recognized by the OpenAQ API.
+    """
 
     db = next(get_db())
 
@@ -20,15 +29,19 @@ def add_new_location(location_id: int):
         raw_filepath = fetch_location(location_id)
 
         clean_filepath = transform_location(raw_filepath)
+        sensors_filepath = prepare_location_sensors(location_id)
 
-        load_location(clean_filepath, db)
-        add_location_sensors(location_id)
+        with UnitOfWork(db.get_bind()) as uow:
+            load_location(clean_filepath, db, conn=uow.conn)
+            load_location_sensors(sensors_filepath, db, conn=uow.conn)
     except Exception as e:
         logging.exception(f"Error while adding location {location_id}")
     finally:
         db.close()
 
 def main():
+    init()
+
     parser = argparse.ArgumentParser()
     parser.add_argument("--location", required=True, help="Location id as recognized by the OpenAQ API")
     args = parser.parse_args()
@@ -0,0 +1,232 @@
+from __future__ import annotations
+import argparse
+import asyncio
+from datetime import datetime, timedelta, timezone
+import hashlib
+import logging
+import os
+import sys
+from typing import TYPE_CHECKING
+from etl.ingestion.fetch_many import fetch_concurrently, FETCH_CONCURRENCY
+from etl.ingestion.fetch_sensor_measurements import fetch_sensor_measurements_data
+from etl.transform.transform_sensor_measurements import transform_sensor_measurements_records
+from etl.load.load_location_latest import load_measurements
+from etl.metrics import metrics
+from etl.config import init, load_env
+from db.checkpoints import chunk_counts, mark_chunk, pending_chunks, register_chunks, DONE, FAILED
+from db.db import get_db
+from db.dimensions import get_dimensions
+from db.partitions import add_months, create_partition, month_start
+
+if TYPE_CHECKING:
+    from sqlalchemy.orm import Session
+
+load_env()
+
+BACKFILL_CHUNK_DAYS = float(os.getenv("BACKFILL_CHUNK_DAYS", "7"))
+BACKFILL_CONCURRENCY = int(os.getenv("BACKFILL_CONCURRENCY", str(FETCH_CONCURRENCY)))
+
+def parse_utc(value: str) -> datetime:
+    """
+    Parses an ISO 8601 date or datetime into a naive UTC datetime. Values without an offset are taken as UTC.
+    """
+
+    parsed = datetime.fromisoformat(value)
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
+def split_chunks(start: datetime, end: datetime, chunk: timedelta) -> list[tuple[datetime, datetime]]:
+    """
+    Splits [start, end) into consecutive chunks of at most `chunk`.
+
+    Args:
+        start (datetime): Start of the range, in UTC.
+        end (datetime): End of the range, in UTC.
+        chunk (timedelta): Length of every chunk but the last.
+
+    Raises:
+        ValueError: If the range is empty or chunk is not positive.
+
+    Returns:
+        chunks (list[tuple[datetime, datetime]]): (datetime_from, datetime_to) of every chunk, oldest first.
+    """
+
+    if end <= start:
+        raise ValueError(f"Expected end after start. Got {start} to {end}")
+    if chunk <= timedelta(0):
+        raise ValueError(f"Expected a positive chunk length. Got {chunk}")
+
+    chunks = []
+    while start < end:
+        chunks.append((start, min(start + chunk, end)))
+        start += chunk
+
+    return chunks
+
+def backfill_id_for(sensor_ids: list[int], start: datetime, end: datetime, chunk: timedelta) -> str:
+    """
+    Derives a stable backfill id from its sensors, range and chunk length, so re-running the same backfill resumes it.
+    """
+
+    key = f"{sorted(sensor_ids)}|{start.isoformat()}|{end.isoformat()}|{chunk.total_seconds()}"
+    return f"{start:%Y%m%d}-{end:%Y%m%d}-{hashlib.sha1(key.encode('utf-8')).hexdigest()[:10]}"
+
+def _ensure_partitions(db: Session, start: datetime, end: datetime):
+    # Historical months are usually older than the partitions created ahead of time.
+    month = month_start(start.date())
+    with db.get_bind().begin() as conn:
+        while month <= end.date():
+            create_partition(conn, month)
+            month = add_months(month, 1)
+
+def _fetch_chunk(chunk: tuple[int, datetime, datetime]) -> dict:
+    return fetch_sensor_measurements_data(*chunk)
+
+def _load_chunk(chunk: tuple[int, datetime, datetime], data: dict, db: Session) -> int:
+    sensor_id = chunk[0]
+    table = transform_sensor_measurements_records(data, sensor_id)
+    if len(table) == 0:
+        return 0
+    return load_measurements(table, db, use_watermarks=False)
+
+def _checkpoint(db: Session, backfill_id: str, chunk: tuple[int, datetime, datetime], status: str, rows_loaded: int | None = None):
+    try:
+        with db.get_bind().begin() as conn:
+            mark_chunk(conn, backfill_id, chunk[0], chunk[1], status, rows_loaded)
+    except Exception as e:
+        logging.error(f"Error while checkpointing chunk {chunk} as {status}: {e}.")
+
+async def _backfill_chunks(backfill_id: str, chunks: list[tuple[int, datetime, datetime]], db: Session, concurrency: int) -> int:
+    loaded_total = 0
+
+    # A chunk whose fetch failed is marked failed like one whose load failed, so progress tells it from one not fetched yet.
+    async for chunk, data in fetch_concurrently(_fetch_chunk, chunks, concurrency, on_error=lambda chunk, e: _checkpoint(db, backfill_id, chunk, FAILED)):
+        sensor_id, datetime_from, datetime_to = chunk
+        try:
+            # Loading runs on a worker thread so in-flight fetches keep going meanwhile.
+            loaded = await asyncio.to_thread(_load_chunk, chunk, data, db)
+        except Exception as e:
+            logging.error(f"Error while loading measurements of sensor {sensor_id} from {datetime_from} to {datetime_to}: {e}. Skipping chunk.")
+            metrics.inc("failures", stage="load")
+            _checkpoint(db, backfill_id, chunk, FAILED)
+            continue
+        _checkpoint(db, backfill_id, chunk, DONE, loaded)
+        loaded_total += loaded
+
+    return loaded_total
+
+def run_backfill(sensor_ids: list[int] | None = None, location_ids: list[int] | None = None, start: datetime | None = None, end: datetime | None = None,
+                 chunk_days: float = BACKFILL_CHUNK_DAYS, concurrency: int = BACKFILL_CONCURRENCY, backfill_id: str | None = None, resume: bool = False) -> dict:
+    """
+    Fetches and loads historical measurements for sensors, or for every sensor of locations, over a date range.
+
+    The range is split per sensor into chunks of chunk_days, which are fetched concurrently through the shared,
+    rate-limited OpenAQ client and loaded as they arrive. Loading skips the watermark filter, since backfilled rows are
+    older than the watermarks, and relies on the (sensor_id, datetime) unique index to stay idempotent. The progress of
+    every chunk is kept in the backfill_chunks table, so stopping and re-running a backfill only fetches the chunks
+    that are not done.
+
+    Args:
+        sensor_ids (list[int] | None): Sensors to backfill.
+        location_ids (list[int] | None): Locations whose sensors to backfill, in addition to sensor_ids.
+        start (datetime | None): Start of the range, in UTC.
+        end (datetime | None): End of the range, in UTC.
+        chunk_days (float): Length of a chunk in days.
+        concurrency (int): Maximum number of chunk requests in flight.
+        backfill_id (str | None): Identifier of the backfill. Defaults to one derived from the sensors and range.
+        resume (bool): Only retry the unfinished chunks of the existing backfill backfill_id. Sensors and range are then not needed.
+
+    Raises:
+        ValueError: If no sensors or range are given for a new backfill, or resume is set and backfill_id has no chunks.
+
+    Returns:
+        summary (dict): The backfill id, the number of chunks per status once the backfill stops, and the number of new measurements written.
+    """
+
+    db = next(get_db())
+    engine = db.get_bind()
+
+    try:
+        if resume:
+            if not backfill_id:
+                raise ValueError("Expected a backfill_id to resume.")
+            with engine.connect() as conn:
+                chunks = pending_chunks(conn, backfill_id)
+                if not chunk_counts(conn, backfill_id):
+                    raise ValueError(f"No chunks found for backfill {backfill_id}.")
+        else:
+            dimensions = get_dimensions(engine)
+            sensor_ids = set(sensor_ids or [])
+            unknown_sensor_ids = sorted(sensor_id for sensor_id in sensor_ids if dimensions.parameter_for(sensor_id) is None)
+            if unknown_sensor_ids:
+                logging.warning(f"Skipping sensors {unknown_sensor_ids} missing from the sensors table.")
+                sensor_ids -= set(unknown_sensor_ids)
+            for location_id in location_ids or []:
+                location_sensor_ids = dimensions.sensors_for(location_id)
+                if not location_sensor_ids:
+                    logging.warning(f"No sensors found for location {location_id}.")
+                sensor_ids |= location_sensor_ids
+            if not sensor_ids:
+                raise ValueError("Expected at least one sensor to backfill.")
+            if start is None or end is None:
+                raise ValueError("Expected a start and an end to backfill.")
+
+            chunk = timedelta(days=chunk_days)
+            backfill_id = backfill_id or backfill_id_for(list(sensor_ids), start, end, chunk)
+            with engine.begin() as conn:
+                register_chunks(conn, backfill_id, [
+                    (sensor_id, datetime_from, datetime_to)
+                    for datetime_from, datetime_to in split_chunks(start, end, chunk)
+                    for sensor_id in sorted(sensor_ids)
+                    ])
+                chunks = pending_chunks(conn, backfill_id)
+
+        logging.info(f"Backfill {backfill_id}: {len(chunks)} chunks to fetch.")
+
+        if chunks:
+            _ensure_partitions(db, min(chunk[1] for chunk in chunks), max(chunk[2] for chunk in chunks))
+            rows_written = asyncio.run(_backfill_chunks(backfill_id, chunks, db, concurrency))
+        else:
+            rows_written = 0
+
+        with engine.connect() as conn:
+            counts = chunk_counts(conn, backfill_id)
+    finally:
+        db.close()
+
+    logging.info(f"Backfill {backfill_id} stopped with chunks {counts} after writing {rows_written} new measurements.")
+
+    return {"backfill_id": backfill_id, "chunks": counts, "rows_written": rows_written}
+
+def main():
+    init()
+
+    parser = argparse.ArgumentParser(description="Backfill historical measurements for sensors or locations over a date range.")
+    parser.add_argument("--sensors", nargs="+", type=int, default=[], help="Sensor ids to backfill.")
+    parser.add_argument("--locations", nargs="+", type=int, default=[], help="Location ids whose sensors to backfill.")
+    parser.add_argument("--start", type=parse_utc, help="Start of the range in UTC, e.g. 2025-01-01.")
+    parser.add_argument("--end", type=parse_utc, help="End of the range in UTC, exclusive, e.g. 2025-02-01.")
+    parser.add_argument("--chunk-days", type=float, default=BACKFILL_CHUNK_DAYS, help="Length of a chunk fetched in one go, in days.")
+    parser.add_argument("--concurrency", type=int, default=BACKFILL_CONCURRENCY, help="Maximum number of chunk requests in flight.")
+    parser.add_argument("--backfill-id", help="Identifier of the backfill. Defaults to one derived from the sensors and range, so rerunning resumes.")
+    parser.add_argument("--resume", metavar="BACKFILL_ID", help="Retry only the unfinished chunks of an earlier backfill.")
+    args = parser.parse_args()
+
+    if not args.resume and not (args.sensors or args.locations):
+        parser.error("one of --sensors, --locations or --resume is required")
+    if not args.resume and not (args.start and args.end):
+        parser.error("--start and --end are required")
+
+    try:
+        summary = run_backfill(args.sensors, args.locations, args.start, args.end, chunk_days=args.chunk_days, concurrency=args.concurrency,
+                              backfill_id=args.resume or args.backfill_id, resume=bool(args.resume))
+    except ValueError as e:
+        parser.error(str(e))
+
+    # A non-zero exit leaves the unfinished chunks for the next run, e.g. a scheduler retry.
+    if any(status != DONE for status in summary["chunks"]):
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,45 @@
+import argparse
+from datetime import date
+import logging
+from pathlib import Path
+import time
+from etl.config import init, load_env
+from db.db import get_engine
+from etl.lakehouse import export_measurements, LAKEHOUSE_DIR
+
+load_env()
+
+def run_export(since: date | None = None, until: date | None = None, root: Path = LAKEHOUSE_DIR) -> dict:
+    """
+    Exports the measurements added since the last export to the parquet lakehouse dataset, for analytical scans
+    that should not run against Postgres. See etl.lakehouse.export_measurements.
+
+    Args:
+        since (date | None): First day to export. Defaults to the first day with measurements.
+        until (date | None): Last day to export. Defaults to the last day with measurements.
+        root (Path): Root of the lakehouse dataset.
+
+    Returns:
+        summary (dict): Number of partitions and rows written.
+    """
+
+    start = time.perf_counter()
+    with get_engine().connect() as conn:
+        summary = export_measurements(conn, since, until, root)
+    logging.info(f"Exported {summary['rows']} measurements in {summary['partitions']} partitions to {root} in {time.perf_counter() - start:.2f}s.")
+
+    return summary
+
+def main():
+    init()
+
+    parser = argparse.ArgumentParser(description="Export measurements to the parquet lakehouse dataset, partitioned by date and parameter.")
+    parser.add_argument("--since", type=date.fromisoformat, help="First day to export, e.g. 2025-01-01.")
+    parser.add_argument("--until", type=date.fromisoformat, help="Last day to export, e.g. 2025-01-31.")
+    parser.add_argument("--root", type=Path, default=LAKEHOUSE_DIR, help="Root directory of the lakehouse dataset.")
+    args = parser.parse_args()
+
+    run_export(args.since, args.until, args.root)
+
+if __name__ == "__main__":
+    main()
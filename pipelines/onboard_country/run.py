@@ -0,0 +1,122 @@
+from __future__ import annotations
+import argparse
+import asyncio
+import logging
+from typing import TYPE_CHECKING
+from etl.ingestion.fetch_country import fetch_country
+from etl.ingestion.fetch_country_locations import iter_country_locations, LOCATIONS_PAGE_SIZE
+from etl.ingestion.fetch_location_sensors import fetch_location_sensors_data
+from etl.ingestion.fetch_many import fetch_concurrently, FETCH_CONCURRENCY
+from etl.ingestion.fetch_parameters import fetch_parameters
+from etl.transform.transform_country import transform_country
+from etl.transform.transform_location import transform_location_records
+from etl.transform.transform_location_sensors import transform_location_sensors_records
+from etl.transform.transform_parameters import transform_parameters
+from etl.load.load_country import load_country
+from etl.load.load_parameters import load_parameters
+from etl.load.upsert import upsert_dataframe
+from etl.config import init, load_env
+from db.db import get_db
+
+if TYPE_CHECKING:
+    import pyarrow as pa
+    from sqlalchemy.orm import Session
+
+load_env()
+
+async def _fetch_sensors(location_ids: list[int], concurrency: int) -> pa.Table:
+    import pyarrow as pa
+
+    tables = []
+
+    async for location_id, data in fetch_concurrently(fetch_location_sensors_data, location_ids, concurrency):
+        try:
+            tables.append(transform_location_sensors_records(data, location_id))
+        except ValueError:
+            logging.warning(f"No sensors found for location {location_id}.")
+
+    if not tables:
+        return pa.table({"id": pa.array([], pa.int64()), "location_id": pa.array([], pa.int64()), "parameter_id": pa.array([], pa.int64())})
+
+    return pa.concat_tables(tables)
+
+def _load_page(locations: pa.Table, sensors: pa.Table, db: Session):
+    engine = db.get_bind()
+
+    with engine.begin() as conn:
+        upsert_dataframe(conn, locations, "locations")
+        if len(sensors):
+            upsert_dataframe(conn, sensors, "sensors")
+
+def onboard_country(country_id: int, concurrency: int = FETCH_CONCURRENCY, page_size: int = LOCATIONS_PAGE_SIZE) -> dict:
+    """
+    Adds a country with all of its locations and their sensors.
+
+    Locations are paged through the OpenAQ locations endpoint, with the next page prefetched while the current one
+    is processed. For each page, the sensors of every location are fetched concurrently, then the page's locations
+    and sensors are upserted in one transaction, so a failing page never leaves locations without their sensors
+    and re-running the onboarding is safe.
+
+    Args:
+        country_id (int): Country id as recognized by the OpenAQ API.
+        concurrency (int): Maximum number of sensor requests in flight.
+        page_size (int): Locations per page.
+
+    Returns:
+        counts (dict): Number of pages, locations and sensors onboarded.
+    """
+
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    from sqlalchemy import select
+    from sqlalchemy.exc import SQLAlchemyError
+    from db import models
+
+    counts = {"pages": 0, "locations": 0, "sensors": 0}
+    db = next(get_db())
+
+    try:
+        load_country(transform_country(fetch_country(country_id)), db)
+        load_parameters(transform_parameters(fetch_parameters()), db)
+        parameter_ids = set(db.scalars(select(models.Parameter.id)))
+
+        for page, data in enumerate(iter_country_locations(country_id, limit=page_size), start=1):
+            locations = transform_location_records(data)
+            sensors = asyncio.run(_fetch_sensors(locations["id"].to_pylist(), concurrency))
+
+            known_parameters = pc.is_in(sensors["parameter_id"], value_set=pa.array(sorted(parameter_ids), pa.int64()))
+            if not pc.all(known_parameters).as_py():
+                unknown_sensors = sensors.filter(pc.invert(known_parameters))
+                logging.warning(f"Skipping {len(unknown_sensors)} sensors with unknown parameters {sorted(pc.unique(unknown_sensors['parameter_id']).to_pylist())}.")
+                sensors = sensors.filter(known_parameters)
+
+            try:
+                _load_page(locations, sensors, db)
+                counts["pages"] += 1
+                counts["locations"] += len(locations)
+                counts["sensors"] += len(sensors)
+                logging.info(f"Onboarded page {page}: {len(locations)} locations and {len(sensors)} sensors.")
+            except SQLAlchemyError as e:
+                logging.error(f"Error while inserting page {page} of locations for country {country_id}: {e}. Skipping page.")
+    except Exception:
+        logging.exception(f"Error while onboarding country {country_id}. Discontinuing.")
+    finally:
+        db.close()
+
+    logging.info(f"Onboarded {counts['locations']} locations and {counts['sensors']} sensors for country {country_id}.")
+
+    return counts
+
+def main():
+    init()
+
+    parser = argparse.ArgumentParser(description="Add a country with all of its locations and sensors.")
+    parser.add_argument("--country", required=True, type=int, help="Country id as recognized by the OpenAQ API.")
+    parser.add_argument("--concurrency", type=int, default=FETCH_CONCURRENCY, help="Maximum number of sensor requests in flight.")
+    parser.add_argument("--page-size", type=int, default=LOCATIONS_PAGE_SIZE, help="Locations per page, and per transaction.")
+    args = parser.parse_args()
+
+    onboard_country(args.country, concurrency=args.concurrency, page_size=args.page_size)
+
+if __name__ == "__main__":
+    main()
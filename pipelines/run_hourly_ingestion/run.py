@@ -1,48 +1,384 @@
+from __future__ import annotations
+import argparse
+import asyncio
+import json
+from datetime import datetime
+from functools import partial
 import logging
 import os
-from sqlalchemy import select
-from etl.ingestion.fetch_location_latest import fetch_location_latest
-from etl.transform.transform_location_latest import transform_location_latest
-from etl.load.load_location_latest import load_location_latest
-from dotenv import load_dotenv
+import sys
+from pathlib import Path
+from typing import TYPE_CHECKING, Callable
+from etl.ingestion.fetch_location_latest import fetch_locations_latest_many, fetch_location_latest_data
+from etl.ingestion.fetch_many import fetch_concurrently, FETCH_CONCURRENCY
+from etl.ingestion.raw_archive import RawArchiver, SegmentArchive, RAW_ARCHIVE_FORMAT
+from etl.transform.transform_location_latest import transform_location_latest, transform_location_latest_records, write_measurements_dataset, EmptyPayloadError
+from etl.load.load_location_latest import load_location_latest, load_measurements, load_measurements_dataset
+from etl.metrics import merge_summaries, metrics, shard_filename, shard_summary_dir, METRICS_DIR
+from etl.config import init, load_env
+from db.checkpoints import finish_run, mark_locations, pending_locations, prune_runs, run_exists, start_run, DONE, EMPTY, FAILED, INCOMPLETE, SKIPPED, SUCCEEDED
 from db.db import get_db
-from db import models
+from db.dimensions import get_dimensions
+from db.unit_of_work import UnitOfWork, UOW_COMMIT_EVERY
 
-load_dotenv()
+if TYPE_CHECKING:
+    import pyarrow as pa
+    from sqlalchemy import Connection
+    from sqlalchemy.orm import Session
 
-logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s: %(message)s")
+load_env()
 
-def run_ingestion():
-    logging.info("Ingesting hourly location measurements.")
+LOAD_BATCH_SIZE = int(os.getenv("LOAD_BATCH_SIZE", "200"))
+# Attempts of a run after which a location that keeps failing is skipped. The DAG retries a run once, so its retry can succeed.
+INGESTION_MAX_ATTEMPTS = int(os.getenv("INGESTION_MAX_ATTEMPTS", "2"))
+# Days the per-location checkpoints of succeeded runs are kept.
+CHECKPOINT_RETENTION_DAYS = float(os.getenv("CHECKPOINT_RETENTION_DAYS", "7"))
+MODES = ("files", "stream", "batch")
+
+def parse_shard(spec: str) -> tuple[int, int]:
+    """
+    Parses a shard spec 'i/N' into (i, N), with 0 <= i < N.
+
+    Raises:
+        argparse.ArgumentTypeError: If spec is not a valid shard spec.
+    """
+
+    try:
+        index, count = (int(part) for part in spec.split("/"))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"Expected a shard spec like 0/4. Got {spec}")
+    if count < 1 or not 0 <= index < count:
+        raise argparse.ArgumentTypeError(f"Expected shard index between 0 and {count - 1}. Got {spec}")
+
+    return index, count
+
+def shard_location_ids(location_ids: list[int], shard: tuple[int, int]) -> list[int]:
+    """
+    Returns the locations that belong to a shard.
+
+    Locations are assigned by id modulo the number of shards, so as long as the number of shards is unchanged
+    a location is always ingested by the same shard.
+
+    Args:
+        location_ids (list[int]): All location ids.
+        shard (tuple[int, int]): (index, count) as returned by parse_shard.
+
+    Returns:
+        location_ids (list[int]): Ids of the locations in the shard.
+    """
+
+    index, count = shard
+    return [location_id for location_id in location_ids if location_id % count == index]
+
+def _checkpoint(uow: UnitOfWork, run_id: str, location_ids: list[int], status: str, conn: Connection | None = None):
+    # Checkpoints commit together with the loads they describe, in the run's unit of work. Given conn, a location is
+    # marked inside the savepoint that loaded it, so it is never recorded as done without its measurements.
+    if conn is not None:
+        mark_locations(conn, run_id, location_ids, status)
+        return
+    try:
+        with uow.savepoint(f"checkpoint of locations {location_ids}", units=0) as conn:
+            mark_locations(conn, run_id, location_ids, status)
+    except Exception as e:
+        logging.error(f"Error while checkpointing locations {location_ids} as {status}: {e}.")
+
+def _fetch_failed(checkpoint: Callable, location_id: int, error: Exception):
+    import requests
+
+    # A 4xx other than throttling, e.g. the 404 of a retired station, fails the same way on every retry.
+    response = getattr(error, "response", None)
+    if isinstance(error, requests.HTTPError) and response is not None and 400 <= response.status_code < 500 and response.status_code != 429:
+        logging.warning(f"Location {location_id} returned {response.status_code}. Skipping it for this run.")
+        checkpoint([location_id], SKIPPED)
+    else:
+        checkpoint([location_id], FAILED)
+
+def _transform_failed(checkpoint: Callable, location_id: int, error: Exception):
+    if isinstance(error, EmptyPayloadError):
+        logging.info(f"No measurements for location {location_id}.")
+        metrics.inc("locations_empty")
+        checkpoint([location_id], EMPTY)
+        return
+    logging.error(f"Error while transforming json data for location {location_id}: {error}. Skipping location.")
+    metrics.inc("failures", stage="transform")
+    checkpoint([location_id], FAILED)
+
+def _load_one_by_one(batch: dict[int, pa.Table], db: Session, uow: UnitOfWork, checkpoint: Callable):
+    # Fallback for a batch that failed as a whole: each location in its own savepoint, so only the bad ones are skipped.
+    for location_id, table in batch.items():
+        try:
+            with uow.savepoint(f"location {location_id}") as conn:
+                load_measurements(table, db, conn=conn)
+                checkpoint([location_id], DONE, conn=conn)
+        except Exception as e:
+            logging.error(f"Error while inserting into database data for location {location_id}: {e}. Skipping location.")
+            metrics.inc("failures", stage="load")
+            checkpoint([location_id], FAILED)
+
+def _load_batch(batch: dict[int, pa.Table], db: Session, uow: UnitOfWork, checkpoint: Callable):
+    import pyarrow as pa
+
+    location_ids = list(batch)
+    try:
+        with uow.savepoint(f"batch of {len(location_ids)} locations", units=len(location_ids)) as conn:
+            load_measurements(pa.concat_tables(batch.values()), db, conn=conn)
+            checkpoint(location_ids, DONE, conn=conn)
+        logging.info(f"Succesfully updated measurements for {len(location_ids)} locations.")
+    except Exception as e:
+        logging.warning(f"Error while inserting into database data for locations {location_ids}: {e}. Retrying locations one at a time.")
+        _load_one_by_one(batch, db, uow, checkpoint)
+
+def _write_and_load_batch(batch: dict[int, pa.Table], db: Session, uow: UnitOfWork, run_time: datetime, checkpoint: Callable):
+    location_ids = list(batch)
+    try:
+        part_filepath = write_measurements_dataset(batch.values(), run_time)
+    except Exception as e:
+        logging.error(f"Error while writing parquet data for locations {location_ids}: {e}. Skipping locations.")
+        metrics.inc("failures", len(location_ids), stage="transform")
+        checkpoint(location_ids, FAILED)
+        return
+    try:
+        with uow.savepoint(f"batch of {len(location_ids)} locations", units=len(location_ids)) as conn:
+            load_measurements_dataset(part_filepath, db, conn=conn)
+            checkpoint(location_ids, DONE, conn=conn)
+        logging.info(f"Succesfully updated measurements for {len(location_ids)} locations.")
+    except Exception as e:
+        logging.warning(f"Error while inserting into database data for locations {location_ids}: {e}. Retrying locations one at a time.")
+        _load_one_by_one(batch, db, uow, checkpoint)
+
+async def _stream_ingestion(location_ids: list[int], concurrency: int, batch_size: int, archiver: RawArchiver | None, sink: Callable, checkpoint: Callable):
+    batch = {}
+
+    async for location_id, data in fetch_concurrently(fetch_location_latest_data, location_ids, concurrency, on_error=partial(_fetch_failed, checkpoint)):
+        if archiver is not None:
+            archiver.submit("location_latest", location_id, data)
+        try:
+            batch[location_id] = transform_location_latest_records(data)
+        except Exception as e:
+            _transform_failed(checkpoint, location_id, e)
+            continue
+
+        if len(batch) >= batch_size:
+            # Loading runs on a worker thread so in-flight fetches keep going meanwhile.
+            await asyncio.to_thread(sink, batch)
+            batch = {}
+
+    if batch:
+        await asyncio.to_thread(sink, batch)
+
+def _file_ingestion(location_ids: list[int], db: Session, uow: UnitOfWork, concurrency: int, archive: SegmentArchive | None, checkpoint: Callable):
+    raw_filepaths = fetch_locations_latest_many(location_ids, concurrency=concurrency, archive=archive, on_error=partial(_fetch_failed, checkpoint))
+
+    for location_id, raw_filepath in raw_filepaths.items():
+        try:
+            clean_filepath = transform_location_latest(raw_filepath)
+        except Exception as e:
+            _transform_failed(checkpoint, location_id, e)
+            continue
+        try:
+            with uow.savepoint(f"location {location_id}") as conn:
+                load_location_latest(clean_filepath, db, conn=conn)
+                checkpoint([location_id], DONE, conn=conn)
+        except Exception as e:
+            logging.error(f"Error while inserting into database data for location {location_id}: {e}. Skipping location.")
+            metrics.inc("failures", stage="load")
+            checkpoint([location_id], FAILED)
+
+def run_ingestion(concurrency: int = FETCH_CONCURRENCY, mode: str = "files", batch_size: int = LOAD_BATCH_SIZE, archive_raw: bool = False,
+                  shard: tuple[int, int] | None = None, run_id: str | None = None, resume: bool = False, commit_every: int = UOW_COMMIT_EVERY,
+                  max_attempts: int = INGESTION_MAX_ATTEMPTS) -> dict:
+    """
+    Fetches, transforms and loads the latest measurements for every known location, or for one shard of them.
+
+    Progress is checkpointed per location in the ingestion_runs and ingestion_run_locations tables, and the checkpoints
+    of succeeded runs older than CHECKPOINT_RETENTION_DAYS are pruned at the end of every run. Running again with
+    the same run_id, e.g. on a retry, only ingests the locations that failed or never started. Locations without
+    measurements are recorded as empty, and locations that answer 4xx, or are still failing after max_attempts
+    attempts, as skipped; both count as finished, so an offline or retired station does not keep the run incomplete.
+
+    Loads run on one connection through a db.unit_of_work.UnitOfWork: each location, or batch of locations, in a
+    savepoint that also marks it done, and a commit every commit_every locations. A location that fails to load is
+    rolled back alone; in 'stream' and 'batch' modes a failing batch is retried one location at a time.
+
+    Stage timings, HTTP status counts, bytes downloaded and rows written or skipped are collected in etl.metrics
+    and written at the end of the run as a Prometheus textfile and a json run summary under METRICS_DIR.
+
+    Args:
+        concurrency (int): Maximum number of OpenAQ requests in flight. 1 fetches locations one at a time.
+        mode (str): 'files' writes raw json and clean parquet per location, 'stream' passes records from fetch to load in memory,
+            'batch' does the same but writes each batch as one part of the partitioned measurements dataset and loads it from there.
+        batch_size (int): Number of locations per load in 'stream' and 'batch' modes.
+        archive_raw (bool): In 'stream' and 'batch' modes, also save raw payloads to disk on a background thread. In 'files' mode,
+            with RAW_ARCHIVE_FORMAT 'segments', fetch raw payloads into the segment archive instead of loose json files.
+        shard (tuple[int, int] | None): (index, count) to only ingest the locations of one shard, see shard_location_ids.
+            Each shard writes its own metrics, which aggregate_shards combines once every shard has run.
+        run_id (str | None): Identifier of the run, shared by all shards of a sharded run. Defaults to the current UTC time.
+        resume (bool): Only retry the unfinished locations of the existing run run_id, without adding locations
+            created since it started.
+        commit_every (int): Locations loaded per commit.
+        max_attempts (int): Attempts of the run after which an unfinished location is skipped.
+
+    Raises:
+        ValueError: If mode is not one of MODES, or resume is set and run_id has no checkpoint.
+
+    Returns:
+        summary (dict): The run summary, as written to METRICS_DIR/runs/{run_id}.json, with the run's status:
+            'succeeded', or 'incomplete' if locations are left for a retry.
+    """
+
+    if mode not in MODES:
+        raise ValueError(f"Expected mode to be one of {MODES}. Got {mode}")
+    if resume and not run_id:
+        raise ValueError("Expected a run_id to resume.")
+
+    run_id = run_id or datetime.utcnow().strftime("%Y-%m-%dT%H%M%SZ")
+    shard_spec = f"{shard[0]}/{shard[1]}" if shard else None
+    checkpoint_shard = shard_spec or "0/1"
+    metrics.reset()
+    logging.info(f"Ingesting hourly location measurements in {mode} mode. Run {run_id}" + (f", shard {shard_spec}." if shard else "."))
 
     db = next(get_db())
+    engine = db.get_bind()
+
+    if resume:
+        with engine.connect() as conn:
+            if not run_exists(conn, run_id, checkpoint_shard):
+                db.close()
+                raise ValueError(f"No checkpoint found for run {run_id}, shard {checkpoint_shard}.")
 
+    status = None
     try:
-        locations = db.scalars(select(models.Location)).all()
-        logging.info(f"Found {len(locations)} locations to fetch.")
-
-        for location in locations:
-            location_id = location.id
-
-            raw_filepath = fetch_location_latest(location_id)
-            try:
-                clean_filepath = transform_location_latest(raw_filepath)
-            except Exception as e:
-                logging.error(f"Error while transforming json data for location {location_id}. Skipping location.")
-                continue
-            try:
-                load_location_latest(clean_filepath, db)
-            except Exception as e:
-                logging.error(f"Error while inserting into database data for location {location_id}. Skipping location.")
-                continue
+        with engine.begin() as conn:
+            if resume:
+                location_ids = pending_locations(conn, run_id, checkpoint_shard)
+            else:
+                location_ids = get_dimensions(engine).location_ids
+                if shard:
+                    location_ids = shard_location_ids(location_ids, shard)
+            remaining_ids = start_run(conn, run_id, checkpoint_shard, mode, location_ids)
+
+        if len(remaining_ids) < len(location_ids):
+            logging.info(f"Skipping {len(location_ids) - len(remaining_ids)} locations already finished in run {run_id}.")
+            metrics.inc("locations_checkpointed", len(location_ids) - len(remaining_ids))
+        location_ids = remaining_ids
+        logging.info(f"Found {len(location_ids)} locations to fetch.")
+        metrics.inc("locations", len(location_ids))
+
+        with UnitOfWork(engine, commit_every) as uow:
+            checkpoint = partial(_checkpoint, uow, run_id)
+
+            if mode in ("stream", "batch"):
+                if mode == "stream":
+                    sink = partial(_load_batch, db=db, uow=uow, checkpoint=checkpoint)
+                else:
+                    sink = partial(_write_and_load_batch, db=db, uow=uow, run_time=datetime.utcnow(), checkpoint=checkpoint)
+
+                archiver = RawArchiver() if archive_raw else None
+                try:
+                    asyncio.run(_stream_ingestion(location_ids, concurrency, batch_size, archiver, sink, checkpoint))
+                finally:
+                    if archiver is not None:
+                        archiver.close()
+            else:
+                archive = SegmentArchive() if archive_raw and RAW_ARCHIVE_FORMAT == "segments" else None
+                _file_ingestion(location_ids, db, uow, concurrency, archive, checkpoint)
     except Exception as e:
         logging.exception(f"Unexpected error during hourly ingestion. Discontinuing.")
     finally:
+        try:
+            with engine.begin() as conn:
+                status = finish_run(conn, run_id, checkpoint_shard, max_attempts)
+            logging.info(f"Run {run_id}, shard {checkpoint_shard} finished as {status}.")
+        except Exception as e:
+            logging.error(f"Error while checkpointing the end of run {run_id}: {e}.")
+        try:
+            with engine.begin() as conn:
+                pruned = prune_runs(conn, CHECKPOINT_RETENTION_DAYS)
+            if pruned:
+                logging.info(f"Pruned the checkpoints of {pruned} succeeded runs older than {CHECKPOINT_RETENTION_DAYS} days.")
+        except Exception as e:
+            logging.error(f"Error while pruning old run checkpoints: {e}.")
         db.close()
 
+    prometheus_filepath, summary_filepath = metrics.write(run_id, mode=mode, shard=shard_spec, status=status)
+    logging.info(f"Wrote run metrics to {prometheus_filepath} and {summary_filepath}.")
+
+    if shard:
+        return metrics.summary(run_id=run_id, mode=mode, shard=shard_spec, status=status)
+    return metrics.summary(run_id=run_id, mode=mode, status=status)
+
+def aggregate_shards(run_id: str, shard_count: int, metrics_dir: Path = METRICS_DIR) -> dict:
+    """
+    Combines the run summaries written by the shards of a sharded run into one run summary.
+
+    Shards that wrote no summary, e.g. because their task failed, are listed under missing_shards.
+
+    Args:
+        run_id (str): Identifier shared by all shards of the run.
+        shard_count (int): Number of shards the run was split into.
+        metrics_dir (Path): Directory the shards wrote their metrics to.
+
+    Returns:
+        summary (dict): The combined summary, as written to METRICS_DIR/runs/{run_id}.json.
+    """
+
+    summaries = []
+    missing_shards = []
+
+    for index in range(shard_count):
+        summary_filepath = shard_summary_dir(run_id, metrics_dir) / f"{shard_filename(f'{index}/{shard_count}')}.json"
+        try:
+            summaries.append(json.loads(summary_filepath.read_text()))
+        except FileNotFoundError:
+            logging.warning(f"No run summary found for shard {index}/{shard_count} of run {run_id}.")
+            missing_shards.append(index)
+
+    modes = sorted({summary.get("mode") for summary in summaries if summary.get("mode")})
+    status = SUCCEEDED if not missing_shards and all(summary.get("status") == SUCCEEDED for summary in summaries) else INCOMPLETE
+    summary = merge_summaries(summaries, run_id=run_id, mode=",".join(modes) or None, status=status, shards=shard_count, missing_shards=missing_shards)
+
+    summary_filepath = metrics_dir / "runs" / f"{run_id}.json"
+    summary_filepath.parent.mkdir(parents=True, exist_ok=True)
+    summary_filepath.write_text(json.dumps(summary, indent=2))
+    logging.info(f"Aggregated {len(summaries)} of {shard_count} shard summaries of run {run_id} into {summary_filepath}.")
+
+    return summary
+
 def main():
-    run_ingestion()
+    init()
+
+    parser = argparse.ArgumentParser(description="Ingest the latest measurements for all locations.")
+    parser.add_argument("--concurrency", type=int, default=FETCH_CONCURRENCY, help="Maximum number of OpenAQ requests in flight.")
+    parser.add_argument("--mode", choices=MODES, default="files", help="'files' round-trips every location through raw json and clean parquet, 'stream' keeps records in memory, 'batch' writes one partitioned parquet part per batch.")
+    parser.add_argument("--batch-size", type=int, default=LOAD_BATCH_SIZE, help="Locations per load in stream and batch modes.")
+    parser.add_argument("--archive-raw", action="store_true", help="Save raw payloads in the background in stream and batch modes, and to the segment archive instead of loose files in files mode.")
+    parser.add_argument("--shard", type=parse_shard, help="Only ingest shard i of N, as i/N with 0 <= i < N. Locations are split by id.")
+    parser.add_argument("--run-id", help="Identifier of the run, shared by all of its shards. Rerunning a run id only ingests its unfinished locations. Defaults to the current UTC time.")
+    parser.add_argument("--resume", metavar="RUN_ID", help="Retry only the failed and unstarted locations of an earlier run.")
+    parser.add_argument("--commit-every", type=int, default=UOW_COMMIT_EVERY, help="Locations loaded per database commit.")
+    parser.add_argument("--max-attempts", type=int, default=INGESTION_MAX_ATTEMPTS, help="Attempts of a run after which a location that keeps failing is skipped.")
+    parser.add_argument("--aggregate-shards", type=int, metavar="N", help="Instead of ingesting, combine the summaries of the N shards of --run-id.")
+    args = parser.parse_args()
+
+    if args.aggregate_shards:
+        if not args.run_id:
+            parser.error("--aggregate-shards requires --run-id.")
+        aggregate_shards(args.run_id, args.aggregate_shards)
+        return
+
+    if args.resume and args.run_id and args.resume != args.run_id:
+        parser.error("--resume and --run-id name different runs.")
+
+    try:
+        summary = run_ingestion(concurrency=args.concurrency, mode=args.mode, batch_size=args.batch_size, archive_raw=args.archive_raw,
+                                shard=args.shard, run_id=args.resume or args.run_id, resume=bool(args.resume), commit_every=args.commit_every,
+                                max_attempts=args.max_attempts)
+    except ValueError as e:
+        parser.error(str(e))
+
+    # A non-zero exit lets the scheduler retry the run, which then only redoes the unfinished locations.
+    if summary.get("status") != SUCCEEDED:
+        sys.exit(1)
 
 if __name__ == "__main__":
     main()
-
@@ -0,0 +1,5 @@
+import os
+import tempfile
+
+# Modules read DATA_DIR into constants at import time, so it has to be set before any test imports them.
+os.environ.setdefault("DATA_DIR", tempfile.mkdtemp(prefix="airq-tests-"))
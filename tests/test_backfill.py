@@ -0,0 +1,58 @@
+import asyncio
+from datetime import datetime, timedelta
+import pytest
+from db.checkpoints import DONE, FAILED
+from pipelines.backfill import run
+from pipelines.backfill.run import split_chunks
+
+def test_split_chunks_covers_the_range():
+    start = datetime(2025, 1, 1)
+    end = datetime(2025, 1, 20, 6)
+
+    chunks = split_chunks(start, end, timedelta(days=7))
+
+    assert chunks == [
+        (datetime(2025, 1, 1), datetime(2025, 1, 8)),
+        (datetime(2025, 1, 8), datetime(2025, 1, 15)),
+        (datetime(2025, 1, 15), datetime(2025, 1, 20, 6)),
+        ]
+
+def test_split_chunks_exact_multiple():
+    start = datetime(2025, 1, 1)
+
+    chunks = split_chunks(start, start + timedelta(days=2), timedelta(days=1))
+
+    assert chunks == [(start, start + timedelta(days=1)), (start + timedelta(days=1), start + timedelta(days=2))]
+
+def test_split_chunks_shorter_than_a_chunk():
+    start = datetime(2025, 1, 1)
+
+    assert split_chunks(start, start + timedelta(hours=1), timedelta(days=7)) == [(start, start + timedelta(hours=1))]
+
+@pytest.mark.parametrize("start, end, chunk", [
+    (datetime(2025, 1, 2), datetime(2025, 1, 1), timedelta(days=1)),
+    (datetime(2025, 1, 1), datetime(2025, 1, 1), timedelta(days=1)),
+    (datetime(2025, 1, 1), datetime(2025, 1, 2), timedelta(0)),
+    (datetime(2025, 1, 1), datetime(2025, 1, 2), timedelta(days=-1)),
+    ])
+def test_split_chunks_rejects_empty_ranges_and_chunks(start, end, chunk):
+    with pytest.raises(ValueError):
+        split_chunks(start, end, chunk)
+
+def test_backfill_chunks_marks_failed_fetches(monkeypatch):
+    chunks = [(1, datetime(2025, 1, 1), datetime(2025, 1, 8)), (2, datetime(2025, 1, 1), datetime(2025, 1, 8))]
+    checkpoints = []
+
+    def fetch_chunk(chunk):
+        if chunk[0] == 2:
+            raise RuntimeError("boom")
+        return {"results": []}
+
+    monkeypatch.setattr(run, "_fetch_chunk", fetch_chunk)
+    monkeypatch.setattr(run, "_load_chunk", lambda chunk, data, db: 5)
+    monkeypatch.setattr(run, "_checkpoint", lambda db, backfill_id, chunk, status, rows_loaded=None: checkpoints.append((chunk[0], status, rows_loaded)))
+
+    loaded = asyncio.run(run._backfill_chunks("backfill", chunks, db=None, concurrency=2))
+
+    assert loaded == 5
+    assert sorted(checkpoints) == [(1, DONE, 5), (2, FAILED, None)]
@@ -0,0 +1,109 @@
+from datetime import datetime, timedelta
+import pyarrow as pa
+import pytest
+from sqlalchemy import text
+from db.db import get_db, get_engine
+from db.dimensions import get_dimensions
+from etl.load import load_location_latest
+from etl.load.load_location_latest import drop_seen_measurements, load_measurements, replay_orphans
+
+def measurements(rows: list[tuple[datetime, int, float]]) -> pa.Table:
+    return pa.table({
+        "datetime": pa.array([row[0] for row in rows], pa.timestamp("us")),
+        "sensor_id": pa.array([row[1] for row in rows], pa.int64()),
+        "value": pa.array([row[2] for row in rows], pa.float64()),
+        })
+
+def rows(table: pa.Table) -> set[tuple[datetime, int, float]]:
+    return set(zip(*(table[column].to_pylist() for column in table.column_names)))
+
+def test_drop_seen_measurements_without_watermarks_only_deduplicates():
+    table = measurements([
+        (datetime(2025, 1, 1, 0), 1, 1.0),
+        (datetime(2025, 1, 1, 0), 1, 2.0),
+        (datetime(2025, 1, 1, 1), 1, 3.0),
+        ])
+
+    result = drop_seen_measurements(table, {})
+
+    assert result.column_names == table.column_names
+    # The last row of a duplicated key wins.
+    assert rows(result) == {(datetime(2025, 1, 1, 0), 1, 2.0), (datetime(2025, 1, 1, 1), 1, 3.0)}
+
+def test_drop_seen_measurements_drops_rows_at_or_before_the_watermark():
+    table = measurements([
+        (datetime(2025, 1, 1, 0), 1, 1.0),
+        (datetime(2025, 1, 1, 1), 1, 2.0),
+        (datetime(2025, 1, 1, 2), 1, 3.0),
+        (datetime(2025, 1, 1, 0), 2, 4.0),
+        (datetime(2025, 1, 1, 0), 3, 5.0),
+        ])
+    watermarks = {1: datetime(2025, 1, 1, 1), 2: datetime(2025, 1, 1, 5)}
+
+    result = drop_seen_measurements(table, watermarks)
+
+    assert result.column_names == table.column_names
+    # Sensor 3 has no watermark yet, so all its rows are new.
+    assert rows(result) == {(datetime(2025, 1, 1, 2), 1, 3.0), (datetime(2025, 1, 1, 0), 3, 5.0)}
+
+def test_drop_seen_measurements_keeps_nothing_when_everything_was_seen():
+    table = measurements([(datetime(2025, 1, 1, 0), 1, 1.0)])
+
+    result = drop_seen_measurements(table, {1: datetime(2025, 1, 1, 0)})
+
+    assert len(result) == 0
+    assert result.schema == table.schema
+
+@pytest.fixture
+def engine():
+    try:
+        engine = get_engine()
+        with engine.connect() as conn:
+            conn.execute(text("SELECT 1 FROM measurements LIMIT 0"))
+    except Exception as e:
+        pytest.skip(f"No airq database to test against: {e}")
+    return engine
+
+@pytest.fixture
+def unknown_sensor(engine):
+    sensor_id = 990001
+    with engine.begin() as conn:
+        conn.execute(text("INSERT INTO countries (id, name) VALUES (990001, 'test') ON CONFLICT DO NOTHING"))
+        conn.execute(text("INSERT INTO parameters (id, units, name) VALUES (990001, 'ug', 'test') ON CONFLICT DO NOTHING"))
+        conn.execute(text("INSERT INTO locations (id, name, latitude, longitude, country_id) VALUES (990001, 'test', 1.0, 2.0, 990001) ON CONFLICT DO NOTHING"))
+    yield sensor_id
+    with engine.begin() as conn:
+        for table in ("latest_measurements", "measurements_hourly", "measurements_daily", "measurements", "sensor_watermarks", "sensors"):
+            column = "id" if table == "sensors" else "sensor_id"
+            conn.execute(text(f"DELETE FROM {table} WHERE {column} = :sensor_id"), {"sensor_id": sensor_id})
+        conn.execute(text("DELETE FROM locations WHERE id = 990001"))
+        conn.execute(text("DELETE FROM parameters WHERE id = 990001"))
+        conn.execute(text("DELETE FROM countries WHERE id = 990001"))
+    get_dimensions(engine).invalidate()
+
+def test_replay_orphans_loads_rows_older_than_the_watermark(engine, unknown_sensor, tmp_path, monkeypatch):
+    monkeypatch.setattr(load_location_latest, "ORPHANS_DIR", tmp_path)
+    db = next(get_db())
+    now = datetime.utcnow().replace(minute=0, second=0, microsecond=0)
+    queued = [(now - timedelta(hours=3), unknown_sensor, 1.0), (now - timedelta(hours=2), unknown_sensor, 2.0)]
+
+    try:
+        assert load_measurements(measurements(queued), db) == 0
+        assert len(list(tmp_path.glob("measurements_*.parquet"))) == 1
+
+        with engine.begin() as conn:
+            conn.execute(text("INSERT INTO sensors (id, name, location_id, parameter_id) VALUES (:sensor_id, 'test', 990001, 990001)"), {"sensor_id": unknown_sensor})
+        get_dimensions(engine).invalidate()
+        # The next hourly run loads a newer reading, which moves the watermark past the queued rows.
+        assert load_measurements(measurements([(now, unknown_sensor, 3.0)]), db) == 1
+
+        assert replay_orphans(db) == 2
+    finally:
+        db.close()
+
+    with engine.connect() as conn:
+        loaded = conn.execute(text("SELECT datetime, value FROM measurements WHERE sensor_id = :sensor_id ORDER BY datetime"), {"sensor_id": unknown_sensor}).all()
+        watermark = conn.execute(text("SELECT last_datetime FROM sensor_watermarks WHERE sensor_id = :sensor_id"), {"sensor_id": unknown_sensor}).scalar()
+    assert [tuple(row) for row in loaded] == [(queued[0][0], 1.0), (queued[1][0], 2.0), (now, 3.0)]
+    assert watermark == now
+    assert not list(tmp_path.glob("measurements_*.parquet"))
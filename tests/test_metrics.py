@@ -0,0 +1,44 @@
+import pytest
+from etl.metrics import merge_summaries
+
+def shard_summary(started_at: str, duration_seconds: float, fetch_seconds: float, locations: int) -> dict:
+    return {
+        "started_at": started_at,
+        "duration_seconds": duration_seconds,
+        "stages": {
+            "fetch": {"seconds": fetch_seconds, "calls": 2, "steps": {"request": {"seconds": fetch_seconds, "calls": 2}}},
+            },
+        "counters": {"locations": {"status=done": locations}},
+        }
+
+def test_merge_summaries_sums_stages_and_counters():
+    summaries = [
+        shard_summary("2025-01-01T00:00:00Z", 10.0, 1.5, 3),
+        shard_summary("2025-01-01T00:00:05Z", 20.0, 2.25, 4),
+        ]
+    summaries[1]["stages"]["load"] = {"seconds": 1.0, "calls": 1, "steps": {"copy": {"seconds": 1.0, "calls": 1}}}
+    summaries[1]["counters"]["locations"]["status=failed"] = 1
+
+    merged = merge_summaries(summaries, run_id="run", shards=2)
+
+    assert merged["run_id"] == "run"
+    assert merged["shards"] == 2
+    assert merged["stages"] == {
+        "fetch": {"seconds": 3.75, "calls": 4, "steps": {"request": {"seconds": 3.75, "calls": 4}}},
+        "load": {"seconds": 1.0, "calls": 1, "steps": {"copy": {"seconds": 1.0, "calls": 1}}},
+        }
+    assert merged["counters"] == {"locations": {"status=done": 7, "status=failed": 1}}
+
+def test_merge_summaries_spans_the_earliest_start_to_the_last_finish():
+    summaries = [
+        shard_summary("2025-01-01T00:00:05Z", 20.0, 1.0, 1),
+        shard_summary("2025-01-01T00:00:00Z", 10.0, 1.0, 1),
+        ]
+
+    merged = merge_summaries(summaries)
+
+    assert merged["started_at"] == "2025-01-01T00:00:00Z"
+    assert merged["duration_seconds"] == pytest.approx(25.0)
+
+def test_merge_summaries_of_no_shards():
+    assert merge_summaries([]) == {"started_at": None, "duration_seconds": 0.0, "stages": {}, "counters": {}}
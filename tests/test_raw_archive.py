@@ -0,0 +1,30 @@
+from datetime import datetime
+import json
+import pyarrow.parquet as pq
+from etl.ingestion.raw_archive import ArchivedPayload, SegmentArchive, read_raw
+from etl.transform.transform_location_latest import transform_location_latest
+
+LATEST = {"results": [
+    {"datetime": {"utc": "2025-01-01T00:00:00Z", "local": "2025-01-01T01:00:00+01:00"}, "value": 12.5,
+     "coordinates": {"latitude": 1.0, "longitude": 2.0}, "sensorsId": 100, "locationsId": 10},
+    ]}
+
+def test_append_returns_a_readable_payload(tmp_path):
+    archive = SegmentArchive(tmp_path)
+    fetched_at = datetime(2025, 1, 1, 5, 30)
+
+    archive.append("location_latest", 9, {"results": []}, fetched_at)
+    payload = archive.append("location_latest", 10, json.dumps(LATEST).encode(), fetched_at)
+
+    assert payload == ArchivedPayload(tmp_path, "location_latest", "10", fetched_at)
+    assert payload.segment_path == tmp_path / "location_latest" / "2025-01-01" / "05.ndjson.gz"
+    assert payload.name == "location_latest_10_2025-01-01T053000Z.json"
+    assert read_raw(payload) == LATEST
+
+def test_transform_reads_an_archived_payload(tmp_path):
+    payload = SegmentArchive(tmp_path).append("location_latest", 10, json.dumps(LATEST).encode())
+
+    table = pq.read_table(transform_location_latest(payload))
+
+    assert table["sensor_id"].to_pylist() == [100]
+    assert table["value"].to_pylist() == [12.5]
@@ -0,0 +1,16 @@
+import argparse
+import pytest
+from pipelines.run_hourly_ingestion.run import parse_shard
+
+@pytest.mark.parametrize("spec, expected", [
+    ("0/1", (0, 1)),
+    ("0/4", (0, 4)),
+    ("3/4", (3, 4)),
+    ])
+def test_parse_shard(spec, expected):
+    assert parse_shard(spec) == expected
+
+@pytest.mark.parametrize("spec", ["", "1", "a/b", "1/2/3", "4/4", "-1/4", "0/0", "0/-1"])
+def test_parse_shard_rejects_invalid_specs(spec):
+    with pytest.raises(argparse.ArgumentTypeError):
+        parse_shard(spec)
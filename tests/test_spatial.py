@@ -0,0 +1,156 @@
+import random
+import time
+import pytest
+from db.spatial import SpatialIndex, haversine_km
+
+def make_index(points: dict[int, tuple[float, float]], cell_degrees: float = 0.5) -> SpatialIndex:
+    index = SpatialIndex(engine=None, cell_degrees=cell_degrees, ttl=float("inf"))
+    for location_id, (latitude, longitude) in points.items():
+        index.add(location_id, latitude, longitude)
+    # The index is filled by hand, so mark it fresh to keep queries from refreshing it from the database.
+    index.loaded_at = time.monotonic()
+    return index
+
+def random_points(rng: random.Random, n: int) -> dict[int, tuple[float, float]]:
+    points = {}
+    for location_id in range(n):
+        kind = rng.random()
+        if kind < 0.15:
+            latitude, longitude = rng.uniform(85, 90) * rng.choice((-1, 1)), rng.uniform(-180, 180)
+        elif kind < 0.3:
+            latitude, longitude = rng.uniform(-60, 60), rng.choice((-1, 1)) * rng.uniform(175, 180)
+        else:
+            latitude, longitude = rng.uniform(-90, 90), rng.uniform(-180, 180)
+        points[location_id] = (latitude, longitude)
+    # Exact edge values.
+    points[n] = (90.0, 0.0)
+    points[n + 1] = (-90.0, 45.0)
+    points[n + 2] = (10.0, 180.0)
+    points[n + 3] = (-10.0, -180.0)
+    return points
+
+def brute_nearest(points: dict, latitude: float, longitude: float) -> list[tuple[int, float]]:
+    return sorted(((location_id, haversine_km(latitude, longitude, *point)) for location_id, point in points.items()), key=lambda item: item[1])
+
+def brute_bbox(points: dict, min_latitude: float, min_longitude: float, max_latitude: float, max_longitude: float) -> set[int]:
+    def inside_longitude(longitude: float) -> bool:
+        if max_longitude - min_longitude >= 360:
+            return True
+        low = (min_longitude + 180) % 360 - 180
+        high = (max_longitude + 180) % 360 - 180 if max_longitude != 180.0 else 180.0
+        # -180 and 180 are the same meridian.
+        candidates = (longitude, longitude - 360) if longitude == 180.0 else (longitude, longitude + 360) if longitude == -180.0 else (longitude,)
+        if low <= high:
+            return any(low <= candidate <= high for candidate in candidates)
+        return any(candidate >= low or candidate <= high for candidate in candidates)
+
+    return {location_id for location_id, (latitude, longitude) in points.items() if min_latitude <= latitude <= max_latitude and inside_longitude(longitude)}
+
+QUERIES = [
+    (0.0, 0.0),
+    (89.9, 10.0),
+    (-89.9, -170.0),
+    (90.0, 0.0),
+    (-90.0, 0.0),
+    (5.0, 179.9),
+    (-5.0, -179.9),
+    (0.0, 180.0),
+    (45.0, -180.0),
+    ]
+
+@pytest.fixture(scope="module")
+def points():
+    return random_points(random.Random(7), 2000)
+
+@pytest.fixture(scope="module")
+def queries():
+    rng = random.Random(11)
+    return QUERIES + [(rng.uniform(-90, 90), rng.uniform(-180, 180)) for _ in range(50)]
+
+def assert_same_nearest(found: list[tuple[int, float]], expected: list[tuple[int, float]]):
+    assert len(found) == len(expected)
+    for (_, found_km), (_, expected_km) in zip(found, expected):
+        assert found_km == pytest.approx(expected_km, abs=1e-6)
+    # Ties may come back in either order, so compare ids only where the distance is unique.
+    distances = [km for _, km in expected]
+    for (found_id, _), (expected_id, km) in zip(found, expected):
+        if distances.count(km) == 1:
+            assert found_id == expected_id
+
+@pytest.mark.parametrize("k", [1, 5, 25])
+def test_nearest_matches_brute_force(points, queries, k):
+    index = make_index(points)
+    # Rebuild so queries go through the KD-tree rather than the pending list.
+    index.tree = type(index.tree)(index.points)
+    index.pending, index.stale = set(), set()
+
+    for latitude, longitude in queries:
+        assert_same_nearest(index.nearest(latitude, longitude, k=k), brute_nearest(points, latitude, longitude)[:k])
+
+def test_nearest_with_max_km(points, queries):
+    index = make_index(points)
+
+    for latitude, longitude in queries:
+        expected = [item for item in brute_nearest(points, latitude, longitude)[:10] if item[1] <= 500]
+        assert_same_nearest(index.nearest(latitude, longitude, k=10, max_km=500), expected)
+
+def test_nearest_after_moves_and_removals(points, queries):
+    rng = random.Random(3)
+    points = dict(points)
+    index = make_index(points)
+    index.tree = type(index.tree)(index.points)
+    index.pending, index.stale = set(), set()
+
+    # Few enough changes to stay below the rebuild threshold, so moved, added and removed locations are
+    # served from the pending and stale sets.
+    for location_id in rng.sample(sorted(points), 50):
+        points[location_id] = (rng.uniform(-90, 90), rng.uniform(-180, 180))
+        index.add(location_id, *points[location_id])
+    for location_id in rng.sample(sorted(points), 50):
+        del points[location_id]
+        index.remove(location_id)
+    for location_id in range(10_000, 10_050):
+        points[location_id] = (rng.uniform(-90, 90), rng.uniform(-180, 180))
+        index.add(location_id, *points[location_id])
+    assert index.pending and index.stale
+
+    for latitude, longitude in queries:
+        assert_same_nearest(index.nearest(latitude, longitude, k=5), brute_nearest(points, latitude, longitude)[:5])
+
+@pytest.mark.parametrize("km", [1, 50, 400, 2500])
+def test_within_km_matches_brute_force(points, queries, km):
+    index = make_index(points)
+
+    for latitude, longitude in queries:
+        expected = [item for item in brute_nearest(points, latitude, longitude) if item[1] <= km]
+        found = index.within_km(latitude, longitude, km)
+        assert {location_id for location_id, _ in found} == {location_id for location_id, _ in expected}
+        assert [distance for _, distance in found] == sorted(distance for _, distance in found)
+
+@pytest.mark.parametrize("bbox", [
+    (-10, -10, 10, 10),
+    (40, 170, 60, 190),
+    (-30, 175, 30, -175),
+    (-30, 170, 30, 180),
+    (-30, -180, 30, -170),
+    (80, -180, 90, 180),
+    (-90, -20, -85, 20),
+    (-90, -180, 90, 180),
+    (0, -400, 10, 400),
+    ])
+def test_within_bbox_matches_brute_force(points, bbox):
+    index = make_index(points)
+
+    assert set(index.within_bbox(*bbox)) == brute_bbox(points, *bbox)
+
+@pytest.mark.parametrize("cell_degrees", [0.5, 7, 45])
+def test_within_bbox_random_boxes(points, cell_degrees):
+    rng = random.Random(5)
+    index = make_index(points, cell_degrees)
+
+    for _ in range(200):
+        min_latitude, max_latitude = sorted((rng.uniform(-90, 90), rng.uniform(-90, 90)))
+        min_longitude = rng.uniform(-180, 180)
+        max_longitude = min_longitude + rng.uniform(0, 90)
+        bbox = (min_latitude, min_longitude, max_latitude, max_longitude)
+        assert set(index.within_bbox(*bbox)) == brute_bbox(points, *bbox)